@@ -1,23 +1,124 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-import mlflow
-import mlflow.xgboost
-import joblib
 import pandas as pd
 import numpy as np
-from typing import Dict, Any
-import os
+from typing import Awaitable, Callable, Dict, Any, Iterable, List, Optional
+from datetime import datetime
+from functools import lru_cache
+import asyncio
+import hmac
+import time
+from starlette.concurrency import run_in_threadpool
 from src.utils.config import Config
-from src.features.engineering import FeatureEngineer
-from src.features.feature_store import FeatureStore
+from src.features.feature_store import FeatureStore, to_epoch_us
+from src.features.store_backends import create_feature_store
+from src.features.snapshots import SnapshotScheduler, restore_store
+from src.features.fast_path import parse_timestamp
+from src.utils.inference_log import InferenceLogWriter
+from src.utils.idempotency import IdempotencyConflict, create_result_cache, payload_fingerprint
+from src.utils.metrics import SCORE_BUCKETS, MetricsMiddleware, MetricsRegistry, StageTimer
+from src.utils.profiler import SamplingProfiler
+from src.models.bundle import InferenceBundle, export_from_mlflow, list_bundles, sync_from_mlflow
+from src.models.serving import ModelManager
+from src.models.batching import MicroBatcher, QueueFullError
+from src.models.shadow import ShadowScorer
+from src.models.explain import feature_contributions, top_contributions
 
 app = FastAPI(title="Fraud Detection API")
 config = Config()
 
-# Artifact cache
-model = None
-fe = None
-fs = FeatureStore(window_hours=24)
+# Active (model, preprocessor) pair, swapped atomically on reload
+models = ModelManager(
+    config.MODEL_BUNDLE_DIR,
+    poll_interval=config.MODEL_RELOAD_INTERVAL,
+    max_flip_rate=config.CANARY_MAX_FLIP_RATE,
+    sync=(lambda: sync_from_mlflow(config)) if config.MLFLOW_FALLBACK else None,
+    on_activate=lambda bundle: explain_row.cache_clear(),
+    compiled=config.COMPILED_SCORER
+)
+startup_timings: Dict[str, float] = {}
+fs = create_feature_store(config, window_hours=24)
+# Shared backends keep their own state; only the in-process store needs snapshots
+snapshots = (
+    SnapshotScheduler(fs, config.FEATURE_STORE_SNAPSHOT_PATH, config.FEATURE_STORE_SNAPSHOT_INTERVAL)
+    if isinstance(fs, FeatureStore) else None
+)
+log_writer = InferenceLogWriter(config.INFERENCE_LOG_DIR, fmt=config.INFERENCE_LOG_FORMAT,
+                                segment_max_age=config.INFERENCE_LOG_SEGMENT_MAX_AGE)
+profiler = SamplingProfiler()
+# Optional coalescing of single /predict requests into vectorized batches
+batcher = (
+    MicroBatcher(lambda records: score_coalesced(records), config.MICRO_BATCH_MAX_SIZE,  # Defined below
+                 config.MICRO_BATCH_MAX_WAIT_MS / 1000, config.MICRO_BATCH_MAX_QUEUE)
+    if config.MICRO_BATCH_ENABLED else None
+)
+# Challenger bundles scored in the background; the log writer is looked up at call time
+shadow = ShadowScorer(lambda records: log_writer.log_many(records), config.SHADOW_MAX_QUEUE, config.SHADOW_WORKERS)
+# Results of recent requests, replayed to retries without touching the feature store or the model;
+# kept in Redis alongside a Redis feature store so retries reaching another worker are recognized
+results = create_result_cache(config)
+
+def model_info() -> Dict[tuple, float]:
+    """Labels the active model version for the model info gauge."""
+    bundle = models.current
+    return {(bundle.version,): 1.0} if bundle is not None else {}
+
+def store_sizes() -> Dict[tuple, float]:
+    """Reads feature store occupancy at scrape time."""
+    if isinstance(fs, FeatureStore):  # stats() would walk every timestamp
+        return {("users",): len(fs.user_tx_history), ("events",): fs.n_events}
+    stats = fs.stats()
+    return {(key,): stats[key] for key in ("users", "events", "updates") if key in stats}
+
+def log_writer_stats() -> Dict[tuple, float]:
+    """Reads inference log writer counters at scrape time."""
+    stats = log_writer.stats()
+    return {(key,): stats[key] for key in ("queue_depth", "written", "dropped", "errors")}
+
+def result_cache_stats() -> Dict[tuple, float]:
+    """Reads result cache size, hit, miss and eviction counters at scrape time."""
+    return {(key,): value for key, value in results.stats().items()} if results is not None else {}
+
+def shadow_stats() -> Dict[tuple, float]:
+    """Reads shadow scoring queue depth and counters at scrape time."""
+    stats = shadow.stats()
+    return {(key,): stats[key] for key in ("queue_depth", "scored", "shed", "errors")}
+
+def challenger_stats() -> Dict[tuple, float]:
+    """Reads per-challenger scored and disagreement counts at scrape time."""
+    return {
+        (version, key): value
+        for version, agreement in shadow.stats()["agreement"].items() for key, value in agreement.items()
+    }
+
+metrics = MetricsRegistry()
+request_count = metrics.counter("fraud_api_requests_total", "HTTP requests by endpoint and status code.",
+                                ["endpoint", "status"])
+request_latency = metrics.histogram("fraud_api_request_duration_seconds",
+                                    "End-to-end request latency, including body parsing and validation.", ["endpoint"])
+stage_latency = metrics.histogram("fraud_api_stage_duration_seconds", "Latency of each scoring stage.",
+                                  ["endpoint", "stage"])
+prediction_count = metrics.counter("fraud_api_predictions_total", "Scored transactions by model version and label.",
+                                   ["model_version", "prediction"])
+score_distribution = metrics.histogram("fraud_api_fraud_probability", "Predicted fraud probabilities.",
+                                       ["model_version"], buckets=SCORE_BUCKETS)
+error_count = metrics.counter("fraud_api_errors_total", "Scoring failures by endpoint and exception type.",
+                              ["endpoint", "error"])
+coalesced_batch_size = metrics.histogram("fraud_api_coalesced_batch_size", "Requests scored per micro-batch.",
+                                         buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+metrics.gauge("fraud_model_info", "Active model version.", ["version"], callback=model_info)
+metrics.gauge("fraud_feature_store_size", "Feature store occupancy.", ["kind"], callback=store_sizes)
+metrics.gauge("fraud_inference_log", "Inference log writer queue depth and counters.", ["kind"],
+              callback=log_writer_stats)
+metrics.gauge("fraud_shadow_scoring", "Shadow scoring queue depth and scored, shed and failed records.", ["kind"],
+              callback=shadow_stats)
+metrics.gauge("fraud_shadow_challenger", "Records scored by each challenger and predictions disagreeing with the champion.",
+              ["version", "kind"], callback=challenger_stats)
+metrics.gauge("fraud_api_result_cache", "Idempotency result cache size, hits, misses, in-flight waits and evictions.",
+              ["kind"], callback=result_cache_stats)
+app.add_middleware(MetricsMiddleware, requests=request_count, latency=request_latency,
+                   paths=lambda: [route.path for route in app.routes])
 
 class Transaction(BaseModel):
     user_id: int
@@ -31,87 +132,532 @@ class Transaction(BaseModel):
     age: int
     ip_address: int
 
+class PinRequest(BaseModel):
+    version: str
+
+class ShadowRequest(BaseModel):
+    versions: List[str]
+
+def load_challengers(versions: List[str]) -> None:
+    """
+    Loads, warms and validates challenger bundles and makes them the shadow set.
+
+    Raises:
+        KeyError: If a version does not exist.
+        ValueError: If a bundle fails validation.
+    """
+    shadow.set_challengers([models.prepare(version, check_agreement=False) for version in versions])
+
 @app.on_event("startup")
 def load_artifacts() -> None:
-    """Loads model and feature engineering artifacts on API startup."""
-    global model, fe
+    """
+    Activates the newest valid local inference bundle and starts the reload watcher.
+
+    MLflow is only queried when no bundle exists and `MLFLOW_FALLBACK` is set.
+    Its result is exported as a bundle, so the next startup is local again.
+    """
+    start = time.perf_counter()
+    startup_timings.clear()
+    log_writer.start()
     try:
-        # Try to load from MLflow if tracking URI is reachable
-        mlflow.set_tracking_uri(config.MLFLOW_TRACKING_URI)
-        # For simplicity, we load the latest run from the experiment
-        experiment = mlflow.get_experiment_by_name(config.MLFLOW_EXPERIMENT_NAME)
-        if experiment:
-            runs = mlflow.search_runs(experiment_ids=[experiment.experiment_id], order_by=["start_time DESC"])
-            if not runs.empty:
-                latest_run_id = runs.iloc[0].run_id
-                model_uri = f"runs:/{latest_run_id}/model"
-                model = mlflow.xgboost.load_model(model_uri)
-                print(f"Loaded model from MLflow run: {latest_run_id}")
-        
-        # Load preprocessor
-        if os.path.exists("models/feature_engineer.joblib"):
-            fe = joblib.load("models/feature_engineer.joblib")
-            print("Loaded feature engineer from local storage")
+        if not list_bundles(config.MODEL_BUNDLE_DIR) and config.MLFLOW_FALLBACK:
+            fallback_start = time.perf_counter()
+            export_from_mlflow(config)
+            startup_timings["mlflow_fallback"] = time.perf_counter() - fallback_start
+
+        versions = sorted(list_bundles(config.MODEL_BUNDLE_DIR), reverse=True)
+        if not versions:
+            print(f"Warning: No inference bundle found in {config.MODEL_BUNDLE_DIR}")
+        for version in versions:
+            try:
+                bundle = models.activate(version, check_agreement=False)
+                startup_timings.update(bundle.timings)
+                break
+            except (ValueError, OSError) as e:
+                models.rejected[version] = str(e)
+                print(f"Warning: Skipping inference bundle {version}: {e}")
     except Exception as e:
-        print(f"Warning: Could not load artifacts from MLflow: {e}")
-        # Fallback logic could go here
+        print(f"Warning: Could not load inference bundle: {e}")
+
+    if snapshots is not None:
+        try:
+            restored = restore_store(snapshots.store, snapshots.path, config.INFERENCE_LOG_DIR)
+            startup_timings["feature_store_restore"] = restored["seconds"]
+            print(f"Restored {restored['users']} users from snapshot and replayed {restored['replayed']} logged transactions")
+        except Exception as e:
+            print(f"Warning: Could not restore feature store: {e}")
+        snapshots.start()
+    startup_timings["total"] = time.perf_counter() - start
+    models.start()
+    if batcher is not None:
+        batcher.start()
+    challengers = [version.strip() for version in config.SHADOW_CHALLENGERS.split(",") if version.strip()]
+    if challengers:
+        try:
+            load_challengers(challengers)
+        except (KeyError, ValueError, OSError) as e:
+            print(f"Warning: Shadow scoring disabled, could not load challengers {challengers}: {e}")
+    shadow.start()
+
+@app.on_event("shutdown")
+def flush_logs() -> None:
+    """Stops background workers, snapshots the feature store and flushes buffered inference logs."""
+    models.stop()
+    profiler.stop()
+    if batcher is not None:
+        batcher.stop()
+    shadow.stop()  # Logs what it still holds before the writer closes
+    if snapshots is not None:
+        snapshots.stop()
+    log_writer.close()
 
 @app.get("/health")
 def health_check() -> Dict[str, Any]:
     """Returns the health status of the API and loaded artifacts."""
-    return {"status": "healthy", "model_loaded": model is not None, "preprocessor_loaded": fe is not None}
+    bundle = models.current
+    return {
+        "status": "healthy",
+        "model_loaded": bundle is not None,
+        "preprocessor_loaded": bundle is not None,
+        "model_version": bundle.version if bundle is not None else None,
+        "startup_ms": {step: round(seconds * 1000, 3) for step, seconds in startup_timings.items()}
+    }
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Rejects admin requests without the configured token; without one, admin endpoints are closed."""
+    if not config.ADMIN_TOKEN:
+        if config.ADMIN_INSECURE:
+            return
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+def active_bundle() -> InferenceBundle:
+    """Returns the active bundle, or raises 503 if none is loaded."""
+    bundle = models.current
+    if bundle is None:
+        raise HTTPException(status_code=503, detail="Model or preprocessor not loaded")
+    return bundle
+
+@app.get("/admin/models", dependencies=[Depends(require_admin)])
+def model_status() -> Dict[str, Any]:
+    """Lists the active, pinned, available and rejected model versions."""
+    return models.status()
+
+@app.post("/admin/models/pin", dependencies=[Depends(require_admin)])
+def pin_model(request: PinRequest) -> Dict[str, Any]:
+    """Activates a specific version and keeps it until unpinned."""
+    try:
+        models.pin(request.version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown model version {request.version}")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return models.status()
+
+@app.get("/admin/shadow", dependencies=[Depends(require_admin)])
+def shadow_status() -> Dict[str, Any]:
+    """Lists the challengers and shadow scoring counters."""
+    return shadow.stats()
+
+@app.put("/admin/shadow", dependencies=[Depends(require_admin)])
+def set_challengers(request: ShadowRequest) -> Dict[str, Any]:
+    """Replaces the challenger set; an empty list turns shadow scoring off."""
+    try:
+        load_challengers(request.versions)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Unknown model version {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return shadow.stats()
+
+@app.post("/admin/models/unpin", dependencies=[Depends(require_admin)])
+def unpin_model() -> Dict[str, Any]:
+    """Lets the watcher resume upgrading to the newest version."""
+    models.unpin()
+    return models.status()
+
+@app.post("/admin/models/rollback", dependencies=[Depends(require_admin)])
+def rollback_model() -> Dict[str, Any]:
+    """Pins the version that was active before the current one."""
+    try:
+        models.rollback()
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return models.status()
+
+@app.post("/admin/models/reload", dependencies=[Depends(require_admin)])
+def reload_model() -> Dict[str, Any]:
+    """Checks for a new version immediately instead of waiting for the watcher."""
+    models.check_for_update()
+    return models.status()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint() -> PlainTextResponse:
+    """Exposes request, stage latency, score and feature store metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/admin/profiler/start", dependencies=[Depends(require_admin)])
+def start_profiler(interval_ms: float = Query(5.0, gt=0)) -> Dict[str, Any]:
+    """Starts sampling the stacks of all threads, discarding earlier samples."""
+    profiler.start(interval_ms / 1000)
+    return profiler.report(top=0)
+
+@app.post("/admin/profiler/stop", dependencies=[Depends(require_admin)])
+def stop_profiler(top: int = Query(20, ge=0)) -> Dict[str, Any]:
+    """Stops the profiler and returns the most frequent stacks and functions."""
+    profiler.stop()
+    return profiler.report(top)
+
+@app.get("/admin/profiler", dependencies=[Depends(require_admin)])
+def profiler_samples(top: int = Query(20, ge=0), collapsed: bool = False) -> Any:
+    """Returns the profile so far, or all stacks in collapsed flame graph format."""
+    if collapsed:
+        return PlainTextResponse(profiler.collapsed())
+    return profiler.report(top)
+
+def risk_level(proba: float) -> str:
+    """Buckets a fraud probability into a risk level."""
+    return "High" if proba > 0.8 else "Medium" if proba > 0.5 else "Low"
+
+def reject_future_purchases(purchase_times: Iterable[datetime]) -> None:
+    """Rejects purchase times too far ahead of the server clock before they reach the feature store."""
+    limit_us = int((time.time() + config.MAX_FUTURE_SKEW_SECONDS) * 1e6)
+    if any(to_epoch_us(ts) > limit_us for ts in purchase_times):
+        raise HTTPException(
+            status_code=422,
+            detail=f"purchase_time is more than {config.MAX_FUTURE_SKEW_SECONDS:g} seconds ahead of server time"
+        )
+
+def transactions_to_frame(txs: List[Transaction]) -> pd.DataFrame:
+    """Converts transactions into a dataframe with parsed timestamp columns."""
+    data = pd.DataFrame([tx.model_dump() for tx in txs])
+    data['signup_time'] = pd.to_datetime(data['signup_time'])
+    data['purchase_time'] = pd.to_datetime(data['purchase_time'])
+    return data
+
+def log_inference(bundle: InferenceBundle, records: List[Dict[str, Any]], probas: np.ndarray,
+                  predictions: np.ndarray) -> None:
+    """
+    Queues raw transaction features and model outputs for the background log writer.
+
+    With challengers loaded, the records pass through the shadow scorer first,
+    which adds the challengers' scores off the response path.
+    """
+    # We log the raw features + some engineered ones if needed,
+    # but for drift we mostly care about inputs and eventually outputs.
+    logged_at = time.time()  # Lets a restart replay everything after the last feature store snapshot
+    for record, proba, prediction in zip(records, probas, predictions):
+        record['fraud_probability'] = float(proba)
+        record['prediction'] = int(prediction)
+        record['model_version'] = bundle.version
+        record['logged_at'] = logged_at
+    shadow.submit(records)
+
+async def idempotent(endpoint: str, payload: Callable[[], Any], idempotency_key: Optional[str], response: Response,
+                     compute: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Runs `compute` once per idempotency key and replays its result to retries.
+
+    Requests without an `Idempotency-Key` header are keyed by a hash of their
+    payload, so a gateway retrying the same transaction is also deduplicated.
+    A retry arriving while the original is still being scored waits for it.
+    Replayed responses carry `Idempotent-Replayed: true`; errors are not cached.
+    `payload` builds the request body to fingerprint; it is called, encoded and
+    hashed on the threadpool together with the cache lookup, which may be a
+    Redis round trip, so large batches do not stall the event loop.
+
+    Raises:
+        HTTPException: 400 for an overlong key, 409 if a key is reused with another payload.
+    """
+    if results is None:
+        return await compute()
+    if idempotency_key is not None and len(idempotency_key) > config.MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key exceeds {config.MAX_IDEMPOTENCY_KEY_LENGTH} characters")
+    reserved: List[tuple] = []
+
+    def reserve() -> tuple:
+        fingerprint = payload_fingerprint(payload())
+        key = f"{endpoint} key:{idempotency_key}" if idempotency_key else f"{endpoint} {fingerprint}"
+        future, owner = results.reserve(key, fingerprint)
+        if owner:
+            reserved.append((key, future))
+        return key, future, owner
+
+    try:
+        key, future, owner = await run_in_threadpool(reserve)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except BaseException:
+        # Cancelled while the thread was reserving: release the key so retries do not wait on it forever
+        for key, future in reserved:
+            results.fail(key, future, HTTPException(status_code=503, detail="Original request did not complete"))
+        raise
+    if not owner:
+        response.headers["Idempotent-Replayed"] = "true"
+        # Shielded: the future is shared with the original request and other retries
+        return await asyncio.shield(asyncio.wrap_future(future))
+    try:
+        result = await compute()
+    except BaseException as e:
+        # Waiting retries get the same error; a cancelled original is reported to them as unavailable
+        results.fail(key, future, e if isinstance(e, Exception) else
+                     HTTPException(status_code=503, detail="Original request did not complete"))
+        raise
+    await run_in_threadpool(results.complete, key, future, result)
+    return result
 
 @app.post("/predict")
-def predict(tx: Transaction) -> Dict[str, Any]:
+async def predict(tx: Transaction, response: Response,
+                  idempotency_key: Optional[str] = Header(None)) -> Dict[str, Any]:
     """
     Receives transaction data, calculates real-time velocity, and predicts fraud risk.
+
+    With micro-batching enabled, the request is queued and scored together with
+    others arriving within `MICRO_BATCH_MAX_WAIT_MS`; results are identical.
+    A retried request (same `Idempotency-Key`, or same payload without one)
+    gets the original response without updating the velocity again.
     
     Args:
         tx (Transaction): Transaction data in JSON format.
+        idempotency_key (Optional[str]): Client-chosen key from the `Idempotency-Key` header.
         
     Returns:
         Dict: Fraud probability, binary prediction, and risk level.
     """
-    if model is None or fe is None:
-        raise HTTPException(status_code=503, detail="Model or preprocessor not loaded")
+    return await idempotent("/predict", tx.model_dump, idempotency_key, response, lambda: score_request(tx))
+
+async def score_request(tx: Transaction) -> Dict[str, Any]:
+    """Scores one transaction, through the micro-batcher when it is enabled."""
+    if batcher is None:
+        return await run_in_threadpool(score_one, tx)
+
+    stages = StageTimer(stage_latency, "/predict")
+    record = tx.model_dump()
+    record['signup_time'] = parse_timestamp(tx.signup_time)
+    record['purchase_time'] = parse_timestamp(tx.purchase_time)
+    reject_future_purchases([record['purchase_time']])
+    stages.mark("parse")
+    try:
+        future = batcher.submit(record)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    # Shielded: a disconnecting client must not cancel the batcher's future
+    result = await asyncio.shield(asyncio.wrap_future(future))
+    stages.mark("coalesced")
+    return result
+
+def score_one(tx: Transaction) -> Dict[str, Any]:
+    """Scores a single transaction on the calling thread."""
+    bundle = active_bundle()
+    stages = StageTimer(stage_latency, "/predict")
     
-    # 1. Convert to DataFrame and get velocity
-    data = pd.DataFrame([tx.dict()])
-    data['signup_time'] = pd.to_datetime(data['signup_time'])
-    data['purchase_time'] = pd.to_datetime(data['purchase_time'])
+    # 1. Parse timestamps and get velocity
+    record = tx.model_dump()
+    record['signup_time'] = parse_timestamp(tx.signup_time)
+    record['purchase_time'] = parse_timestamp(tx.purchase_time)
+    reject_future_purchases([record['purchase_time']])
+    stages.mark("parse")
     
     # Update real-time feature store
-    velocity = fs.update_and_get_velocity(tx.user_id, data['purchase_time'].iloc[0])
+    velocity = fs.update_and_get_velocity(tx.user_id, record['purchase_time'])
+    stages.mark("feature_store")
     
     # 2. Preprocess with velocity override
     try:
-        X = fe.transform(data, is_training=False, velocity_override=velocity)
+        record['country'] = bundle.fast_path.get_country(tx.ip_address)
+        X = bundle.fast_path.transform_one(record, velocity)
+        stages.mark("transform")
         
         # 3. Predict
-        proba = model.predict_proba(X)[0][1]
+        proba = bundle.predict_proba(X)[0]
         prediction = int(proba > 0.5)
+        stages.mark("predict")
 
-        # 4. Log inference for drift detection
-        log_file = "data-set/inference_logs.csv"
-        # We log the raw features + some engineered ones if needed, 
-        # but for drift we mostly care about inputs and eventually outputs.
-        log_entry = data.copy()
-        log_entry['fraud_probability'] = float(proba)
-        log_entry['prediction'] = prediction
-        
-        if not os.path.exists(log_file):
-            log_entry.to_csv(log_file, index=False)
-        else:
-            log_entry.to_csv(log_file, mode='a', header=False, index=False)
+        # 4. Log inference for drift detection, with the velocity actually served
+        record['tx_count_last_24h'] = velocity
+        log_inference(bundle, [record], [proba], [prediction])
+        stages.mark("log")
         
+        score_distribution.observe(proba, bundle.version)
+        prediction_count.inc(bundle.version, str(prediction))
         return {
             "fraud_probability": float(proba),
             "prediction": prediction,
-            "risk_level": "High" if proba > 0.8 else "Medium" if proba > 0.5 else "Low"
+            "risk_level": risk_level(proba)
         }
     except Exception as e:
+        error_count.inc("/predict", type(e).__name__)
+        raise HTTPException(status_code=500, detail=str(e))
+
+def score_coalesced(records: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Scores `/predict` requests gathered by the micro-batcher with one model call.
+
+    Velocities are updated in arrival order, as the requests would have been
+    one by one, so every caller gets the result it would have got unbatched.
+    Rows are encoded with the compiled single-row path into one matrix, which
+    beats building a DataFrame for batches of this size. A record that cannot
+    be encoded gets an `HTTPException` in place of its result, failing only its
+    own request, as it would have unbatched.
+    """
+    bundle = active_bundle()
+    stages = StageTimer(stage_latency, "coalesced")
+    coalesced_batch_size.observe(len(records))
+    velocities = fs.update_many(
+        [record['user_id'] for record in records], [record['purchase_time'] for record in records]
+    )
+    stages.mark("feature_store")
+
+    X = np.zeros((len(records), bundle.fast_path.n_features), dtype=np.float64)
+    errors: Dict[int, HTTPException] = {}
+    for i, (record, velocity) in enumerate(zip(records, velocities)):
+        try:
+            record['country'] = bundle.fast_path.get_country(record['ip_address'])
+            bundle.fast_path.transform_one(record, velocity, out=X[i:i + 1])
+            record['tx_count_last_24h'] = int(velocity)
+        except Exception as e:
+            error_count.inc("/predict", type(e).__name__)
+            errors[i] = HTTPException(status_code=500, detail=str(e))
+    stages.mark("transform")
+    if len(errors) == len(records):
+        return [errors[i] for i in range(len(records))]
+    scored = [i for i in range(len(records)) if i not in errors]
+
+    try:
+        probas = bundle.predict_proba(X[scored] if errors else X)
+        predictions = (probas > 0.5).astype(int)
+        stages.mark("predict")
+
+        log_inference(bundle, [records[i] for i in scored], probas, predictions)
+        stages.mark("log")
+    except Exception as e:
+        error_count.inc("/predict", type(e).__name__)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    score_distribution.observe_many(probas, bundle.version)
+    n_flagged = int(predictions.sum())
+    prediction_count.inc(bundle.version, "1", amount=n_flagged)
+    prediction_count.inc(bundle.version, "0", amount=len(predictions) - n_flagged)
+    responses: List[Any] = [errors.get(i) for i in range(len(records))]
+    for i, proba, pred in zip(scored, probas, predictions):
+        responses[i] = {"fraud_probability": float(proba), "prediction": int(pred), "risk_level": risk_level(proba)}
+    return responses
+
+@app.post("/predict/batch")
+async def predict_batch(txs: List[Transaction], response: Response,
+                        idempotency_key: Optional[str] = Header(None)) -> List[Dict[str, Any]]:
+    """
+    Scores a micro-batch of transactions with one transform and one model call.
+
+    Velocities are updated in purchase-time order so that each transaction only
+    counts the ones before it, exactly as if they had been sent one by one.
+    A retried batch is answered like a retried `/predict`.
+
+    Args:
+        txs (List[Transaction]): Transactions in JSON format.
+        idempotency_key (Optional[str]): Client-chosen key from the `Idempotency-Key` header.
+
+    Returns:
+        List[Dict]: One result per transaction, in request order.
+    """
+    if len(txs) > config.MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch size exceeds {config.MAX_BATCH_SIZE}")
+    if not txs:
+        return []
+    return await idempotent("/predict/batch", lambda: [tx.model_dump() for tx in txs], idempotency_key, response,
+                            lambda: run_in_threadpool(score_batch, txs))
+
+def score_batch(txs: List[Transaction]) -> List[Dict[str, Any]]:
+    """Scores a non-empty batch on the calling thread."""
+    bundle = active_bundle()
+    stages = StageTimer(stage_latency, "/predict/batch")
+
+    # 1. Convert to DataFrame and update velocities in event-time order
+    data = transactions_to_frame(txs)
+    purchase_times = data['purchase_time'].tolist()
+    reject_future_purchases(purchase_times)
+    stages.mark("parse")
+    order = np.argsort(data['purchase_time'].to_numpy(), kind='stable')
+    velocities = np.empty(len(data), dtype=np.int64)
+    velocities[order] = fs.update_many(
+        [int(user_id) for user_id in data['user_id'].to_numpy()[order]],
+        [purchase_times[i] for i in order]
+    )
+    stages.mark("feature_store")
+
+    # 2. Preprocess and predict the whole batch at once
+    try:
+        X = bundle.fast_path.transform_batch(data, velocities)
+        stages.mark("transform")
+        probas = bundle.predict_proba(X)
+        predictions = (probas > 0.5).astype(int)
+        stages.mark("predict")
+
+        # 3. Log inference for drift detection, with the velocities actually served
+        data['tx_count_last_24h'] = velocities
+        log_inference(bundle, data.to_dict('records'), probas, predictions)
+        stages.mark("log")
+
+        score_distribution.observe_many(probas, bundle.version)
+        n_flagged = int(predictions.sum())
+        prediction_count.inc(bundle.version, "1", amount=n_flagged)
+        prediction_count.inc(bundle.version, "0", amount=len(predictions) - n_flagged)
+
+        return [
+            {
+                "fraud_probability": float(proba),
+                "prediction": int(pred),
+                "risk_level": risk_level(proba)
+            }
+            for proba, pred in zip(probas, predictions)
+        ]
+    except Exception as e:
+        error_count.inc("/predict/batch", type(e).__name__)
         raise HTTPException(status_code=500, detail=str(e))
 
+@lru_cache(maxsize=config.EXPLAIN_CACHE_SIZE)
+def explain_row(bundle: InferenceBundle, row_bytes: bytes) -> np.ndarray:
+    """Computes (and caches by model and feature vector) the contributions of one encoded row."""
+    row = np.frombuffer(row_bytes, dtype=np.float64)
+    contribs = feature_contributions(bundle.model.get_booster(), row, bundle.fast_path.feature_names)
+    contribs.setflags(write=False)
+    return contribs
+
+@app.post("/explain")
+def explain(tx: Transaction, top_k: int = Query(5, ge=1), velocity: Optional[int] = Query(None, ge=1)) -> Dict[str, Any]:
+    """
+    Returns the features that contributed most to a transaction's fraud score.
+
+    The velocity feature defaults to the feature store count for the window ending
+    at the purchase time, which includes the transaction itself if it was scored.
+    The store is not updated.
+
+    Args:
+        tx (Transaction): Transaction data in JSON format.
+        top_k (int): Number of contributions to return.
+        velocity (Optional[int]): Overrides the 24h transaction count.
+
+    Returns:
+        Dict: Fraud probability, base value and top contributions in log-odds.
+    """
+    bundle = active_bundle()
+
+    record = tx.model_dump()
+    record['signup_time'] = parse_timestamp(tx.signup_time)
+    record['purchase_time'] = parse_timestamp(tx.purchase_time)
+    if velocity is None:
+        velocity = max(fs.get_velocity(tx.user_id, record['purchase_time']), 1)
+
+    row = bundle.fast_path.transform_one(record, velocity)[0]
+    contribs = explain_row(bundle, row.tobytes())
+    return {
+        "fraud_probability": float(1 / (1 + np.exp(-contribs.sum()))),
+        "base_value": float(contribs[-1]),
+        "tx_count_last_24h": velocity,
+        "contributions": top_contributions(contribs, row, bundle.fast_path.feature_names, top_k)
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,59 @@
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from src.features.fast_path import FastFeaturePath
+
+def sample_transaction() -> dict:
+    """Returns a representative raw transaction payload."""
+    return {
+        "user_id": 22058,
+        "signup_time": "2015-02-24 22:55:49",
+        "purchase_time": "2015-04-18 02:47:11",
+        "purchase_value": 34.0,
+        "device_id": "QVPSPJUOCKZAR",
+        "source": "SEO",
+        "browser": "Chrome",
+        "sex": "M",
+        "age": 39,
+        "ip_address": 732758368
+    }
+
+def percentiles(samples: list) -> str:
+    """Formats p50/p99 of a list of durations in microseconds."""
+    p50, p99 = np.percentile(np.array(samples) * 1e6, [50, 99])
+    return f"p50 {p50:9.1f} us | p99 {p99:9.1f} us"
+
+def run_benchmark(fe_path: str = "models/feature_engineer.joblib", n_iter: int = 2_000) -> None:
+    """
+    Compares single-row latency of FeatureEngineer.transform and FastFeaturePath.
+
+    Args:
+        fe_path (str): Path to a fitted FeatureEngineer artifact.
+        n_iter (int): Number of single-row encodings timed per path.
+    """
+    fe = joblib.load(fe_path)
+    fast_path = FastFeaturePath(fe)
+    tx = sample_transaction()
+
+    slow = []
+    for _ in range(n_iter):
+        start = time.perf_counter()
+        data = pd.DataFrame([tx])
+        data['signup_time'] = pd.to_datetime(data['signup_time'])
+        data['purchase_time'] = pd.to_datetime(data['purchase_time'])
+        expected = fe.transform(data, is_training=False, velocity_override=1).to_numpy()
+        slow.append(time.perf_counter() - start)
+
+    fast = []
+    for _ in range(n_iter):
+        start = time.perf_counter()
+        row = fast_path.transform_one(tx, 1)
+        fast.append(time.perf_counter() - start)
+
+    assert np.array_equal(expected, row), "Fast path disagrees with transform"
+    print(f"FeatureEngineer.transform: {percentiles(slow)}")
+    print(f"FastFeaturePath:           {percentiles(fast)}")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,56 @@
+import sys
+import time
+import numpy as np
+from datetime import datetime, timedelta
+from src.features.feature_store import FeatureStore
+
+def legacy_update(history: dict, user_id: int, current_time: datetime, window_hours: int = 24) -> int:
+    """The original list-rebuilding update from FeatureStore.update_and_get_velocity."""
+    history.setdefault(user_id, []).append(current_time)
+    cutoff = current_time - timedelta(hours=window_hours)
+    history[user_id] = [ts for ts in history[user_id] if ts > cutoff]
+    return len(history[user_id])
+
+def make_events(n_events: int, n_users: int, days: int = 30, seed: int = 42):
+    """Generates a time-ordered event stream with Zipf-distributed user activity."""
+    rng = np.random.default_rng(seed)
+    users = (rng.zipf(1.3, size=n_events) % n_users).tolist()
+    offsets = np.sort(rng.integers(0, days * 86400, size=n_events))
+    start = datetime(2015, 1, 1)
+    times = [start + timedelta(seconds=int(s)) for s in offsets]
+    return users, times
+
+def run_benchmark(n_events: int = 1_000_000, n_users: int = 200_000) -> None:
+    """
+    Replays a synthetic event stream through the legacy and deque-based stores.
+
+    Args:
+        n_events (int): Number of transactions to replay.
+        n_users (int): Size of the user id space.
+    """
+    users, times = make_events(n_events, n_users)
+
+    legacy = {}
+    start = time.perf_counter()
+    for user_id, ts in zip(users, times):
+        legacy_update(legacy, user_id, ts)
+    legacy_s = time.perf_counter() - start
+
+    store = FeatureStore(window_hours=24, max_users=n_users, max_events_per_user=1_000)
+    start = time.perf_counter()
+    for user_id, ts in zip(users, times):
+        store.update_and_get_velocity(user_id, ts)
+    store_s = time.perf_counter() - start
+
+    legacy_bytes = sys.getsizeof(legacy) + sum(
+        sys.getsizeof(h) + sum(sys.getsizeof(ts) for ts in h) for h in legacy.values()
+    )
+    stats = store.stats()
+    print(f"Legacy list store: {n_events / legacy_s:12,.0f} events/s | "
+          f"{len(legacy):9,} users | {legacy_bytes / 2**20:8.1f} MiB")
+    print(f"Deque store:       {n_events / store_s:12,.0f} events/s | "
+          f"{stats['users']:9,} users | {stats['memory_bytes'] / 2**20:8.1f} MiB")
+    print(stats)
+
+if __name__ == "__main__":
+    run_benchmark(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,49 @@
+import os
+import sys
+import tempfile
+import time
+from src.features.feature_store import FeatureStore
+from src.features.store_backends import RedisFeatureStore, SharedMemoryFeatureStore
+from benchmarks.bench_feature_store import make_events
+
+def time_updates(store, users, times, batch_size: int = 1) -> float:
+    """Replays events one by one or in `update_many` batches and returns events per second."""
+    start = time.perf_counter()
+    if batch_size == 1:
+        for user_id, ts in zip(users, times):
+            store.update_and_get_velocity(user_id, ts)
+    else:
+        for i in range(0, len(users), batch_size):
+            store.update_many(users[i:i + batch_size], times[i:i + batch_size])
+    return len(users) / (time.perf_counter() - start)
+
+def run_benchmark(n_events: int = 200_000, n_users: int = 50_000, redis_url: str = "") -> None:
+    """
+    Compares update throughput of the velocity store backends.
+
+    Redis is measured against `redis_url` when given, otherwise against an
+    in-process fakeredis server (protocol overhead only, no network).
+    """
+    users, times = make_events(n_events, n_users)
+    print(f"In-process:     {time_updates(FeatureStore(24, n_users, 1_000), users, times):12,.0f} events/s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shm = SharedMemoryFeatureStore(os.path.join(tmp, "fs.bin"), max_users=4 * n_users)
+        print(f"Shared memory:  {time_updates(shm, users, times):12,.0f} events/s")
+        shm.close()
+
+    if redis_url:
+        client = RedisFeatureStore.from_url(redis_url).client
+    else:
+        import fakeredis
+        client = fakeredis.FakeRedis()
+    n = min(n_events, 20_000)
+    for batch_size in (1, 100):
+        store = RedisFeatureStore(client, max_events_per_user=1_000, key_prefix="bench:velocity:")
+        rate = time_updates(store, users[:n], times[:n], batch_size)
+        print(f"Redis (batch {batch_size:3}): {rate:10,.0f} events/s | {store.stats()}")
+        store.reset()
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    run_benchmark(*(int(arg) for arg in args[:2]), *args[2:3])
@@ -0,0 +1,97 @@
+from typing import Optional
+import numpy as np
+import pandas as pd
+from src.features.ip_index import IpCountryIndex
+
+# Named dataset sizes accepted by the benchmark suite
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+SOURCES = (['SEO', 'Ads', 'Direct'], [0.40, 0.40, 0.20])
+BROWSERS = (['Chrome', 'IE', 'Safari', 'FireFox', 'Opera'], [0.41, 0.24, 0.16, 0.16, 0.03])
+SEXES = (['M', 'F'], [0.58, 0.42])
+
+def _choice(rng: np.random.Generator, options: tuple, n: int) -> np.ndarray:
+    """Draws `n` labels, sharing one string object per label to keep large frames small."""
+    values, weights = options
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=n, p=weights)]
+
+def make_ips(rng: np.random.Generator, n: int, ip_index: Optional[IpCountryIndex] = None,
+             unknown_rate: float = 0.15, shared_rate: float = 0.02) -> np.ndarray:
+    """
+    Draws IP addresses shaped like the real traffic.
+
+    Known addresses fall inside a country range (picked uniformly over ranges,
+    so countries with many allocations dominate), `unknown_rate` fall in the
+    gaps between ranges and `shared_rate` reuse a small pool, like devices
+    behind a proxy.
+
+    Args:
+        rng (np.random.Generator): Random generator.
+        n (int): Number of addresses.
+        ip_index (Optional[IpCountryIndex]): Known ranges; without it every address is uniform.
+        unknown_rate (float): Fraction that maps to no country.
+        shared_rate (float): Fraction drawn from a pool of 100 shared addresses.
+
+    Returns:
+        np.ndarray: Float64 addresses, as in Fraud_Data.csv.
+    """
+    ips = rng.uniform(0, 2**32 - 1, size=n)
+    if ip_index is not None and len(ip_index) > 1:
+        lower, upper = ip_index.lower.astype(np.float64), ip_index.upper.astype(np.float64)
+        gap_lo, gap_hi = upper[:-1] + 1, lower[1:] - 1
+        gaps = np.flatnonzero(gap_hi >= gap_lo)
+        unknown = rng.random(n) < unknown_rate if len(gaps) else np.zeros(n, dtype=bool)
+
+        ranges = rng.integers(0, len(lower), size=int((~unknown).sum()))
+        ips[~unknown] = lower[ranges] + rng.random(len(ranges)) * (upper[ranges] - lower[ranges])
+        picked = rng.choice(gaps, size=int(unknown.sum()))
+        ips[unknown] = gap_lo[picked] + rng.random(len(picked)) * (gap_hi[picked] - gap_lo[picked])
+    shared = rng.random(n) < shared_rate
+    ips[shared] = rng.choice(ips[:100], size=int(shared.sum()))
+    return np.floor(ips)
+
+def make_transactions(n_rows: int, ip_index: Optional[IpCountryIndex] = None, seed: int = 42,
+                      days: int = 120, users_per_row: float = 0.6) -> pd.DataFrame:
+    """
+    Generates a Fraud_Data-shaped frame with parsed timestamps.
+
+    User activity follows Pareto weights over `users_per_row * n_rows` users,
+    so a few users are very active (and have high velocities) while most
+    appear once or twice. Purchase times are spread over `days`, signups
+    precede them by an exponential delay with a small share of near-instant
+    signups, and values, ages and categorical fields follow the original
+    marginals.
+
+    Args:
+        n_rows (int): Number of transactions.
+        ip_index (Optional[IpCountryIndex]): Known IP ranges, see `make_ips`.
+        seed (int): Random seed; the same seed always gives the same frame.
+        days (int): Length of the purchase period.
+        users_per_row (float): Distinct users relative to rows.
+
+    Returns:
+        pd.DataFrame: Raw transactions, unsorted.
+    """
+    rng = np.random.default_rng(seed)
+    n_users = max(int(n_rows * users_per_row), 1)
+    activity = rng.pareto(1.5, size=n_users) + 1
+    user_ids = rng.choice(n_users, size=n_rows, p=activity / activity.sum())
+
+    purchase = np.datetime64('2015-01-01T00:00:00', 's') + rng.integers(0, days * 86400, size=n_rows)
+    signup_delay = rng.exponential(57 * 86400, size=n_rows).astype(np.int64)
+    instant = rng.random(n_rows) < 0.05
+    signup_delay[instant] = rng.integers(1, 5, size=int(instant.sum()))
+
+    device_pool = np.asarray([f"D{i:012X}" for i in range(min(n_users, 1_000_000))], dtype=object)
+    return pd.DataFrame({
+        'user_id': user_ids.astype(np.int64),
+        'signup_time': pd.to_datetime(purchase - signup_delay),
+        'purchase_time': pd.to_datetime(purchase),
+        'purchase_value': np.clip(np.round(rng.lognormal(3.45, 0.55, size=n_rows)), 9, 154),
+        'device_id': device_pool[user_ids % len(device_pool)],
+        'source': _choice(rng, SOURCES, n_rows),
+        'browser': _choice(rng, BROWSERS, n_rows),
+        'sex': _choice(rng, SEXES, n_rows),
+        'age': np.clip(np.round(rng.normal(33, 8.6, size=n_rows)), 18, 76).astype(np.int64),
+        'ip_address': make_ips(rng, n_rows, ip_index),
+    })
@@ -0,0 +1,308 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+import joblib
+import numpy as np
+import pandas as pd
+from src.features.engineering import FeatureEngineer
+from src.features.fast_path import FastFeaturePath
+from src.features.feature_store import FeatureStore
+from src.models.bundle import InferenceBundle, export_bundle, latest_bundle, load_bundle
+from src.models.train import DEFAULT_XGB_PARAMS
+from src.utils.config import Config
+from benchmarks.datasets import SCALES, make_transactions
+
+RESULTS_FORMAT_VERSION = 1
+DEFAULT_BASELINE = "benchmarks/baseline.json"
+# Rows per chunk for offline transforms, bounding the dense feature matrix in memory
+CHUNK_ROWS = 250_000
+# Relative slowdown flagged as a regression when comparing with the baseline
+DEFAULT_THRESHOLD = 0.15
+
+def measure(fn: Callable[[], Any], repeat: int) -> float:
+    """Runs `fn` `repeat` times and returns the fastest wall time in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def latency_samples(fn: Callable[[int], Any], n_iter: int) -> np.ndarray:
+    """Times `n_iter` calls of `fn(i)` and returns the durations in microseconds."""
+    samples = np.empty(n_iter)
+    for i in range(n_iter):
+        start = time.perf_counter()
+        fn(i)
+        samples[i] = time.perf_counter() - start
+    return samples * 1e6
+
+def result(name: str, scale: str, metric: str, value: float, higher_is_better: bool) -> Dict[str, Any]:
+    """Builds one machine-readable measurement."""
+    return {"name": name, "scale": scale, "metric": metric, "value": float(value),
+            "higher_is_better": higher_is_better}
+
+def latency_results(name: str, scale: str, samples_us: np.ndarray) -> List[Dict[str, Any]]:
+    """Turns latency samples into p50 and p99 measurements."""
+    p50, p99 = np.percentile(samples_us, [50, 99])
+    return [result(name, scale, "p50_us", p50, False), result(name, scale, "p99_us", p99, False)]
+
+def bench_offline(fe: FeatureEngineer, fast_path: FastFeaturePath, df: pd.DataFrame, scale: str,
+                  repeat: int) -> List[Dict[str, Any]]:
+    """Throughput of the batch feature pipeline: velocity, IP lookup and both transforms."""
+    n = len(df)
+    velocity = fe.calculate_velocity(df)['tx_count_last_24h'].to_numpy()
+
+    def offline_transform() -> None:
+        for start in range(0, n, CHUNK_ROWS):
+            fe.transform(df.iloc[start:start + CHUNK_ROWS].copy(),
+                         velocity_override=velocity[start:start + CHUNK_ROWS])
+
+    def fast_transform() -> None:
+        for start in range(0, n, CHUNK_ROWS):
+            fast_path.transform_batch(df.iloc[start:start + CHUNK_ROWS].copy(), velocity[start:start + CHUNK_ROWS])
+
+    ips = df['ip_address'].to_numpy()
+    return [
+        result("calculate_velocity", scale, "rows_per_s", n / measure(lambda: fe.calculate_velocity(df), repeat), True),
+        result("ip_lookup_batch", scale, "rows_per_s", n / measure(lambda: fe.ip_index.lookup_many(ips), repeat), True),
+        result("offline_transform", scale, "rows_per_s", n / measure(offline_transform, repeat), True),
+        result("fast_path_batch", scale, "rows_per_s", n / measure(fast_transform, repeat), True),
+    ]
+
+def bench_online(fe: FeatureEngineer, fast_path: FastFeaturePath, df: pd.DataFrame, scale: str,
+                 n_iter: int) -> List[Dict[str, Any]]:
+    """Single-row latency of the serving encoder and the scalar IP lookup."""
+    records = df.head(n_iter).to_dict('records')
+    n_iter = len(records)
+    return (
+        latency_results("transform_one", scale, latency_samples(lambda i: fast_path.transform_one(records[i], 1), n_iter))
+        + latency_results("get_country", scale, latency_samples(lambda i: fe.get_country(records[i]['ip_address']), n_iter))
+    )
+
+def bench_store(df: pd.DataFrame, scale: str) -> List[Dict[str, Any]]:
+    """Update rate and footprint of the in-process FeatureStore, replaying in purchase order."""
+    events = df.sort_values('purchase_time', kind='stable')
+    users, times = events['user_id'].tolist(), events['purchase_time'].dt.to_pydatetime()
+    store = FeatureStore(window_hours=24, max_users=len(users), max_events_per_user=1_000)
+    start = time.perf_counter()
+    for user_id, ts in zip(users, times):
+        store.update_and_get_velocity(user_id, ts)
+    seconds = time.perf_counter() - start
+    stats = store.stats()
+    return [
+        result("feature_store_update", scale, "events_per_s", len(users) / seconds, True),
+        result("feature_store_memory", scale, "bytes_per_user", stats["memory_bytes"] / max(stats["users"], 1), False),
+        result("feature_store_memory", scale, "total_bytes", stats["memory_bytes"], False),
+    ]
+
+def benchmark_bundle(config: Config, fe: FeatureEngineer, root: str) -> InferenceBundle:
+    """
+    Returns the newest local bundle, or one with a synthetic model of production shape.
+
+    The synthetic model is trained on generated data, so its scores are
+    meaningless, but it is trained with the default training parameters, so
+    its tree count and depth, and hence its latency, match production.
+    """
+    path = latest_bundle(config.MODEL_BUNDLE_DIR)
+    if path is not None:
+        return load_bundle(path)
+    import xgboost as xgb
+    fast_path = FastFeaturePath(fe)
+    df = make_transactions(20_000, fe.ip_index, seed=7)
+    X = pd.DataFrame(fast_path.transform_batch(df, np.ones(len(df), dtype=np.int64)), columns=fast_path.feature_names)
+    y = (np.random.default_rng(7).random(len(df)) < 0.1).astype(int)
+    model = xgb.XGBClassifier(**DEFAULT_XGB_PARAMS).fit(X, y)
+    return load_bundle(export_bundle(model, fast_path, root, version="benchmark"))
+
+def bench_model(config: Config, fe: FeatureEngineer, df: pd.DataFrame, scale: str, n_iter: int,
+                batch_size: int = 100) -> List[Dict[str, Any]]:
+    """Scoring latency of encoded rows, through XGBoost and through the compiled trees."""
+    with tempfile.TemporaryDirectory() as tmp:
+        bundle = benchmark_bundle(config, fe, tmp)
+    if bundle.compiled is None:
+        return []
+    X = bundle.fast_path.transform_batch(df.head(batch_size * 10), np.ones(min(len(df), batch_size * 10), dtype=np.int64))
+    n_rows = len(X)
+    batches = [X[start:start + batch_size] for start in range(0, n_rows, batch_size)]
+    n_batches = max(n_iter // 10, 1)
+    return (
+        latency_results("predict_xgboost", scale,
+                        latency_samples(lambda i: bundle.model.predict_proba(X[i % n_rows:i % n_rows + 1]), n_iter))
+        + latency_results("predict_compiled", scale,
+                          latency_samples(lambda i: bundle.compiled.predict_proba(X[i % n_rows]), n_iter))
+        + latency_results(f"predict_xgboost_batch_{batch_size}", scale,
+                          latency_samples(lambda i: bundle.model.predict_proba(batches[i % len(batches)]), n_batches))
+        + latency_results(f"predict_compiled_batch_{batch_size}", scale,
+                          latency_samples(lambda i: bundle.compiled.predict_proba(batches[i % len(batches)]), n_batches))
+    )
+
+def bench_api(config: Config, fe: FeatureEngineer, df: pd.DataFrame, scale: str, n_iter: int,
+              batch_size: int = 100) -> List[Dict[str, Any]]:
+    """
+    End-to-end request latency through the ASGI app in process, without a network.
+
+    The app is wired to a temporary bundle directory, feature store and log
+    directory, so the benchmark never touches serving state on disk. Requests
+    cycle through the first rows of `df`; `n_iter` single requests are sent,
+    then a tenth as many batches. The result cache is off, since cycling
+    payloads would otherwise be timed as replayed retries.
+    """
+    import httpx
+    import api.main as main
+    from src.models.serving import ModelManager
+    from src.utils.inference_log import InferenceLogWriter
+
+    payloads = df.head(batch_size * 10).assign(
+        signup_time=lambda d: d['signup_time'].astype(str),
+        purchase_time=lambda d: d['purchase_time'].astype(str),
+        ip_address=lambda d: d['ip_address'].astype(np.int64),
+    ).to_dict('records')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bundle = benchmark_bundle(config, fe, os.path.join(tmp, "bundles"))
+        models = ModelManager(os.path.dirname(bundle.path), poll_interval=0)
+        models.activate(bundle.version, check_agreement=False)
+        writer = InferenceLogWriter(os.path.join(tmp, "logs"))
+        writer.start()
+        saved = main.models, main.fs, main.log_writer, main.results
+        main.models, main.fs, main.log_writer, main.results = models, FeatureStore(window_hours=24), writer, None
+
+        async def run() -> Dict[str, np.ndarray]:
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                await client.post("/predict", json=payloads[0])  # Warm up
+                single, batch = np.empty(n_iter), np.empty(max(n_iter // 10, 1))
+                for i in range(len(single)):
+                    start = time.perf_counter()
+                    (await client.post("/predict", json=payloads[i % len(payloads)])).raise_for_status()
+                    single[i] = time.perf_counter() - start
+                for i in range(len(batch)):
+                    start = time.perf_counter()
+                    chunk = payloads[(i % 10) * batch_size:(i % 10 + 1) * batch_size]
+                    (await client.post("/predict/batch", json=chunk)).raise_for_status()
+                    batch[i] = time.perf_counter() - start
+                return {"single": single * 1e6, "batch": batch * 1e6}
+
+        try:
+            samples = asyncio.run(run())
+        finally:
+            main.models, main.fs, main.log_writer, main.results = saved
+            writer.close()
+    return (latency_results("api_predict", scale, samples["single"])
+            + latency_results(f"api_predict_batch_{batch_size}", scale, samples["batch"]))
+
+def git_commit() -> Optional[str]:
+    """Returns the current commit hash, if run inside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(scales: List[str], groups: List[str], repeat: int = 3, n_iter: int = 1_000,
+              seed: int = 42) -> Dict[str, Any]:
+    """
+    Runs the selected benchmark groups at each scale.
+
+    Args:
+        scales (List[str]): Keys of `SCALES`.
+        groups (List[str]): Any of 'offline', 'online', 'store', 'model' and 'api'.
+        repeat (int): Runs per throughput measurement; the fastest is kept.
+        n_iter (int): Timed calls per latency measurement.
+        seed (int): Dataset seed.
+
+    Returns:
+        Dict: Environment metadata and a list of measurements.
+    """
+    config = Config()
+    fe = joblib.load(config.FEATURE_ENGINEER_PATH)
+    fast_path = FastFeaturePath(fe)
+    results: List[Dict[str, Any]] = []
+    for scale in scales:
+        df = make_transactions(SCALES[scale], fe.ip_index, seed=seed)
+        # Large datasets take minutes per pass, so time them once
+        runs = repeat if len(df) <= 1_000_000 else 1
+        if "offline" in groups:
+            results += bench_offline(fe, fast_path, df, scale, runs)
+        if "online" in groups:
+            results += bench_online(fe, fast_path, df, scale, n_iter)
+        if "store" in groups:
+            results += bench_store(df, scale)
+        if "model" in groups:
+            results += bench_model(config, fe, df, scale, n_iter)
+        if "api" in groups:
+            results += bench_api(config, fe, df, scale, n_iter)
+        print(f"Finished {scale} ({len(df):,} rows)", file=sys.stderr)
+    return {
+        "version": RESULTS_FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "seed": seed,
+        "results": results,
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD) -> pd.DataFrame:
+    """
+    Compares measurements present in both runs.
+
+    Args:
+        current (Dict): Output of `run_suite`.
+        baseline (Dict): A stored earlier output of `run_suite`.
+        threshold (float): Relative slowdown beyond which a measurement regressed.
+
+    Returns:
+        pd.DataFrame: One row per shared non-zero measurement with both values,
+        the change (positive is better) and a `regressed` flag.
+    """
+    key = ["name", "scale", "metric"]
+    merged = pd.DataFrame(current["results"]).merge(
+        pd.DataFrame(baseline["results"])[key + ["value"]], on=key, suffixes=("", "_baseline")
+    )
+    merged = merged[(merged["value"] > 0) & (merged["value_baseline"] > 0)]
+    ratio = merged["value"] / merged["value_baseline"]
+    merged["change"] = np.where(merged["higher_is_better"], ratio - 1, 1 / ratio - 1)
+    merged["regressed"] = merged["change"] < -threshold
+    return merged[key + ["value_baseline", "value", "change", "regressed"]]
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    """Prints measurements as a table."""
+    for r in results:
+        print(f"{r['name']:<26} {r['scale']:>5} {r['metric']:<15} {r['value']:>16,.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Feature pipeline, feature store and API benchmarks")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["1k", "100k"])
+    parser.add_argument("--groups", nargs="+", choices=["offline", "online", "store", "model", "api"],
+                        default=["offline", "online", "store", "model", "api"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=1_000)
+    parser.add_argument("--output", default=None, help="Write results as JSON to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Results to compare against, if present")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    report = run_suite(args.scales, args.groups, args.repeat, args.iterations)
+    print_results(report["results"])
+    for path in filter(None, [args.output, args.baseline if args.save_baseline else None]):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote results to {path}")
+
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            comparison = compare(report, json.load(f), args.threshold)
+        print(comparison.to_string(index=False, float_format=lambda v: f"{v:,.3f}"))
+        if comparison["regressed"].any():
+            print(f"{int(comparison['regressed'].sum())} measurements regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
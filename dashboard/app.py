@@ -57,13 +57,26 @@ with col2:
 
     st.subheader("Monitoring & Drift")
     if st.button("Run Drift Analysis"):
-        with st.spinner("Analyzing data drift..."):
+        try:
+            from src.models.drift import check_drift_stream
+            scores = check_drift_stream()
+            st.dataframe(pd.DataFrame(scores).T, use_container_width=True)
+            drifted = [feature for feature, score in scores.items() if score["drifted"]]
+            if drifted:
+                st.warning(f"Drift detected in: {', '.join(drifted)}")
+            else:
+                st.success("No significant drift detected.")
+        except Exception as e:
+            st.error(f"Analysis failed: {e}")
+
+    if st.button("Export Full Drift Report"):
+        with st.spinner("Generating Evidently report..."):
             try:
                 from src.models.drift import check_drift
                 check_drift()
-                st.success("Drift analysis complete!")
+                st.success("Drift report exported!")
             except Exception as e:
-                st.error(f"Analysis failed: {e}")
+                st.error(f"Export failed: {e}")
 
     if os.path.exists("docs/drift_report.html"):
         st.info("Drift report is ready.")
@@ -1,29 +1,146 @@
+import hashlib
+import json
+import os
 import pandas as pd
 import numpy as np
-from typing import Tuple, Dict
+from typing import Callable, Dict, List, Optional, Tuple
 from src.utils.config import Config
 
+try:
+    import pyarrow  # noqa: F401  (needed by pandas for Parquet)
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+# Bump when the cached schema changes so stale caches are rebuilt
+CACHE_VERSION = 1
+FRAUD_DTYPES = {
+    'source': 'category',
+    'browser': 'category',
+    'sex': 'category',
+    'age': 'int32',
+}
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Computes the SHA-256 digest of a file in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 class DataLoader:
-    """Utility class for loading project datasets."""
-    
+    """
+    Utility class for loading project datasets.
+
+    Raw CSVs are converted once into typed Parquet files under
+    `PROCESSED_DATA_PATH`, next to a small metadata file recording the source
+    file's size, mtime and SHA-256. Later loads read the Parquet file, with
+    optional column projection, unless the source has changed. A changed mtime
+    with an unchanged hash only refreshes the metadata.
+    """
+
     def __init__(self, config: Config):
         """Initializes the DataLoader with project configuration."""
         self.config = config
 
-    def load_fraud_data(self) -> pd.DataFrame:
-        """Loads the raw fraud dataset and converts time columns to datetime objects."""
-        df = pd.read_csv(self.config.FRAUD_DATA_PATH)
-        df['signup_time'] = pd.to_datetime(df['signup_time'])
-        df['purchase_time'] = pd.to_datetime(df['purchase_time'])
-        return df
+    def load_fraud_data(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Loads the fraud dataset with typed categorical, integer and datetime columns."""
+        return self._load_cached(self.config.FRAUD_DATA_PATH, self._read_fraud_csv, columns)
 
-    def load_credit_card_data(self) -> pd.DataFrame:
+    def load_credit_card_data(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Loads the raw credit card dataset from the configured path."""
-        return pd.read_csv(self.config.CREDIT_CARD_PATH)
+        return self._load_cached(self.config.CREDIT_CARD_PATH, pd.read_csv, columns)
 
     def load_ip_country_map(self) -> pd.DataFrame:
         """Loads and prepares the IP-to-Country mapping dataset."""
-        df_ip = pd.read_csv(self.config.IP_TO_COUNTRY_PATH)
+        return self._load_cached(self.config.IP_TO_COUNTRY_PATH, self._read_ip_csv)
+
+    @staticmethod
+    def _read_fraud_csv(path: str) -> pd.DataFrame:
+        """Parses the raw fraud CSV and applies the cached column types."""
+        df = pd.read_csv(path, dtype=FRAUD_DTYPES)
+        df['signup_time'] = pd.to_datetime(df['signup_time'])
+        df['purchase_time'] = pd.to_datetime(df['purchase_time'])
+        return df
+
+    @staticmethod
+    def _read_ip_csv(path: str) -> pd.DataFrame:
+        """Parses the raw IP-to-Country CSV with integer bounds."""
+        df_ip = pd.read_csv(path)
         df_ip['lower_bound_ip_address'] = df_ip['lower_bound_ip_address'].astype('int64')
         df_ip['upper_bound_ip_address'] = df_ip['upper_bound_ip_address'].astype('int64')
         return df_ip
+
+    def fingerprint(self, source_path: str) -> str:
+        """Returns the SHA-256 of a raw dataset, reusing the cache metadata when it is fresh."""
+        if self.config.USE_DATA_CACHE and HAS_PARQUET:
+            cache_path, meta_path = self.cache_paths(source_path)
+            if self._cache_is_fresh(source_path, cache_path, meta_path):
+                with open(meta_path) as f:
+                    return json.load(f)["sha256"]
+        return file_sha256(source_path)
+
+    def cache_paths(self, source_path: str) -> Tuple[str, str]:
+        """Returns the Parquet and metadata paths used to cache a raw CSV."""
+        stem = os.path.splitext(os.path.basename(source_path))[0]
+        base = os.path.join(self.config.PROCESSED_DATA_PATH, stem)
+        return f"{base}.parquet", f"{base}.meta.json"
+
+    def _load_cached(self, source_path: str, read_csv: Callable[[str], pd.DataFrame],
+                     columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Reads a dataset from its Parquet cache, rebuilding the cache when the source changed."""
+        if not (self.config.USE_DATA_CACHE and HAS_PARQUET):
+            df = read_csv(source_path)
+            return df[columns] if columns is not None else df
+
+        cache_path, meta_path = self.cache_paths(source_path)
+        if not self._cache_is_fresh(source_path, cache_path, meta_path):
+            df = read_csv(source_path)
+            self._write_cache(source_path, df, cache_path, meta_path)
+            return df[columns] if columns is not None else df
+        return pd.read_parquet(cache_path, columns=columns)
+
+    @staticmethod
+    def _source_stat(source_path: str) -> Dict[str, int]:
+        """Returns the source file's size and modification time."""
+        stat = os.stat(source_path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _cache_is_fresh(self, source_path: str, cache_path: str, meta_path: str) -> bool:
+        """Checks the cache metadata against the source file's size, mtime and hash."""
+        if not (os.path.exists(cache_path) and os.path.exists(meta_path)):
+            return False
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("version") != CACHE_VERSION:
+            return False
+        stat = self._source_stat(source_path)
+        if stat == {"size": meta["size"], "mtime_ns": meta["mtime_ns"]}:
+            return True
+        # The file was touched or rewritten: only its content decides
+        if stat["size"] != meta["size"] or file_sha256(source_path) != meta["sha256"]:
+            return False
+        self._write_meta(meta_path, {**meta, **stat})
+        return True
+
+    def _write_cache(self, source_path: str, df: pd.DataFrame, cache_path: str, meta_path: str) -> None:
+        """Atomically writes the Parquet cache and its metadata."""
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+        self._write_meta(meta_path, {
+            "version": CACHE_VERSION,
+            "source": source_path,
+            "sha256": file_sha256(source_path),
+            **self._source_stat(source_path),
+        })
+
+    @staticmethod
+    def _write_meta(meta_path: str, meta: Dict) -> None:
+        """Atomically writes the cache metadata file."""
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
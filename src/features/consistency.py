@@ -0,0 +1,193 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+import joblib
+import numpy as np
+import pandas as pd
+from src.features.engineering import FeatureEngineer
+from src.features.fast_path import FastFeaturePath
+from src.features.feature_store import FeatureStore
+from src.utils.config import Config
+from src.utils.inference_log import read_inference_logs
+
+VELOCITY_COL = 'tx_count_last_24h'
+# Key identifying a transaction when joining logs with labels
+TRANSACTION_KEY = ['user_id', 'purchase_time']
+
+def _replay_shard(user_ids: np.ndarray, times_us: np.ndarray, window_hours: int,
+                  max_events_per_user: Optional[int]) -> np.ndarray:
+    """Runs one user shard through a fresh FeatureStore, in the given order."""
+    store = FeatureStore(window_hours=window_hours, max_events_per_user=max_events_per_user)
+    times = pd.to_datetime(times_us, unit='us').to_pydatetime()
+    return np.fromiter(
+        (store.update_and_get_velocity(user_id, ts) for user_id, ts in zip(user_ids.tolist(), times)),
+        dtype=np.int64, count=len(user_ids)
+    )
+
+def replay_online_velocity(df: pd.DataFrame, order_by: str = 'purchase_time', window_hours: int = 24,
+                           max_events_per_user: Optional[int] = None, n_workers: Optional[int] = None) -> np.ndarray:
+    """
+    Computes the velocity the online FeatureStore would have served for every row.
+
+    Rows are replayed in `order_by` order (arrival order, e.g. `logged_at` for
+    inference logs), which is point-in-time correct because each row only sees
+    the events replayed before it. Users are split into shards by id and the
+    shards run in parallel processes; per-user order is all velocity depends on.
+
+    Args:
+        df (pd.DataFrame): Transactions with `user_id` and datetime `purchase_time`.
+        order_by (str): Column giving the order in which transactions reached the API.
+        window_hours (int): Length of the rolling velocity window.
+        max_events_per_user (Optional[int]): Per-user cap, as configured for serving.
+        n_workers (Optional[int]): Worker processes, defaults to the CPU count.
+
+    Returns:
+        np.ndarray: Online velocity per row, aligned with `df`.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    order = np.argsort(df[order_by].to_numpy(), kind='stable')
+    user_ids = df['user_id'].to_numpy(dtype=np.int64)[order]
+    times_us = df['purchase_time'].to_numpy(dtype='datetime64[us]').astype(np.int64)[order]
+    shard_of = user_ids % n_workers
+    shards = [np.flatnonzero(shard_of == shard) for shard in range(n_workers)]
+
+    velocities = np.empty(len(df), dtype=np.int64)
+    if n_workers == 1:
+        results = [_replay_shard(user_ids, times_us, window_hours, max_events_per_user)]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = [
+                pool.submit(_replay_shard, user_ids[rows], times_us[rows], window_hours, max_events_per_user)
+                for rows in shards
+            ]
+            results = [future.result() for future in futures]
+    for rows, result in zip(shards if n_workers > 1 else [np.arange(len(df))], results):
+        velocities[order[rows]] = result
+    return velocities
+
+def _compare(name: str, offline: np.ndarray, online: np.ndarray, atol: float) -> Dict[str, float]:
+    """Counts rows where two feature columns disagree by more than `atol`."""
+    diff = np.abs(np.asarray(offline, dtype=np.float64) - np.asarray(online, dtype=np.float64))
+    mismatches = int(np.count_nonzero(diff > atol))
+    return {
+        "feature": name,
+        "mismatches": mismatches,
+        "mismatch_rate": mismatches / len(diff) if len(diff) else 0.0,
+        "max_abs_diff": float(diff.max()) if len(diff) else 0.0,
+    }
+
+def check_consistency(df: pd.DataFrame, fe: FeatureEngineer, fast_path: FastFeaturePath,
+                      order_by: str = 'purchase_time', chunk_size: int = 100_000, atol: float = 1e-9,
+                      max_events_per_user: Optional[int] = None, n_workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Compares offline features from `FeatureEngineer.transform` with the online serving path.
+
+    Online features are the replayed FeatureStore velocity encoded by the
+    serving FastFeaturePath. Encoding runs in row chunks to bound memory. When
+    `df` comes from the inference log, the velocity that was actually served
+    is compared with the replay too.
+
+    Returns:
+        pd.DataFrame: One row per feature with mismatch counts, rate and largest
+        absolute difference, worst first. `raw_velocity` compares counts before
+        scaling and `served_velocity` the logged counts.
+    """
+    df = df.reset_index(drop=True)
+    offline_velocity = fe.calculate_velocity(df)[VELOCITY_COL].to_numpy()
+    online_velocity = replay_online_velocity(df, order_by, max_events_per_user=max_events_per_user,
+                                             n_workers=n_workers)
+
+    rows: List[Dict[str, float]] = [_compare("raw_velocity", offline_velocity, online_velocity, atol)]
+    if VELOCITY_COL in df.columns:
+        rows.append(_compare("served_velocity", df[VELOCITY_COL].to_numpy(), online_velocity, atol))
+
+    totals = np.zeros(fast_path.n_features, dtype=np.int64)
+    max_diff = np.zeros(fast_path.n_features)
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size].drop(columns=[VELOCITY_COL, 'country'], errors='ignore')
+        offline = fe.transform(chunk.copy(), velocity_override=offline_velocity[start:start + chunk_size])
+        online = fast_path.transform_batch(chunk.copy(), online_velocity[start:start + chunk_size])
+        diff = np.abs(offline[fast_path.feature_names].to_numpy(dtype=np.float64) - online)
+        totals += np.count_nonzero(diff > atol, axis=0)
+        max_diff = np.maximum(max_diff, diff.max(axis=0, initial=0.0))
+    for name, mismatches, largest in zip(fast_path.feature_names, totals, max_diff):
+        rows.append({
+            "feature": name,
+            "mismatches": int(mismatches),
+            "mismatch_rate": mismatches / len(df) if len(df) else 0.0,
+            "max_abs_diff": float(largest),
+        })
+    report = pd.DataFrame(rows)
+    return report.sort_values(['mismatches', 'max_abs_diff'], ascending=False, kind='stable').reset_index(drop=True)
+
+def training_set_from_logs(logs: pd.DataFrame, labels: pd.DataFrame, fast_path: FastFeaturePath) -> pd.DataFrame:
+    """
+    Builds a labelled training set from inference logs with the serving encoder.
+
+    Features are encoded from the logged raw fields and the velocity that was
+    actually served, so a model retrained on them sees exactly what it will
+    see in production.
+
+    Args:
+        logs (pd.DataFrame): Inference log rows with the served `tx_count_last_24h`.
+        labels (pd.DataFrame): `user_id`, `purchase_time` and `class` of known outcomes.
+        fast_path (FastFeaturePath): Serving encoder.
+
+    Returns:
+        pd.DataFrame: Encoded features in the model's column order, plus `class`.
+    """
+    if VELOCITY_COL not in logs.columns:
+        raise ValueError(f"Inference logs have no {VELOCITY_COL} column; they predate velocity logging")
+    logs = normalize_timestamps(logs).drop_duplicates(TRANSACTION_KEY, keep='last')
+    labels = normalize_timestamps(labels[TRANSACTION_KEY + ['class']])
+    data = logs.merge(labels, on=TRANSACTION_KEY, how='inner')
+    X = fast_path.transform_batch(data.drop(columns=['country'], errors='ignore'), data[VELOCITY_COL].to_numpy())
+    training = pd.DataFrame(X, columns=fast_path.feature_names)
+    training['class'] = data['class'].to_numpy()
+    return training
+
+def normalize_timestamps(df: pd.DataFrame) -> pd.DataFrame:
+    """Parses timestamp columns, which CSV logs and raw files store as strings."""
+    df = df.copy()
+    for col in ('signup_time', 'purchase_time'):
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+    return df
+
+def load_serving_path(config: Config, fe: FeatureEngineer) -> FastFeaturePath:
+    """Returns the latest bundle's encoder, or one compiled from `fe` if no bundle exists."""
+    from src.models.bundle import latest_bundle, load_bundle
+    path = latest_bundle(config.MODEL_BUNDLE_DIR)
+    return load_bundle(path).fast_path if path else FastFeaturePath(fe)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline/online feature consistency tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    check = commands.add_parser("check", help="Compare offline and online features")
+    check.add_argument("--source", choices=["raw", "logs"], default="raw")
+    check.add_argument("--workers", type=int, default=None)
+    export = commands.add_parser("export-training", help="Build a training set from inference logs")
+    export.add_argument("--labels", required=True, help="CSV or Parquet with user_id, purchase_time and class")
+    export.add_argument("--output", required=True, help="Parquet file to write")
+    args = parser.parse_args()
+
+    config = Config()
+    fe = joblib.load(config.FEATURE_ENGINEER_PATH)
+    fast_path = load_serving_path(config, fe)
+    if args.command == "check":
+        if args.source == "raw":
+            from src.data.loader import DataLoader
+            data, order_by = DataLoader(config).load_fraud_data(), 'purchase_time'
+        else:
+            data = read_inference_logs(config.INFERENCE_LOG_DIR)
+            order_by = 'logged_at' if 'logged_at' in data.columns else 'purchase_time'
+        report = check_consistency(normalize_timestamps(data), fe, fast_path, order_by=order_by,
+                                   max_events_per_user=config.FEATURE_STORE_MAX_EVENTS_PER_USER,
+                                   n_workers=args.workers)
+        print(report.head(20).to_string(index=False))
+    else:
+        read = pd.read_parquet if args.labels.endswith(".parquet") else pd.read_csv
+        training = training_set_from_logs(read_inference_logs(config.INFERENCE_LOG_DIR), read(args.labels), fast_path)
+        training.to_parquet(args.output)
+        print(f"Wrote {len(training)} labelled rows to {args.output}")
@@ -1,8 +1,15 @@
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from typing import List, Tuple, Optional
+from datetime import timedelta
+from typing import Dict, List, Tuple, Optional, Union
 from src.utils.config import Config
+from src.features.ip_index import IpCountryIndex, UNKNOWN_COUNTRY
+from src.features.windows import ENTITIES, WINDOWS, rolling_window_aggregates, window_feature_name
+
+# Model input columns, in the order the scaler and encoder were fitted
+NUM_COLS = ['purchase_value', 'age', 'time_since_signup_hours', 'tx_count_last_24h']
+CAT_COLS = ['source', 'browser', 'sex', 'country', 'hour_of_day', 'day_of_week']
 
 class FeatureEngineer:
     """Handles feature engineering, scaling, and encoding for fraud detection."""
@@ -13,20 +20,24 @@ class FeatureEngineer:
         self.scaler = StandardScaler()
         self.encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
         self.ip_map: Optional[pd.DataFrame] = None
+        self.ip_index: Optional[IpCountryIndex] = None
+
+    def __setstate__(self, state: dict) -> None:
+        """Restores a pickled engineer, building the IP index for older artifacts."""
+        self.__dict__.update(state)
+        if self.__dict__.get('ip_index') is None:
+            self.ip_index = IpCountryIndex.from_frame(self.ip_map) if self.ip_map is not None else None
 
     def fit_ip_map(self, ip_map: pd.DataFrame) -> None:
-        """Sets the IP-to-country mapping dataframe."""
+        """Sets the IP-to-country mapping dataframe and builds its interval index."""
         self.ip_map = ip_map
+        self.ip_index = IpCountryIndex.from_frame(ip_map)
 
     def get_country(self, ip: int) -> str:
         """Maps an integer IP address to a country string."""
-        if self.ip_map is None:
-            return "Unknown"
-        match = self.ip_map[
-            (self.ip_map['lower_bound_ip_address'] <= ip) &
-            (self.ip_map['upper_bound_ip_address'] >= ip)
-        ]
-        return str(match['country'].iloc[0]) if not match.empty else "Unknown"
+        if self.ip_index is None:
+            return UNKNOWN_COUNTRY
+        return self.ip_index.lookup(ip)
 
     def engineer_time_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """Creates time-based features from signup and purchase timestamps."""
@@ -39,26 +50,50 @@ class FeatureEngineer:
         return df
 
     def calculate_velocity(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Calculates transaction count for each user in the last 24 hours."""
-        df_sorted = df.sort_values(['user_id', 'purchase_time']).reset_index(drop=True)
-        df_indexed = df_sorted.set_index('purchase_time')
-        
-        velocity_series = df_indexed.groupby('user_id', group_keys=False).apply(
-            lambda group: group['user_id'].rolling(
-                window='24h',
-                min_periods=1,
-                closed='both'
-            ).count()
-        ).reset_index(drop=True)
-        
-        df_sorted['tx_count_last_24h'] = velocity_series
-        return df_sorted
+        """
+        Calculates transaction count for each user in the last 24 hours.
+
+        Counts are inclusive of both window ends, like a 24h rolling count with
+        closed='both', and only include the user's transactions up to each row.
+        Rows keep their original order and index.
+        """
+        counts, _ = rolling_window_aggregates(
+            df['user_id'].to_numpy(), df['purchase_time'], timedelta(hours=24), closed='both'
+        )
+        df = df.copy()
+        df['tx_count_last_24h'] = counts.astype(np.float64)
+        return df
+
+    def calculate_window_features(self, df: pd.DataFrame, entities: Tuple[str, ...] = ENTITIES,
+                                  windows: Optional[Dict[str, timedelta]] = None) -> pd.DataFrame:
+        """
+        Adds transaction counts and purchase_value sums per entity and time window.
+
+        Windows are (t - window, t] and only count transactions up to each row, matching
+        `MultiWindowFeatureStore` replaying the same events in purchase-time order.
+        Rows keep their original order and index.
+        """
+        windows = WINDOWS if windows is None else windows
+        df = df.copy()
+        for entity in entities:
+            for name, window in windows.items():
+                counts, sums = rolling_window_aggregates(
+                    df[entity].to_numpy(), df['purchase_time'], window, values=df['purchase_value'].to_numpy()
+                )
+                df[window_feature_name(entity, 'count', name)] = counts
+                df[window_feature_name(entity, 'sum', name)] = sums
+        return df
+
+    def transform(self, df: pd.DataFrame, is_training: bool = False, velocity_override: Optional[Union[int, np.ndarray]] = None) -> pd.DataFrame:
+        """
+        Applies the full transformation pipeline to the input dataframe.
 
-    def transform(self, df: pd.DataFrame, is_training: bool = False, velocity_override: Optional[int] = None) -> pd.DataFrame:
-        """Applies the full transformation pipeline to the input dataframe."""
+        `velocity_override` replaces the offline velocity calculation with online
+        counts, either a single value or one value per row.
+        """
         # 1. Add country
-        if 'country' not in df.columns and self.ip_map is not None:
-            df['country'] = df['ip_address'].apply(self.get_country)
+        if 'country' not in df.columns and self.ip_index is not None:
+            df['country'] = self.ip_index.lookup_many(df['ip_address'].to_numpy())
         
         # 2. Time features
         df = self.engineer_time_features(df)
@@ -70,14 +105,14 @@ class FeatureEngineer:
             df = self.calculate_velocity(df)
         
         # 4. Scaling
-        num_cols = ['purchase_value', 'age', 'time_since_signup_hours', 'tx_count_last_24h']
+        num_cols = NUM_COLS
         if is_training:
             df[num_cols] = self.scaler.fit_transform(df[num_cols])
         else:
             df[num_cols] = self.scaler.transform(df[num_cols])
             
         # 5. Encoding
-        cat_cols = ['source', 'browser', 'sex', 'country', 'hour_of_day', 'day_of_week']
+        cat_cols = CAT_COLS
         if is_training:
             encoded_cats = self.encoder.fit_transform(df[cat_cols])
         else:
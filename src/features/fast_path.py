@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Union
+from src.features.engineering import FeatureEngineer, NUM_COLS, CAT_COLS
+from src.features.ip_index import IpCountryIndex, UNKNOWN_COUNTRY
+
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+def parse_timestamp(value: Union[str, datetime]) -> datetime:
+    """Parses an ISO-8601 timestamp, falling back to pandas for other formats."""
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return pd.Timestamp(value).to_pydatetime()
+
+class FastFeaturePath:
+    """
+    Compiled version of a fitted FeatureEngineer for serving.
+
+    Scaler statistics and the one-hot column of every known category are
+    extracted once, so encoding a transaction is a handful of dict lookups
+    and float operations written straight into a NumPy row, with no pandas
+    or sklearn calls. Output matches `FeatureEngineer.transform` exactly.
+    The compiled parameters are plain JSON-friendly values (see `to_params`),
+    so a fast path can also be rebuilt without unpickling the engineer.
+    """
+
+    def __init__(self, fe: FeatureEngineer, feature_names: Optional[Sequence[str]] = None):
+        """
+        Compiles the fast path from a fitted FeatureEngineer.
+
+        Args:
+            fe (FeatureEngineer): Engineer with a fitted scaler and encoder.
+            feature_names (Optional[Sequence[str]]): Column order expected by the
+                model. Defaults to the order produced by `transform`.
+        """
+        if getattr(fe.encoder, 'drop_idx_', None) is not None:
+            raise ValueError("FastFeaturePath does not support OneHotEncoder with drop")
+        scaler = fe.scaler
+        params = {
+            "num_mean": [float(m) for m in scaler.mean_] if scaler.with_mean else [0.0] * len(NUM_COLS),
+            "num_scale": [float(s) for s in scaler.scale_] if scaler.with_std else [1.0] * len(NUM_COLS),
+            "categories": [categories.tolist() for categories in fe.encoder.categories_],
+            "feature_names": list(feature_names) if feature_names is not None else None,
+        }
+        self._compile(params, fe.ip_index)
+
+    @classmethod
+    def from_params(cls, params: Dict[str, Any], ip_index: Optional[IpCountryIndex]) -> "FastFeaturePath":
+        """Rebuilds a fast path from `to_params` output and an IP index."""
+        fast_path = cls.__new__(cls)
+        fast_path._compile(params, ip_index)
+        return fast_path
+
+    def to_params(self) -> Dict[str, Any]:
+        """Returns the compiled scaler, encoder and column-order parameters."""
+        return {
+            "num_mean": self.num_mean,
+            "num_scale": self.num_scale,
+            "categories": self.categories,
+            "feature_names": self.feature_names,
+        }
+
+    def _compile(self, params: Dict[str, Any], ip_index: Optional[IpCountryIndex]) -> None:
+        """Builds the column lookup tables from scaler and encoder parameters."""
+        self.ip_index = ip_index
+        self.num_mean: List[float] = list(params["num_mean"])
+        self.num_scale: List[float] = list(params["num_scale"])
+        self.categories: List[List[Any]] = [list(c) for c in params["categories"]]
+
+        # Same names as OneHotEncoder.get_feature_names_out
+        default_names = list(NUM_COLS) + [
+            f"{col}_{category}" for col, categories in zip(CAT_COLS, self.categories) for category in categories
+        ]
+        feature_names = params.get("feature_names") or default_names
+        if sorted(feature_names) != sorted(default_names):
+            raise ValueError("Model feature names do not match the FeatureEngineer output")
+        position = {name: i for i, name in enumerate(feature_names)}
+        self.feature_names: List[str] = list(feature_names)
+        self.n_features = len(feature_names)
+        self.num_index = [position[col] for col in NUM_COLS]
+
+        # Map category value -> output column, one dict per categorical feature
+        encoded_names = iter(default_names[len(NUM_COLS):])
+        self.cat_index: List[Dict[Any, int]] = [
+            {category: position[next(encoded_names)] for category in categories}
+            for categories in self.categories
+        ]
+
+    def get_country(self, ip: Union[int, float]) -> str:
+        """Maps an IP address to a country with the compiled interval index."""
+        return self.ip_index.lookup(ip) if self.ip_index is not None else UNKNOWN_COUNTRY
+
+    def transform_one(self, tx: Mapping[str, Any], velocity: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Encodes a single raw transaction into a model-ready feature row.
+
+        Args:
+            tx (Mapping): Raw transaction fields; timestamps may be strings or datetimes.
+            velocity (int): Online transaction count for the velocity feature.
+            out (Optional[np.ndarray]): Preallocated (1, n_features) float64 row to fill.
+
+        Returns:
+            np.ndarray: Feature row of shape (1, n_features).
+        """
+        if out is None:
+            out = np.zeros((1, self.n_features), dtype=np.float64)
+        else:
+            out.fill(0.0)
+        row = out[0]
+
+        signup_time = parse_timestamp(tx['signup_time'])
+        purchase_time = parse_timestamp(tx['purchase_time'])
+        # Same rounding as pandas' total_seconds on a microsecond-resolution delta
+        since_signup = ((purchase_time - signup_time) // _ONE_MICROSECOND) / 1e6 / 3600
+
+        values = (tx['purchase_value'], tx['age'], since_signup, velocity)
+        for idx, value, mean, scale in zip(self.num_index, values, self.num_mean, self.num_scale):
+            row[idx] = (float(value) - mean) / scale
+
+        country = tx['country'] if 'country' in tx else self.get_country(tx['ip_address'])
+        categories = (
+            tx['source'], tx['browser'], tx['sex'], country,
+            purchase_time.hour, purchase_time.weekday()
+        )
+        for lookup, category in zip(self.cat_index, categories):
+            idx = lookup.get(category)
+            if idx is not None:  # Unknown categories encode as all zeros
+                row[idx] = 1.0
+        return out
+
+    def transform_batch(self, data: pd.DataFrame, velocities: np.ndarray) -> np.ndarray:
+        """
+        Encodes a dataframe of raw transactions in one vectorized pass.
+
+        Args:
+            data (pd.DataFrame): Raw transactions with datetime `signup_time` and `purchase_time`.
+                A `country` column is added when missing, as `FeatureEngineer.transform` does.
+            velocities (np.ndarray): Online transaction count per row.
+
+        Returns:
+            np.ndarray: Feature matrix of shape (len(data), n_features).
+        """
+        n = len(data)
+        X = np.zeros((n, self.n_features), dtype=np.float64)
+        since_signup = (data['purchase_time'] - data['signup_time']).dt.total_seconds() / 3600
+        values = (data['purchase_value'], data['age'], since_signup, velocities)
+        for idx, column, mean, scale in zip(self.num_index, values, self.num_mean, self.num_scale):
+            X[:, idx] = (np.asarray(column, dtype=np.float64) - mean) / scale
+
+        if 'country' not in data.columns:
+            data['country'] = (
+                self.ip_index.lookup_many(data['ip_address'].to_numpy())
+                if self.ip_index is not None else UNKNOWN_COUNTRY
+            )
+        columns = (
+            data['source'], data['browser'], data['sex'], data['country'],
+            data['purchase_time'].dt.hour, data['purchase_time'].dt.dayofweek
+        )
+        rows = np.arange(n)
+        for lookup, column in zip(self.cat_index, columns):
+            idx = pd.Series(np.asarray(column, dtype=object)).map(lookup).to_numpy(dtype=np.float64)
+            known = ~np.isnan(idx)  # Unknown categories encode as all zeros
+            X[rows[known], idx[known].astype(np.int64)] = 1.0
+        return X
@@ -1,40 +1,404 @@
-from datetime import datetime, timedelta
-from typing import Dict, List
+import gc
+import sys
+import threading
+import time
+from bisect import bisect_right, insort
+from collections import OrderedDict, deque
+from itertools import chain, repeat
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional, Sequence, Tuple
+import numpy as np
+from src.features.windows import ENTITIES, WINDOWS, window_feature_name
+
+_EPOCH = datetime(1970, 1, 1)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+def to_epoch_us(ts: datetime) -> int:
+    """Converts a naive (assumed UTC) or timezone-aware datetime to epoch microseconds."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return (ts - _EPOCH) // _ONE_MICROSECOND
 
 class FeatureStore:
-    """A lightweight, in-memory feature store for real-time velocity tracking."""
-    
-    def __init__(self, window_hours: int = 24):
-        """Initializes the FeatureStore with a specific time window for velocity."""
+    """
+    A lightweight, in-memory feature store for real-time velocity tracking.
+
+    Each user's transaction times are kept as epoch-microsecond integers in a
+    time-ordered deque, so expired events are popped from the head in O(1)
+    amortized time. Users are kept in least-recently-active order, which lets
+    idle users be evicted entirely and bounds the number of tracked users.
+
+    Idle eviction is driven by a watermark, the newest event time seen so far
+    clamped to the server clock plus `max_future_skew`, rather than by the
+    event being inserted. A single far-future timestamp therefore only
+    affects its own user instead of expiring everyone else's history.
+    """
+
+    def __init__(self, window_hours: int = 24, max_users: Optional[int] = None,
+                 max_events_per_user: Optional[int] = None, max_future_skew: Optional[float] = 300.0,
+                 clock: Callable[[], float] = time.time):
+        """
+        Initializes the FeatureStore with a specific time window for velocity.
+
+        Args:
+            window_hours (int): Length of the rolling velocity window.
+            max_users (Optional[int]): Cap on tracked users; the least recently
+                active user is evicted when it is exceeded.
+            max_events_per_user (Optional[int]): Cap on timestamps kept per user;
+                velocities saturate at this value.
+            max_future_skew (Optional[float]): Seconds the eviction watermark may run
+                ahead of `clock`; None trusts event times unclamped.
+            clock (Callable): Wall-clock time source in epoch seconds, replaceable in tests.
+        """
         self.window_hours = window_hours
-        # Cache for transaction timestamps per user
-        self.user_tx_history: Dict[int, List[datetime]] = {}
+        self.window_us = int(window_hours * 3600 * 1e6)
+        self.max_users = max_users
+        self.max_events_per_user = max_events_per_user
+        self.max_future_skew = max_future_skew
+        self.clock = clock
+        # Newest accepted event time, clamped to the server clock; drives idle eviction
+        self.watermark_us = 0
+        # Transaction timestamps per user, least recently active first
+        self.user_tx_history: "OrderedDict[int, Deque[int]]" = OrderedDict()
+        # Serializes updates from API threads with snapshot exports
+        self.lock = threading.Lock()
+        self._reset_counters()
+
+    def _reset_counters(self) -> None:
+        """Zeroes the memory and throughput counters."""
+        self.n_events = 0
+        self.n_updates = 0
+        self.n_expired_events = 0
+        self.n_dropped_events = 0
+        self.n_idle_evictions = 0
+        self.n_capacity_evictions = 0
+        self.update_seconds = 0.0
 
     def update_and_get_velocity(self, user_id: int, current_time: datetime) -> int:
         """
         Adds a new transaction timestamp and returns the count within the window.
-        
+
         Args:
             user_id (int): The ID of the user performing the transaction.
             current_time (datetime): The timestamp of the current transaction.
-            
+
         Returns:
             int: The number of transactions for this user within the rolling window.
         """
-        if user_id not in self.user_tx_history:
-            self.user_tx_history[user_id] = []
-        
-        # Add current transaction
-        self.user_tx_history[user_id].append(current_time)
-        
+        start = time.perf_counter()
+        now_us = to_epoch_us(current_time)
+        with self.lock:
+            velocity = self._update(user_id, now_us)
+        self.n_updates += 1
+        self.update_seconds += time.perf_counter() - start
+        return velocity
+
+    def _advance_watermark(self, now_us: int) -> int:
+        """Moves the watermark up to `now_us`, but no further than the clock plus the allowed skew."""
+        if self.max_future_skew is not None:
+            now_us = min(now_us, int((self.clock() + self.max_future_skew) * 1e6))
+        if now_us > self.watermark_us:
+            self.watermark_us = now_us
+        return self.watermark_us
+
+    def _update(self, user_id: int, now_us: int) -> int:
+        """Inserts one event and expires old ones; the caller holds `lock`."""
+        cutoff = now_us - self.window_us
+        history = self.user_tx_history.get(user_id)
+        if history is None:
+            history = deque(maxlen=self.max_events_per_user)
+            self.user_tx_history[user_id] = history
+        else:
+            self.user_tx_history.move_to_end(user_id)
+
+        # Add current transaction, keeping the deque sorted for late arrivals
+        if history.maxlen is not None and len(history) == history.maxlen:
+            history.popleft()
+            self.n_dropped_events += 1
+            self.n_events -= 1
+        if not history or now_us >= history[-1]:
+            history.append(now_us)
+        else:
+            insort(history, now_us)
+        self.n_events += 1
+
         # Clean up old timestamps
-        cutoff = current_time - timedelta(hours=self.window_hours)
-        self.user_tx_history[user_id] = [
-            ts for ts in self.user_tx_history[user_id] if ts > cutoff
-        ]
-        
-        return len(self.user_tx_history[user_id])
+        while history[0] <= cutoff:
+            history.popleft()
+            self.n_expired_events += 1
+            self.n_events -= 1
+        velocity = len(history)
+
+        self._evict(self._advance_watermark(now_us) - self.window_us)
+        return velocity
+
+    def update_many(self, user_ids: Sequence[int], times: Sequence[datetime]) -> List[int]:
+        """Applies `update_and_get_velocity` to each transaction in order and returns the velocities."""
+        return [self.update_and_get_velocity(user_id, ts) for user_id, ts in zip(user_ids, times)]
+
+    def get_velocity(self, user_id: int, current_time: datetime) -> int:
+        """Counts the user's stored transactions in the window ending at `current_time`, without adding one."""
+        history = self.user_tx_history.get(user_id)
+        if not history:
+            return 0
+        now_us = to_epoch_us(current_time)
+        return bisect_right(history, now_us) - bisect_right(history, now_us - self.window_us)
+
+    def _evict(self, cutoff: int) -> None:
+        """Drops idle users whose newest event has left the window, then enforces max_users."""
+        users = self.user_tx_history
+        while users:
+            user_id, history = next(iter(users.items()))
+            if history[-1] > cutoff:
+                break
+            users.popitem(last=False)
+            self.n_events -= len(history)
+            self.n_expired_events += len(history)
+            self.n_idle_evictions += 1
+        while self.max_users is not None and len(users) > self.max_users:
+            _, history = users.popitem(last=False)
+            self.n_events -= len(history)
+            self.n_capacity_evictions += 1
+
+    def memory_bytes(self) -> int:
+        """Estimates the memory held by the store's containers and timestamps."""
+        total = sys.getsizeof(self.user_tx_history)
+        for user_id, history in self.user_tx_history.items():
+            total += sys.getsizeof(user_id) + sys.getsizeof(history)
+            total += sum(sys.getsizeof(ts) for ts in history)
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns footprint and throughput counters for the store.
+
+        Note that `memory_bytes` walks every stored timestamp.
+        """
+        return {
+            "users": len(self.user_tx_history),
+            "events": self.n_events,
+            "updates": self.n_updates,
+            "expired_events": self.n_expired_events,
+            "dropped_events": self.n_dropped_events,
+            "idle_evictions": self.n_idle_evictions,
+            "capacity_evictions": self.n_capacity_evictions,
+            "memory_bytes": self.memory_bytes(),
+            "avg_update_us": self.update_seconds / self.n_updates * 1e6 if self.n_updates else 0.0,
+        }
 
     def reset(self) -> None:
         """Clears all historical transaction data from the store."""
-        self.user_tx_history = {}
+        with self.lock:
+            self.user_tx_history = OrderedDict()
+            self.watermark_us = 0
+            self._reset_counters()
+
+    def export_arrays(self, chunk_size: int = 10_000) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Copies the store into columnar arrays, least recently active user first.
+
+        The lock is taken once per chunk of users rather than for the whole copy,
+        so updates are never blocked for long. Users evicted mid-copy are skipped.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: User ids, events per user and
+            the concatenated epoch-microsecond timestamps.
+        """
+        with self.lock:
+            user_ids = list(self.user_tx_history)
+        counts: List[np.ndarray] = []
+        times: List[np.ndarray] = []
+        for i in range(0, len(user_ids), chunk_size):
+            with self.lock:
+                # Users evicted since the id list was taken come back empty and are dropped below
+                histories = list(map(self.user_tx_history.get, user_ids[i:i + chunk_size], repeat(())))
+                chunk_counts = np.fromiter(map(len, histories), dtype=np.int64, count=len(histories))
+                times.append(np.fromiter(chain.from_iterable(histories), dtype=np.int64,
+                                         count=int(chunk_counts.sum())))
+            counts.append(chunk_counts)
+        counts_array = np.concatenate(counts) if counts else np.empty(0, dtype=np.int64)
+        kept = counts_array > 0
+        return (
+            np.array(user_ids, dtype=np.int64)[kept],
+            counts_array[kept],
+            np.concatenate(times) if times else np.empty(0, dtype=np.int64)
+        )
+
+    def load_arrays(self, user_ids: np.ndarray, counts: np.ndarray, times: np.ndarray) -> None:
+        """Replaces the store's contents with arrays produced by `export_arrays`."""
+        bounds = np.concatenate([[0], np.cumsum(counts)]).tolist()
+        times = times.tolist()
+        gc_was_enabled = gc.isenabled()
+        gc.disable()  # Building millions of deques would otherwise trigger repeated collections
+        try:
+            users = OrderedDict(zip(
+                user_ids.tolist(),
+                map(deque, map(times.__getitem__, map(slice, bounds[:-1], bounds[1:])),
+                    repeat(self.max_events_per_user))
+            ))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        with self.lock:
+            self.user_tx_history = users
+            self.n_events = int(counts.sum())
+            self.watermark_us = 0
+            if len(times):
+                self._advance_watermark(max(times))
+
+
+class _EventLog:
+    """Time-ordered events of one entity, shared by all of its windows."""
+
+    __slots__ = ('times', 'values', 'heads', 'sums')
+
+    def __init__(self, n_windows: int):
+        self.times: List[int] = []
+        self.values: List[float] = []
+        # Index of the first event inside each window, and the window's running sum
+        self.heads = [0] * n_windows
+        self.sums = [0.0] * n_windows
+
+class MultiWindowFeatureStore:
+    """
+    In-memory store of transaction counts and purchase_value sums per (entity, window).
+
+    Every entity value (a user, device or IP) keeps one time-ordered log of its
+    events. Each window only holds a head index into that log and a running sum,
+    so adding a window costs two numbers per entity instead of another copy of
+    the timestamps. Events older than the longest window are trimmed from the log.
+    Idle values are evicted against the same clamped watermark as `FeatureStore`.
+    """
+
+    def __init__(self, entities: Tuple[str, ...] = ENTITIES,
+                 windows: Optional[Dict[str, timedelta]] = None,
+                 max_keys_per_entity: Optional[int] = None, max_future_skew: Optional[float] = 300.0,
+                 clock: Callable[[], float] = time.time):
+        """
+        Initializes the store for the given entity columns and windows.
+
+        Args:
+            entities (Tuple[str, ...]): Transaction fields to aggregate by.
+            windows (Optional[Dict[str, timedelta]]): Named window lengths, defaults to WINDOWS.
+            max_keys_per_entity (Optional[int]): Cap on tracked values per entity; the
+                least recently active value is evicted when it is exceeded.
+            max_future_skew (Optional[float]): Seconds the eviction watermark may run
+                ahead of `clock`; None trusts event times unclamped.
+            clock (Callable): Wall-clock time source in epoch seconds, replaceable in tests.
+        """
+        windows = WINDOWS if windows is None else windows
+        self.entities = entities
+        # Shortest window first; the last one bounds how long events are kept
+        self.window_names = sorted(windows, key=lambda name: windows[name])
+        self.window_us = [windows[name] // _ONE_MICROSECOND for name in self.window_names]
+        self.max_keys_per_entity = max_keys_per_entity
+        self.max_future_skew = max_future_skew
+        self.clock = clock
+        self.watermark_us = 0
+        self.logs: Dict[str, "OrderedDict[Any, _EventLog]"] = {entity: OrderedDict() for entity in entities}
+        self.feature_names = [
+            window_feature_name(entity, kind, name)
+            for entity in entities for name in self.window_names for kind in ('count', 'sum')
+        ]
+
+    def update_and_get_features(self, tx: Mapping[str, Any], current_time: datetime) -> Dict[str, float]:
+        """
+        Adds a transaction to every entity log and returns its windowed features.
+
+        Args:
+            tx (Mapping): Transaction with the entity fields and purchase_value.
+            current_time (datetime): The timestamp of the current transaction.
+
+        Returns:
+            Dict[str, float]: Count and sum per entity and window, including this transaction.
+        """
+        now_us = to_epoch_us(current_time)
+        value = float(tx['purchase_value'])
+        features: Dict[str, float] = {}
+        watermark_us = now_us
+        if self.max_future_skew is not None:
+            watermark_us = min(watermark_us, int((self.clock() + self.max_future_skew) * 1e6))
+        self.watermark_us = max(self.watermark_us, watermark_us)
+        for entity in self.entities:
+            logs = self.logs[entity]
+            key = tx[entity]
+            log = logs.get(key)
+            if log is None:
+                log = _EventLog(len(self.window_us))
+                logs[key] = log
+            else:
+                logs.move_to_end(key)
+
+            if not log.times or now_us >= log.times[-1]:
+                self._append(log, now_us, value)
+                for name, head, total in zip(self.window_names, log.heads, log.sums):
+                    features[window_feature_name(entity, 'count', name)] = len(log.times) - head
+                    features[window_feature_name(entity, 'sum', name)] = total
+            else:
+                self._insert_late(log, now_us, value, entity, features)
+            self._evict(logs, self.watermark_us - self.window_us[-1])
+        return features
+
+    def _append(self, log: _EventLog, now_us: int, value: float) -> None:
+        """Appends an in-order event and slides every window head past expired events."""
+        times, values = log.times, log.values
+        times.append(now_us)
+        values.append(value)
+        for w, window_us in enumerate(self.window_us):
+            cutoff = now_us - window_us
+            head, total = log.heads[w], log.sums[w] + value
+            while times[head] <= cutoff:
+                total -= values[head]
+                head += 1
+            log.heads[w] = head
+            # Reset exactly when only the new event remains, so float error cannot accumulate
+            log.sums[w] = value if head == len(times) - 1 else total
+
+        # Compact events that fell out of the longest window
+        start = log.heads[-1]
+        if start > 32 and start * 2 > len(times):
+            del times[:start]
+            del values[:start]
+            log.heads = [head - start for head in log.heads]
+
+    def _insert_late(self, log: _EventLog, now_us: int, value: float, entity: str,
+                     features: Dict[str, float]) -> None:
+        """Inserts an out-of-order event and answers it by binary search over the log."""
+        times, values = log.times, log.values
+        pos = bisect_right(times, now_us)
+        times.insert(pos, now_us)
+        values.insert(pos, value)
+        latest = times[-1]
+        for w, (name, window_us) in enumerate(zip(self.window_names, self.window_us)):
+            lo = bisect_right(times, now_us - window_us)
+            features[window_feature_name(entity, 'count', name)] = pos + 1 - lo
+            features[window_feature_name(entity, 'sum', name)] = sum(values[lo:pos + 1])
+            # Rebuild the window relative to the newest event in the log
+            head = bisect_right(times, latest - window_us)
+            log.heads[w] = head
+            log.sums[w] = sum(values[head:])
+
+    def _evict(self, logs: "OrderedDict[Any, _EventLog]", cutoff: int) -> None:
+        """Drops entity values idle for longer than the longest window, then enforces the cap."""
+        while logs:
+            log = next(iter(logs.values()))
+            if log.times[-1] > cutoff:
+                break
+            logs.popitem(last=False)
+        while self.max_keys_per_entity is not None and len(logs) > self.max_keys_per_entity:
+            logs.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the number of tracked keys and live events per entity."""
+        return {
+            entity: {
+                "keys": len(logs),
+                "events": sum(len(log.times) - log.heads[-1] for log in logs.values())
+            }
+            for entity, logs in self.logs.items()
+        }
+
+    def reset(self) -> None:
+        """Clears all entity logs."""
+        self.logs = {entity: OrderedDict() for entity in self.entities}
+        self.watermark_us = 0
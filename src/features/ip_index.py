@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+from typing import Union
+
+UNKNOWN_COUNTRY = "Unknown"
+
+class IpCountryIndex:
+    """Array-backed interval index for mapping integer IP addresses to countries."""
+
+    def __init__(self, lower: np.ndarray, upper: np.ndarray, countries: np.ndarray):
+        """
+        Initializes the index from bound and country arrays sorted by lower bound.
+
+        Args:
+            lower (np.ndarray): Sorted lower bounds of each IP range (inclusive).
+            upper (np.ndarray): Upper bounds of each IP range (inclusive).
+            countries (np.ndarray): Country name for each range.
+        """
+        self.lower = lower
+        self.upper = upper
+        self.countries = countries
+
+    @classmethod
+    def from_frame(cls, ip_map: pd.DataFrame) -> "IpCountryIndex":
+        """
+        Builds the index from an IP-to-country mapping dataframe.
+
+        Ranges are assumed not to overlap, as in IpAddress_to_Country.csv.
+        A stable sort keeps the first listed range on equal lower bounds.
+        """
+        lower = ip_map['lower_bound_ip_address'].to_numpy(dtype=np.float64)
+        order = np.argsort(lower, kind='stable')
+        upper = ip_map['upper_bound_ip_address'].to_numpy(dtype=np.float64)
+        countries = ip_map['country'].astype(str).to_numpy(dtype=object)
+        return cls(
+            np.ascontiguousarray(lower[order]),
+            np.ascontiguousarray(upper[order]),
+            countries[order]
+        )
+
+    def __len__(self) -> int:
+        return len(self.lower)
+
+    def lookup(self, ip: Union[int, float]) -> str:
+        """Maps a single IP address to a country with an O(log n) binary search."""
+        pos = int(np.searchsorted(self.lower, ip, side='right')) - 1
+        if pos >= 0 and ip <= self.upper[pos]:
+            return self.countries[pos]
+        return UNKNOWN_COUNTRY
+
+    def lookup_many(self, ips: np.ndarray) -> np.ndarray:
+        """
+        Maps an array of IP addresses to countries in one vectorized pass.
+
+        Args:
+            ips (np.ndarray): Integer or float IP addresses.
+
+        Returns:
+            np.ndarray: Object array of country names, "Unknown" for gaps and NaNs.
+        """
+        ips = np.asarray(ips, dtype=np.float64)
+        if len(self.lower) == 0:
+            return np.full(ips.shape, UNKNOWN_COUNTRY, dtype=object)
+        pos = np.searchsorted(self.lower, ips, side='right') - 1
+        safe_pos = np.clip(pos, 0, None)
+        found = (pos >= 0) & (ips <= self.upper[safe_pos])
+        result = np.full(ips.shape, UNKNOWN_COUNTRY, dtype=object)
+        result[found] = self.countries[safe_pos[found]]
+        return result
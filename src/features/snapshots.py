@@ -0,0 +1,186 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+from src.features.feature_store import FeatureStore, to_epoch_us
+from src.utils.inference_log import list_segments, read_segment
+
+# Bump when the snapshot layout changes; older snapshots are then ignored
+SNAPSHOT_VERSION = 1
+REPLAY_COLUMNS = ['user_id', 'purchase_time', 'logged_at']
+
+def write_snapshot(store: FeatureStore, path: str) -> Dict[str, Any]:
+    """
+    Writes the store to an uncompressed `.npz` file, atomically.
+
+    Events that have left the window ending at the store's eviction watermark
+    (the newest event time, clamped to the server clock) are dropped, so the
+    snapshot holds at most one window of history, and the store's user and
+    per-user caps bound its size. A future-dated event cannot push every
+    other user's history out of the snapshot.
+
+    Args:
+        store (FeatureStore): Store to snapshot.
+        path (str): Destination file.
+
+    Returns:
+        Dict: Snapshot metadata, including its size and write time.
+    """
+    started_at = time.time()
+    start = time.perf_counter()
+    user_ids, counts, times = store.export_arrays()
+
+    if len(times):
+        keep = times > store.watermark_us - store.window_us
+        owners = np.repeat(np.arange(len(user_ids)), counts)
+        counts = np.bincount(owners[keep], minlength=len(user_ids))
+        user_ids, counts, times = user_ids[counts > 0], counts[counts > 0], times[keep]
+
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "started_at": started_at,
+        "window_us": store.window_us,
+        "users": int(len(user_ids)),
+        "events": int(len(times)),
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, user_ids=user_ids, counts=counts.astype(np.int32), times=times,
+                 meta=np.array(json.dumps(meta)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    meta["bytes"] = os.path.getsize(path)
+    meta["seconds"] = time.perf_counter() - start
+    return meta
+
+def read_snapshot(path: str) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, Any]]]:
+    """Reads a snapshot, returning None if it is missing or from another layout version."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as arrays:
+        meta = json.loads(str(arrays["meta"]))
+        if meta.get("version") != SNAPSHOT_VERSION:
+            return None
+        return arrays["user_ids"], arrays["counts"].astype(np.int64), arrays["times"], meta
+
+def replay_inference_logs(store: FeatureStore, log_dir: str, since: float) -> int:
+    """
+    Replays transactions logged at or after `since` (epoch seconds) into the store.
+
+    Only segments modified since then are read. Events already present for the
+    user with the same timestamp are skipped, so transactions captured by the
+    snapshot while it was being written are not counted twice.
+
+    Returns:
+        int: Number of replayed transactions.
+    """
+    frames = []
+    for segment in list_segments(log_dir):
+        if os.path.getmtime(segment) < since:
+            continue
+        try:
+            frame = read_segment(segment, REPLAY_COLUMNS)
+        except (KeyError, ValueError):  # Written before logged_at was recorded
+            continue
+        frames.append(frame[frame['logged_at'] >= since])
+    if not frames:
+        return 0
+    events = pd.concat(frames, ignore_index=True).sort_values('logged_at', kind='stable')
+
+    replayed = 0
+    for user_id, purchase_time in zip(events['user_id'].tolist(), pd.to_datetime(events['purchase_time'])):
+        history = store.user_tx_history.get(user_id)
+        if history and to_epoch_us(purchase_time) in history:
+            continue
+        store.update_and_get_velocity(user_id, purchase_time)
+        replayed += 1
+    return replayed
+
+def restore_store(store: FeatureStore, snapshot_path: str, log_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Loads the latest snapshot into the store, then replays the inference log tail after it.
+
+    Without a snapshot, the log tail of the last window is replayed instead.
+
+    Returns:
+        Dict: Restored users, events and replayed transactions, plus the time taken.
+    """
+    start = time.perf_counter()
+    snapshot = read_snapshot(snapshot_path)
+    since = time.time() - store.window_us / 1e6
+    if snapshot is not None:
+        user_ids, counts, times, meta = snapshot
+        store.load_arrays(user_ids, counts, times)
+        since = meta["started_at"]
+    replayed = replay_inference_logs(store, log_dir, since) if log_dir else 0
+    return {
+        "snapshot_loaded": snapshot is not None,
+        "users": len(store.user_tx_history),
+        "events": store.n_events,
+        "replayed": replayed,
+        "seconds": time.perf_counter() - start,
+    }
+
+class SnapshotScheduler:
+    """Writes a FeatureStore snapshot every `interval` seconds on a background thread."""
+
+    def __init__(self, store: FeatureStore, path: str, interval: float = 60.0):
+        """
+        Initializes the scheduler.
+
+        Args:
+            store (FeatureStore): Store to snapshot.
+            path (str): Snapshot file, replaced on every write.
+            interval (float): Seconds between snapshots; 0 disables the thread.
+        """
+        self.store = store
+        self.path = path
+        self.interval = interval
+        self.last_snapshot: Optional[Dict[str, Any]] = None
+        self.n_snapshots = 0
+        self.n_failures = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Starts the background thread."""
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="feature-store-snapshots", daemon=True)
+        self._thread.start()
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """Writes one snapshot now, returning its metadata, or None if it failed."""
+        try:
+            self.last_snapshot = write_snapshot(self.store, self.path)
+            self.n_snapshots += 1
+            return self.last_snapshot
+        except OSError as e:
+            self.n_failures += 1
+            print(f"Warning: Could not write feature store snapshot: {e}")
+            return None
+
+    def stop(self, final_snapshot: bool = True) -> None:
+        """Stops the thread, writing a last snapshot so a graceful restart replays nothing."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if final_snapshot and self.interval > 0:
+            self.snapshot()
+
+    def _run(self) -> None:
+        """Snapshots until stopped."""
+        while not self._stop.wait(self.interval):
+            self.snapshot()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the number of snapshots and the last one's metadata."""
+        return {"snapshots": self.n_snapshots, "failures": self.n_failures, "last": self.last_snapshot}
@@ -0,0 +1,371 @@
+import itertools
+import mmap
+import os
+import threading
+import time
+from bisect import bisect_right
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+import numpy as np
+from src.features.feature_store import FeatureStore, to_epoch_us
+from src.utils.config import Config
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:  # Windows
+    HAS_FCNTL = False
+
+_MAGIC = b"FSSHM001"
+_HEADER = np.dtype([
+    ('magic', 'S8'), ('n_buckets', '<i8'), ('bucket_size', '<i8'),
+    ('max_events', '<i8'), ('window_us', '<i8'), ('reserved', '<i8', 3)
+])
+
+class SharedMemoryFeatureStore:
+    """
+    Velocity store in a memory-mapped file shared by every process on a host.
+
+    The file is a fixed hash table: each user hashes to one bucket of
+    `bucket_size` slots, and each slot holds a user id, an event count and a
+    sorted array of up to `max_events_per_user` epoch-microsecond timestamps.
+    Updates lock only their bucket, with a POSIX byte-range lock across
+    processes and a striped thread lock within one, so workers rarely contend.
+
+    A slot whose newest event has left the window is reused for a new user.
+    When a bucket has no such slot, the user with the oldest newest event is
+    evicted, so `max_users` is a capacity rather than an exact limit.
+    Velocities otherwise match `FeatureStore`.
+    """
+
+    def __init__(self, path: str, window_hours: int = 24, max_users: int = 262_144,
+                 max_events_per_user: int = 64, bucket_size: int = 8, n_thread_locks: int = 64):
+        """
+        Opens the store at `path`, creating and sizing the file if it does not exist.
+
+        Args:
+            path (str): Backing file, ideally on tmpfs such as /dev/shm.
+            window_hours (int): Length of the rolling velocity window.
+            max_users (int): Number of user slots, rounded up to whole buckets.
+            max_events_per_user (int): Timestamps kept per user; velocities saturate at this value.
+            bucket_size (int): Slots per hash bucket.
+            n_thread_locks (int): Thread lock stripes shared by the buckets.
+
+        Raises:
+            RuntimeError: If the platform has no `fcntl` locking.
+            ValueError: If an existing file was created with a different layout.
+        """
+        if not HAS_FCNTL:
+            raise RuntimeError("SharedMemoryFeatureStore requires fcntl (POSIX) file locks")
+        self.path = path
+        self.window_hours = window_hours
+        self.window_us = int(window_hours * 3600 * 1e6)
+        self.bucket_size = bucket_size
+        self.n_buckets = -(-max_users // bucket_size)
+        self.n_slots = self.n_buckets * bucket_size
+        self.max_events_per_user = max_events_per_user
+
+        keys_offset = _HEADER.itemsize
+        counts_offset = keys_offset + 8 * self.n_slots
+        times_offset = counts_offset + 8 * self.n_slots
+        self.size = times_offset + 8 * self.n_slots * max_events_per_user
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, self.size)  # Sparse; pages are allocated on first write
+                header = np.zeros(1, dtype=_HEADER)
+                header[0] = (_MAGIC, self.n_buckets, bucket_size, max_events_per_user, self.window_us, (0, 0, 0))
+                os.pwrite(self._fd, header.tobytes(), 0)
+            header = np.frombuffer(os.pread(self._fd, _HEADER.itemsize, 0), dtype=_HEADER)[0]
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        expected = (_MAGIC, self.n_buckets, bucket_size, max_events_per_user, self.window_us)
+        if tuple(header[name] for name in _HEADER.names[:5]) != expected:
+            os.close(self._fd)
+            raise ValueError(f"Existing feature store {path} has a different layout")
+
+        self._mm = mmap.mmap(self._fd, self.size)
+        self.keys = np.ndarray((self.n_slots,), dtype=np.int64, buffer=self._mm, offset=keys_offset)
+        self.counts = np.ndarray((self.n_slots,), dtype=np.int64, buffer=self._mm, offset=counts_offset)
+        self.times = np.ndarray((self.n_slots, max_events_per_user), dtype=np.int64,
+                                buffer=self._mm, offset=times_offset)
+        # Flat int64 views for the per-update path, where Python scalar access beats NumPy
+        buffer = memoryview(self._mm)
+        self._keys = buffer[keys_offset:counts_offset].cast('q')
+        self._counts = buffer[counts_offset:times_offset].cast('q')
+        self._times = buffer[times_offset:].cast('q')
+        self._thread_locks = [threading.Lock() for _ in range(n_thread_locks)]
+        self._reset_counters()
+
+    def _reset_counters(self) -> None:
+        """Zeroes this process's throughput counters."""
+        self.n_updates = 0
+        self.n_dropped_events = 0
+        self.n_capacity_evictions = 0
+        self.update_seconds = 0.0
+
+    @contextmanager
+    def _locked(self, bucket: int) -> Iterator[None]:
+        """Holds the bucket's lock against other threads and other processes."""
+        with self._thread_locks[bucket % len(self._thread_locks)]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, bucket)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, bucket)
+
+    def _find(self, user_id: int, lo: int) -> int:
+        """Returns the user's slot within the bucket starting at `lo`, or -1."""
+        keys, counts = self._keys, self._counts
+        for slot in range(lo, lo + self.bucket_size):
+            if counts[slot] and keys[slot] == user_id:
+                return slot
+        return -1
+
+    def _claim(self, lo: int, cutoff: int) -> int:
+        """Picks a free or idle slot in the bucket, evicting the least recently active user if needed."""
+        counts, times, capacity = self._counts, self._times, self.max_events_per_user
+        best, best_newest = lo, None
+        for slot in range(lo, lo + self.bucket_size):
+            if not counts[slot]:
+                return slot
+            newest = times[slot * capacity + counts[slot] - 1]
+            if best_newest is None or newest < best_newest:
+                best, best_newest = slot, newest
+        if best_newest > cutoff:
+            self.n_capacity_evictions += 1
+        counts[best] = 0
+        return best
+
+    def update_and_get_velocity(self, user_id: int, current_time: datetime) -> int:
+        """
+        Adds a new transaction timestamp and returns the count within the window.
+
+        Args:
+            user_id (int): The ID of the user performing the transaction.
+            current_time (datetime): The timestamp of the current transaction.
+
+        Returns:
+            int: The number of transactions for this user within the rolling window.
+        """
+        start = time.perf_counter()
+        now_us = to_epoch_us(current_time)
+        cutoff = now_us - self.window_us
+        bucket = hash(user_id) % self.n_buckets
+        lo = bucket * self.bucket_size
+        times = self._times
+
+        with self._locked(bucket):
+            slot = self._find(user_id, lo)
+            if slot < 0:
+                slot = self._claim(lo, cutoff)
+                self._keys[slot] = user_id
+            base = slot * self.max_events_per_user
+            n = self._counts[slot]
+
+            # Add current transaction, keeping the row sorted for late arrivals
+            if n == self.max_events_per_user:
+                times[base:base + n - 1] = times[base + 1:base + n]
+                n -= 1
+                self.n_dropped_events += 1
+            end = base + n
+            if n == 0 or now_us >= times[end - 1]:
+                times[end] = now_us
+            else:
+                pos = bisect_right(times, now_us, base, end)
+                times[pos + 1:end + 1] = times[pos:end]
+                times[pos] = now_us
+            n += 1
+
+            # Clean up old timestamps
+            expired = bisect_right(times, cutoff, base, base + n) - base
+            if expired:
+                times[base:base + n - expired] = times[base + expired:base + n]
+                n -= expired
+            self._counts[slot] = n
+
+        self.n_updates += 1
+        self.update_seconds += time.perf_counter() - start
+        return n
+
+    def update_many(self, user_ids: Sequence[int], times: Sequence[datetime]) -> List[int]:
+        """Applies `update_and_get_velocity` to each transaction in order and returns the velocities."""
+        return [self.update_and_get_velocity(user_id, ts) for user_id, ts in zip(user_ids, times)]
+
+    def get_velocity(self, user_id: int, current_time: datetime) -> int:
+        """Counts the user's stored transactions in the window ending at `current_time`, without adding one."""
+        now_us = to_epoch_us(current_time)
+        bucket = hash(user_id) % self.n_buckets
+        with self._locked(bucket):
+            slot = self._find(user_id, bucket * self.bucket_size)
+            if slot < 0:
+                return 0
+            base = slot * self.max_events_per_user
+            end = base + self._counts[slot]
+            return bisect_right(self._times, now_us, base, end) - bisect_right(self._times, now_us - self.window_us, base, end)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns table occupancy and this process's throughput counters."""
+        return {
+            "users": int(np.count_nonzero(self.counts)),
+            "events": int(self.counts.sum()),
+            "slots": self.n_slots,
+            "updates": self.n_updates,
+            "dropped_events": self.n_dropped_events,
+            "capacity_evictions": self.n_capacity_evictions,
+            "memory_bytes": self.size,
+            "avg_update_us": self.update_seconds / self.n_updates * 1e6 if self.n_updates else 0.0,
+        }
+
+    def reset(self) -> None:
+        """Clears all users for every process sharing the file."""
+        for bucket in range(self.n_buckets):
+            with self._locked(bucket):
+                self.counts[bucket * self.bucket_size:(bucket + 1) * self.bucket_size] = 0
+        self._reset_counters()
+
+    def close(self) -> None:
+        """Unmaps the file; the shared state stays on disk for other processes."""
+        for view in (self._keys, self._counts, self._times):
+            view.release()
+        del self.keys, self.counts, self.times
+        self._mm.close()
+        os.close(self._fd)
+
+class RedisFeatureStore:
+    """
+    Velocity store in Redis (or any server speaking its protocol), shared by all API hosts.
+
+    Each user is a sorted set of events scored by epoch microseconds. An update
+    is one MULTI/EXEC pipeline (add, trim, expire old events, count, refresh
+    TTL), so it costs a single round trip and cannot interleave with another
+    worker's update. `update_many` sends a whole batch in one pipeline.
+    """
+
+    def __init__(self, client: Any, window_hours: int = 24, max_events_per_user: Optional[int] = None,
+                 key_prefix: str = "fraud:velocity:"):
+        """
+        Initializes the store around a redis-py compatible client.
+
+        Args:
+            client: A `redis.Redis` (or compatible, e.g. fakeredis) client.
+            window_hours (int): Length of the rolling velocity window.
+            max_events_per_user (Optional[int]): Timestamps kept per user; velocities saturate at this value.
+            key_prefix (str): Prefix of every key written by the store.
+        """
+        self.client = client
+        self.window_hours = window_hours
+        self.window_us = int(window_hours * 3600 * 1e6)
+        self.max_events_per_user = max_events_per_user
+        self.key_prefix = key_prefix
+        # Event members must be unique even for identical timestamps across workers
+        self._member_prefix = f"{os.getpid()}-{os.urandom(4).hex()}"
+        self._seq = itertools.count()
+        self._reset_counters()
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "RedisFeatureStore":
+        """Connects to a Redis URL such as redis://localhost:6379/0."""
+        import redis
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _reset_counters(self) -> None:
+        """Zeroes this process's throughput counters."""
+        self.n_updates = 0
+        self.n_round_trips = 0
+        self.update_seconds = 0.0
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.key_prefix}{user_id}"
+
+    def _queue_update(self, pipe: Any, user_id: int, current_time: datetime) -> None:
+        """Adds the commands of one update to a pipeline; the count is the second-last reply."""
+        now_us = to_epoch_us(current_time)
+        key = self._key(user_id)
+        pipe.zadd(key, {f"{now_us}:{self._member_prefix}:{next(self._seq)}": now_us})
+        if self.max_events_per_user is not None:
+            pipe.zremrangebyrank(key, 0, -(self.max_events_per_user + 1))
+        pipe.zremrangebyscore(key, '-inf', now_us - self.window_us)
+        pipe.zcard(key)
+        pipe.pexpire(key, self.window_us // 1000)
+
+    def update_and_get_velocity(self, user_id: int, current_time: datetime) -> int:
+        """
+        Adds a new transaction timestamp and returns the count within the window.
+
+        Args:
+            user_id (int): The ID of the user performing the transaction.
+            current_time (datetime): The timestamp of the current transaction.
+
+        Returns:
+            int: The number of transactions for this user within the rolling window.
+        """
+        return self.update_many([user_id], [current_time])[0]
+
+    def update_many(self, user_ids: Sequence[int], times: Sequence[datetime]) -> List[int]:
+        """Applies updates in order in a single pipelined round trip and returns the velocities."""
+        if not len(user_ids):
+            return []
+        start = time.perf_counter()
+        pipe = self.client.pipeline(transaction=True)
+        for user_id, ts in zip(user_ids, times):
+            self._queue_update(pipe, user_id, ts)
+        replies = pipe.execute()
+        per_update = len(replies) // len(user_ids)
+        self.n_updates += len(user_ids)
+        self.n_round_trips += 1
+        self.update_seconds += time.perf_counter() - start
+        return [int(count) for count in replies[per_update - 2::per_update]]
+
+    def get_velocity(self, user_id: int, current_time: datetime) -> int:
+        """Counts the user's stored transactions in the window ending at `current_time`, without adding one."""
+        now_us = to_epoch_us(current_time)
+        return int(self.client.zcount(self._key(user_id), f"({now_us - self.window_us}", now_us))
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns this process's throughput counters."""
+        return {
+            "updates": self.n_updates,
+            "round_trips": self.n_round_trips,
+            "avg_update_us": self.update_seconds / self.n_updates * 1e6 if self.n_updates else 0.0,
+        }
+
+    def reset(self) -> None:
+        """Deletes every key written under the store's prefix."""
+        keys = list(self.client.scan_iter(match=f"{self.key_prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+        self._reset_counters()
+
+def create_feature_store(config: Config, window_hours: int = 24) -> Any:
+    """
+    Builds the velocity store selected by `config.FEATURE_STORE_BACKEND`.
+
+    `memory` keeps state in the process (one API worker), `shm` shares it between
+    workers on one host and `redis` between hosts.
+    """
+    backend = config.FEATURE_STORE_BACKEND
+    if backend == "memory":
+        return FeatureStore(
+            window_hours=window_hours,
+            max_users=config.FEATURE_STORE_MAX_USERS,
+            max_events_per_user=config.FEATURE_STORE_MAX_EVENTS_PER_USER,
+            max_future_skew=config.MAX_FUTURE_SKEW_SECONDS
+        )
+    if backend == "shm":
+        return SharedMemoryFeatureStore(
+            config.FEATURE_STORE_SHM_PATH,
+            window_hours=window_hours,
+            max_users=config.FEATURE_STORE_SHM_MAX_USERS,
+            max_events_per_user=config.FEATURE_STORE_SHM_MAX_EVENTS
+        )
+    if backend == "redis":
+        return RedisFeatureStore.from_url(
+            config.REDIS_URL,
+            window_hours=window_hours,
+            max_events_per_user=config.FEATURE_STORE_MAX_EVENTS_PER_USER
+        )
+    raise ValueError(f"Unknown feature store backend: {backend}")
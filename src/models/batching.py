@@ -0,0 +1,150 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+class QueueFullError(RuntimeError):
+    """Raised by `MicroBatcher.submit` when the queue is at capacity."""
+
+class MicroBatcher:
+    """
+    Coalesces individually submitted items into batches processed by one call.
+
+    A worker thread takes the oldest queued item, then keeps collecting until
+    `max_batch_size` items are gathered or `max_wait` seconds have passed since
+    that item arrived, so batching adds at most `max_wait` to any request.
+    While a batch is being processed the next one fills up, so under load
+    batches grow towards `max_batch_size` without extra waiting.
+
+    Items are processed in submission order; items whose future was cancelled
+    while queued (e.g. the client went away) are skipped. `process` may return an exception
+    instance in place of a result to fail only that item; if it raises, every
+    item in that batch receives the exception.
+    """
+
+    def __init__(self, process: Callable[[List[Any]], List[Any]], max_batch_size: int = 64,
+                 max_wait: float = 0.002, max_queue: int = 10_000):
+        """
+        Initializes the batcher.
+
+        Args:
+            process (Callable): Maps a list of items to a list of results (or per-item
+                exceptions) of the same length.
+            max_batch_size (int): Largest batch passed to `process`.
+            max_wait (float): Longest time in seconds the oldest item waits for a batch to fill.
+            max_queue (int): Queued items beyond which `submit` refuses new ones.
+        """
+        self.process = process
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[Tuple[Any, Future, float]]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.n_batches = 0
+        self.n_items = 0
+        self.n_rejected = 0
+        self.n_failed_batches = 0
+        self.n_failed_items = 0
+        self.n_cancelled = 0
+        self.max_batch_seen = 0
+
+    @property
+    def running(self) -> bool:
+        """Whether the worker thread is active."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Starts the worker thread."""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the worker after processing everything already queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, item: Any) -> Future:
+        """
+        Queues an item for the next batch.
+
+        Returns:
+            Future: Resolves to the item's result, or raises what `process` raised or returned for it.
+
+        Raises:
+            QueueFullError: If the queue is full or the batcher is not running.
+        """
+        if not self.running:
+            raise QueueFullError("Micro-batcher is not running")
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((item, future, time.perf_counter()))
+        except queue.Full:
+            self.n_rejected += 1
+            raise QueueFullError("Micro-batch queue is full") from None
+        return future
+
+    def _collect(self, first: Tuple[Any, Future, float]) -> List[Tuple[Any, Future, float]]:
+        """Gathers a batch starting with `first` until it is full or its wait budget is spent."""
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        """Processes batches until stopped and the queue is drained."""
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            batch = self._collect(first)
+            # Claims every future, so a waiter cancelled from now on cannot make set_result raise
+            pending = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            self.n_cancelled += len(batch) - len(pending)
+            batch = pending
+            if not batch:
+                continue
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.process(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"Batch of {len(items)} items produced {len(results)} results")
+            except Exception as e:
+                self.n_failed_batches += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    if isinstance(result, BaseException):
+                        self.n_failed_items += 1
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+            self.n_batches += 1
+            self.n_items += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns batch counts, average and largest batch size and the current queue depth."""
+        return {
+            "batches": self.n_batches,
+            "items": self.n_items,
+            "avg_batch_size": self.n_items / self.n_batches if self.n_batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "failed_batches": self.n_failed_batches,
+            "failed_items": self.n_failed_items,
+            "cancelled": self.n_cancelled,
+            "rejected": self.n_rejected,
+            "queue_depth": self._queue.qsize(),
+        }
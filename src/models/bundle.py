@@ -0,0 +1,255 @@
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import numpy as np
+import xgboost as xgb
+from src.data.loader import file_sha256
+from src.features.fast_path import FastFeaturePath
+from src.features.ip_index import IpCountryIndex
+from src.models.compiled import CompiledEnsemble
+from src.utils.config import Config
+
+# Bump when the bundle layout changes; older loaders refuse newer bundles
+BUNDLE_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+MODEL_FILE = "model.ubj"
+PREPROCESSOR_FILE = "preprocessor.json"
+IP_INDEX_FILE = "ip_index.npz"
+CANARY_FILE = "canary.json"
+TREES_FILE = "trees.npz"
+# Largest batch scored with the compiled trees; beyond it XGBoost's native predictor is faster
+COMPILED_MAX_ROWS = 128
+
+@dataclass(frozen=True, eq=False)
+class InferenceBundle:
+    """
+    An immutable model and preprocessor pair loaded from one bundle version.
+
+    Compared and hashed by identity, so it can key per-model caches.
+    """
+    version: str
+    model: xgb.XGBClassifier
+    fast_path: FastFeaturePath
+    manifest: Dict[str, Any]
+    path: str
+    timings: Dict[str, float] = field(default_factory=dict)
+    compiled: Optional[CompiledEnsemble] = None
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """
+        Returns the fraud probability per row of an encoded matrix.
+
+        Batches of up to COMPILED_MAX_ROWS rows are scored with the compiled
+        trees when the bundle has them, larger ones with XGBoost.
+        """
+        if self.compiled is not None and len(X) <= COMPILED_MAX_ROWS:
+            return self.compiled.predict_proba(X)
+        return self.model.predict_proba(X)[:, 1]
+
+def new_version(run_id: Optional[str] = None) -> str:
+    """Returns a sortable version name: UTC timestamp, plus a short run id when given."""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    return f"{stamp}-{run_id[:8]}" if run_id else stamp
+
+def export_bundle(model: xgb.XGBClassifier, fast_path: FastFeaturePath, root: str,
+                  version: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None,
+                  canary: Optional[List[Dict[str, Any]]] = None) -> str:
+    """
+    Writes a self-contained inference bundle to `<root>/<version>/`.
+
+    The bundle holds the booster as XGBoost UBJSON, the trees flattened into
+    NumPy arrays for the compiled scorer, the scaler statistics, encoder
+    categories and column order as JSON, and the IP index as NumPy arrays, so
+    serving never needs to unpickle sklearn objects. It is written to a
+    temporary directory and renamed into place.
+
+    Args:
+        model (xgb.XGBClassifier): Fitted classifier.
+        fast_path (FastFeaturePath): Fast path compiled in the model's column order.
+        root (str): Directory holding all bundle versions.
+        version (Optional[str]): Version name, defaults to `new_version()`.
+        metadata (Optional[Dict]): Extra JSON-serializable provenance, e.g. the MLflow run id.
+        canary (Optional[List[Dict]]): Raw transactions with a `velocity` field. They are
+            stored with this model's scores so a server can check a loaded copy reproduces them.
+
+    Returns:
+        str: Path of the written bundle.
+    """
+    version = version or new_version()
+    target = os.path.join(root, version)
+    tmp_target = f"{target}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_target, ignore_errors=True)
+    os.makedirs(tmp_target)
+
+    model.save_model(os.path.join(tmp_target, MODEL_FILE))
+    with open(os.path.join(tmp_target, PREPROCESSOR_FILE), 'w') as f:
+        json.dump(fast_path.to_params(), f)
+    ip_index = fast_path.ip_index or IpCountryIndex(np.empty(0), np.empty(0), np.empty(0, dtype=object))
+    np.savez(
+        os.path.join(tmp_target, IP_INDEX_FILE),
+        lower=ip_index.lower, upper=ip_index.upper, countries=np.asarray(ip_index.countries, dtype=str)
+    )
+
+    files = [MODEL_FILE, PREPROCESSOR_FILE, IP_INDEX_FILE]
+    try:
+        CompiledEnsemble.from_booster(model.get_booster()).save(os.path.join(tmp_target, TREES_FILE))
+        files.append(TREES_FILE)
+    except ValueError as e:
+        print(f"Warning: Bundle will be served by XGBoost only: {e}")
+    if canary:
+        probabilities = score_records(model, fast_path, canary)
+        with open(os.path.join(tmp_target, CANARY_FILE), 'w') as f:
+            json.dump({"records": canary, "probabilities": probabilities.tolist()}, f, default=str)
+        files.append(CANARY_FILE)
+    manifest = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "xgboost_version": xgb.__version__,
+        "n_features": fast_path.n_features,
+        "files": {name: file_sha256(os.path.join(tmp_target, name)) for name in files},
+        "metadata": metadata or {},
+    }
+    with open(os.path.join(tmp_target, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp_target, target)
+    return target
+
+def list_bundles(root: str) -> Dict[str, str]:
+    """Returns complete bundle versions under `root`, oldest first, mapped to their paths."""
+    if not os.path.isdir(root):
+        return {}
+    versions = sorted(
+        name for name in os.listdir(root)
+        if '.tmp-' not in name and os.path.exists(os.path.join(root, name, MANIFEST_FILE))
+    )
+    return {name: os.path.join(root, name) for name in versions}
+
+def latest_bundle(root: str) -> Optional[str]:
+    """Returns the path of the newest bundle under `root`, or None."""
+    bundles = list_bundles(root)
+    return bundles[max(bundles)] if bundles else None
+
+def load_bundle(path: str, verify: bool = True, compiled: bool = True) -> InferenceBundle:
+    """
+    Loads a bundle written by `export_bundle`.
+
+    Args:
+        path (str): Bundle directory.
+        verify (bool): Check every file against the SHA-256 recorded in the manifest.
+        compiled (bool): Load the compiled trees, or compile them for bundles
+            exported before they were included.
+
+    Returns:
+        InferenceBundle: Model, compiled fast path, manifest and per-step load times in seconds.
+    """
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version", 0) > BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Bundle format {manifest['format_version']} is newer than supported {BUNDLE_FORMAT_VERSION}")
+    if verify:
+        for name, digest in manifest["files"].items():
+            if file_sha256(os.path.join(path, name)) != digest:
+                raise ValueError(f"Checksum mismatch for {name} in bundle {path}")
+    timings["manifest"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model = xgb.XGBClassifier()
+    model.load_model(os.path.join(path, MODEL_FILE))
+    timings["model"] = time.perf_counter() - start
+
+    ensemble = None
+    if compiled:
+        start = time.perf_counter()
+        try:
+            ensemble = (CompiledEnsemble.load(os.path.join(path, TREES_FILE)) if TREES_FILE in manifest["files"]
+                        else CompiledEnsemble.from_booster(model.get_booster()))
+        except ValueError as e:
+            print(f"Warning: Serving bundle {path} with XGBoost only: {e}")
+        timings["compiled"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with np.load(os.path.join(path, IP_INDEX_FILE), allow_pickle=False) as arrays:
+        ip_index = IpCountryIndex(arrays["lower"], arrays["upper"], arrays["countries"].astype(object))
+    with open(os.path.join(path, PREPROCESSOR_FILE)) as f:
+        fast_path = FastFeaturePath.from_params(json.load(f), ip_index)
+    if list(model.get_booster().feature_names or []) != fast_path.feature_names:
+        raise ValueError(f"Model and preprocessor column order differ in bundle {path}")
+    timings["preprocessor"] = time.perf_counter() - start
+
+    return InferenceBundle(manifest["version"], model, fast_path, manifest, path, timings, ensemble)
+
+def load_canary(bundle: InferenceBundle) -> Optional[Dict[str, Any]]:
+    """Returns the bundle's canary records and recorded probabilities, or None if it has none."""
+    canary_path = os.path.join(bundle.path, CANARY_FILE)
+    if not os.path.exists(canary_path):
+        return None
+    with open(canary_path) as f:
+        return json.load(f)
+
+def score_records(model: xgb.XGBClassifier, fast_path: FastFeaturePath,
+                  records: List[Dict[str, Any]]) -> np.ndarray:
+    """Scores raw transactions, each carrying its own `velocity`, through the serving path."""
+    X = np.vstack([fast_path.transform_one(record, record['velocity']) for record in records])
+    return model.predict_proba(X)[:, 1]
+
+def latest_mlflow_run_id(config: Config) -> Optional[str]:
+    """Returns the id of the most recent run in the configured MLflow experiment, or None."""
+    import mlflow
+
+    mlflow.set_tracking_uri(config.MLFLOW_TRACKING_URI)
+    experiment = mlflow.get_experiment_by_name(config.MLFLOW_EXPERIMENT_NAME)
+    if experiment is None:
+        return None
+    runs = mlflow.search_runs(experiment_ids=[experiment.experiment_id], order_by=["start_time DESC"])
+    return None if runs.empty else runs.iloc[0].run_id
+
+def export_from_mlflow(config: Config, root: Optional[str] = None, run_id: Optional[str] = None) -> Optional[str]:
+    """
+    Exports a bundle from an MLflow run (the latest by default) and the local feature engineer.
+
+    This is the slow path: it imports MLflow, queries the tracking server and
+    unpickles the FeatureEngineer. The result is written as a regular bundle,
+    so later startups load it from disk.
+
+    Returns:
+        Optional[str]: Path of the written bundle, or None if no run or preprocessor was found.
+    """
+    import joblib
+    import mlflow.xgboost
+
+    run_id = run_id or latest_mlflow_run_id(config)
+    if run_id is None or not os.path.exists(config.FEATURE_ENGINEER_PATH):
+        return None
+    model = mlflow.xgboost.load_model(f"runs:/{run_id}/model")
+    fe = joblib.load(config.FEATURE_ENGINEER_PATH)
+    fast_path = FastFeaturePath(fe, feature_names=model.get_booster().feature_names)
+    return export_bundle(
+        model, fast_path, root or config.MODEL_BUNDLE_DIR,
+        version=new_version(run_id), metadata={"source": "mlflow", "run_id": run_id}
+    )
+
+def sync_from_mlflow(config: Config, root: Optional[str] = None) -> Optional[str]:
+    """
+    Exports the latest MLflow run as a bundle unless a bundle for it already exists.
+
+    Returns:
+        Optional[str]: Path of the new bundle, or None if there was nothing new.
+    """
+    root = root or config.MODEL_BUNDLE_DIR
+    run_id = latest_mlflow_run_id(config)
+    if run_id is None or any(version.endswith(f"-{run_id[:8]}") for version in list_bundles(root)):
+        return None
+    return export_from_mlflow(config, root, run_id)
+
+if __name__ == "__main__":
+    path = export_from_mlflow(Config())
+    print(f"Exported bundle to {path}" if path else "No MLflow run or feature engineer found")
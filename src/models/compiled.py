@@ -0,0 +1,169 @@
+import json
+from typing import Any, Dict, Optional
+import numpy as np
+
+# Array names stored by `CompiledEnsemble.save`
+ARRAYS = ("feature", "threshold", "children", "default_right", "value", "roots")
+
+class CompiledEnsemble:
+    """
+    A binary:logistic XGBoost tree ensemble flattened into NumPy arrays.
+
+    All trees share one node table. Internal nodes hold a feature index, a
+    float32 threshold, `children[node] = (left, right)` and whether a
+    missing value goes right; leaves point to themselves as both children,
+    so a walk of `max_depth` steps ends on every tree's leaf whatever its
+    depth. Rows are walked through all trees in lockstep, with a few 1-D
+    gathers per level over the flattened (row, tree) node indices, instead of
+    going through the sklearn wrapper and a DMatrix.
+
+    Splits follow XGBoost: a row goes left when `x < threshold` in float32,
+    and missing (NaN) values take the node's default direction. Categorical
+    splits and multi-class models are not supported.
+    """
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, children: np.ndarray,
+                 default_right: np.ndarray, value: np.ndarray, roots: np.ndarray, base_margin: float,
+                 max_depth: int, n_features: int, feature_names: Optional[list] = None):
+        """
+        Initializes the ensemble from its node arrays; use `from_booster` or `load` instead.
+
+        Args:
+            feature (np.ndarray): Split feature per node (0 for leaves).
+            threshold (np.ndarray): float32 split threshold per node.
+            children (np.ndarray): (nodes, 2) left and right child per node.
+            default_right (np.ndarray): Whether a missing value goes right, per node.
+            value (np.ndarray): Leaf value per node (0 for internal nodes).
+            roots (np.ndarray): Root node of each tree.
+            base_margin (float): Margin added to every prediction, from the model's base score.
+            max_depth (int): Deepest leaf over all trees.
+            n_features (int): Number of input columns.
+            feature_names (Optional[list]): Column order the model was trained with.
+        """
+        self.feature = feature.astype(np.intp)
+        self.threshold = threshold.astype(np.float32)
+        self.children = np.ascontiguousarray(children, dtype=np.intp)
+        self.default_right = default_right.astype(bool)
+        self.value = value.astype(np.float32)
+        self.roots = roots.astype(np.intp)
+        self._children_flat = self.children.ravel()
+        self.base_margin = float(base_margin)
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.feature_names = feature_names
+
+    @property
+    def n_trees(self) -> int:
+        """Number of trees."""
+        return len(self.roots)
+
+    @classmethod
+    def from_booster(cls, booster: Any) -> "CompiledEnsemble":
+        """
+        Flattens a trained booster.
+
+        Only the trees `predict_proba` would use are kept, i.e. up to the best
+        iteration when the model was trained with early stopping.
+
+        Args:
+            booster (xgb.Booster): Booster with a binary:logistic objective.
+
+        Raises:
+            ValueError: If the objective, booster type or split types are unsupported.
+        """
+        learner = json.loads(booster.save_raw("json"))["learner"]
+        objective = learner["objective"]["name"]
+        if objective != "binary:logistic":
+            raise ValueError(f"Only binary:logistic models can be compiled, got {objective}")
+        if learner["gradient_booster"]["name"] != "gbtree":
+            raise ValueError(f"Only gbtree models can be compiled, got {learner['gradient_booster']['name']}")
+        model = learner["gradient_booster"]["model"]
+        trees = model["trees"]
+        best_iteration = booster.attributes().get("best_iteration")
+        if best_iteration is not None:
+            trees = trees[:model["iteration_indptr"][int(best_iteration) + 1]]
+
+        features, thresholds, children, default_right, values, roots = [], [], [], [], [], []
+        offset, max_depth = 0, 0
+        for tree in trees:
+            if any(tree["split_type"]):
+                raise ValueError("Categorical splits are not supported")
+            left = np.asarray(tree["left_children"], dtype=np.int64)
+            right = np.asarray(tree["right_children"], dtype=np.int64)
+            conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+            nodes = np.arange(len(left))
+            is_leaf = left == -1
+            # Leaves loop onto themselves; their split condition is the leaf value
+            children.append(np.stack([np.where(is_leaf, nodes, left), np.where(is_leaf, nodes, right)], axis=1) + offset)
+            features.append(np.where(is_leaf, 0, tree["split_indices"]))
+            thresholds.append(np.where(is_leaf, 0, conditions))
+            values.append(np.where(is_leaf, conditions, 0))
+            default_right.append(~np.asarray(tree["default_left"], dtype=bool) & ~is_leaf)
+            roots.append(offset)
+            max_depth = max(max_depth, _depth(left, right))
+            offset += len(left)
+
+        # base_score is stored as a probability, e.g. "[3.3333334E-1]"
+        base_score = float(str(learner["learner_model_param"]["base_score"]).strip("[]"))
+        return cls(
+            np.concatenate(features), np.concatenate(thresholds), np.concatenate(children),
+            np.concatenate(default_right), np.concatenate(values), np.asarray(roots),
+            base_margin=np.log(base_score / (1 - base_score)), max_depth=max_depth,
+            n_features=int(learner["learner_model_param"]["num_feature"]),
+            feature_names=learner.get("feature_names") or None,
+        )
+
+    def predict_margin(self, X: np.ndarray) -> np.ndarray:
+        """
+        Sums the leaf values reached by each row, plus the base margin.
+
+        Args:
+            X (np.ndarray): (rows, n_features) matrix, or a single row; NaN marks a missing value.
+
+        Returns:
+            np.ndarray: Raw margin per row.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32).reshape(-1, self.n_features)
+        n_rows = len(X)
+        values = X.ravel()
+        # Flat (row, tree) layout: every gather is a 1-D `take`, much cheaper than 2-D fancy indexing
+        if n_rows == 1:
+            nodes, row_offsets = self.roots, 0
+        else:
+            nodes = np.tile(self.roots, n_rows)
+            row_offsets = np.repeat(np.arange(n_rows, dtype=np.intp) * self.n_features, self.n_trees)
+        missing = np.isnan(values)
+        has_missing = bool(missing.any())
+        for _ in range(self.max_depth):
+            positions = row_offsets + self.feature.take(nodes)
+            go_right = values.take(positions) >= self.threshold.take(nodes)
+            if has_missing:
+                go_right |= missing.take(positions) & self.default_right.take(nodes)
+            nodes = self._children_flat.take(2 * nodes + go_right)
+        return self.value.take(nodes).reshape(n_rows, self.n_trees).sum(axis=1, dtype=np.float64) + self.base_margin
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Returns the positive-class probability per row, like `predict_proba(X)[:, 1]`."""
+        return 1.0 / (1.0 + np.exp(-self.predict_margin(X)))
+
+    def save(self, path: str) -> None:
+        """Writes the node arrays and scalars to an `.npz` file."""
+        meta = {"base_margin": self.base_margin, "max_depth": self.max_depth, "n_features": self.n_features,
+                "feature_names": self.feature_names}
+        np.savez(path, meta=np.asarray(json.dumps(meta)), **{name: getattr(self, name) for name in ARRAYS})
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledEnsemble":
+        """Reads an ensemble written by `save`; needs only NumPy."""
+        with np.load(path, allow_pickle=False) as arrays:
+            meta: Dict[str, Any] = json.loads(str(arrays["meta"]))
+            return cls(*(arrays[name] for name in ARRAYS), **meta)
+
+def _depth(left: np.ndarray, right: np.ndarray) -> int:
+    """Returns the number of edges on the longest root-to-leaf path of one tree."""
+    depth, frontier = 0, [0]
+    while True:
+        frontier = [child for node in frontier if left[node] != -1 for child in (left[node], right[node])]
+        if not frontier:
+            return depth
+        depth += 1
@@ -2,37 +2,69 @@ import pandas as pd
 import os
 from src.utils.config import Config
 from src.data.loader import DataLoader
-from src.utils.monitoring import Monitor
+from src.utils.inference_log import list_segments, read_inference_logs
+from src.utils.drift_stream import DRIFT_FEATURES, DriftReference, StreamingDriftMonitor
+from typing import Any, Dict
+
+def load_drift_reference(config: Config) -> DriftReference:
+    """Loads the binned reference distribution, building it from the training data on first use."""
+    if os.path.exists(config.DRIFT_REFERENCE_PATH):
+        return DriftReference.load(config.DRIFT_REFERENCE_PATH)
+    print("Building drift reference histograms...")
+    ref_df = DataLoader(config).load_fraud_data(columns=DRIFT_FEATURES)
+    reference = DriftReference.from_frame(ref_df)
+    reference.save(config.DRIFT_REFERENCE_PATH)
+    return reference
+
+def check_drift_stream() -> Dict[str, Dict[str, Any]]:
+    """
+    Updates drift statistics from new inference log segments and scores every feature.
+    Only segments written since the last call are read, so this stays fast as logs grow.
+
+    Returns:
+        Dict: PSI, KS and drift flag per feature.
+    """
+    config = Config()
+    monitor = StreamingDriftMonitor(
+        load_drift_reference(config), config.INFERENCE_LOG_DIR, window_segments=config.DRIFT_WINDOW_SEGMENTS
+    )
+    monitor.load_state(config.DRIFT_STATE_PATH)
+    monitor.update()
+    monitor.save_state(config.DRIFT_STATE_PATH)
+    return monitor.scores()
 
 def check_drift() -> None:
     """
-    Orchestrates the data drift analysis process.
+    Orchestrates the full Evidently data drift report.
     Loads reference and current data, aligns features, and generates an HTML report.
+    This reads every log row; use `check_drift_stream` for routine monitoring.
     """
+    # Evidently is heavy to import, so only the on-demand report pays for it
+    from src.utils.monitoring import Monitor
+
     config = Config()
     loader = DataLoader(config)
     
     print("Loading reference data (training set)...")
     # In a real scenario, you'd use a specific versioned training split
     # For this challenge, we'll use the raw fraud data as baseline
-    ref_df = loader.load_fraud_data()
+    ref_df = loader.load_fraud_data(columns=DRIFT_FEATURES)
     
-    inference_log_path = "data-set/inference_logs.csv"
-    if not os.path.exists(inference_log_path):
-        print(f"Error: Inference logs not found at {inference_log_path}. Send some transactions first!")
+    inference_log_dir = config.INFERENCE_LOG_DIR
+    if not list_segments(inference_log_dir):
+        print(f"Error: Inference logs not found in {inference_log_dir}. Send some transactions first!")
         return
 
-    print("Loading current data (inference logs)...")
-    curr_df = pd.read_csv(inference_log_path)
-    
     # 1. Align columns: use only features present in both
-    features = ['purchase_value', 'source', 'browser', 'sex', 'age', 'ip_address']
-    
-    ref_df = ref_df[features]
-    curr_df = curr_df[features]
+    features = DRIFT_FEATURES
+
+    print("Loading current data (inference logs)...")
+    curr_df = read_inference_logs(inference_log_dir, columns=features)
     
-    # Simple type alignment
+    # Simple type alignment (categorical columns compare as plain values so unseen ones are kept)
     for col in features:
+        if isinstance(ref_df[col].dtype, pd.CategoricalDtype):
+            ref_df[col] = ref_df[col].astype(ref_df[col].cat.categories.dtype)
         curr_df[col] = curr_df[col].astype(ref_df[col].dtype)
 
     monitor = Monitor(reference_data=ref_df)
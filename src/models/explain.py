@@ -0,0 +1,41 @@
+import numpy as np
+import xgboost as xgb
+from typing import Any, Dict, List, Sequence
+
+def stratified_sample(y: np.ndarray, sample_size: int, random_state: int = 42) -> np.ndarray:
+    """
+    Picks row indices for SHAP summaries: every fraud case plus random legitimate ones.
+
+    Args:
+        y (np.ndarray): Binary labels.
+        sample_size (int): Target sample size; fraud cases are kept even beyond it.
+        random_state (int): Seed for the legitimate-case draw.
+
+    Returns:
+        np.ndarray: Sorted row indices.
+    """
+    y = np.asarray(y)
+    fraud = np.flatnonzero(y == 1)
+    legit = np.flatnonzero(y != 1)
+    n_legit = min(len(legit), max(sample_size - len(fraud), 0))
+    rng = np.random.default_rng(random_state)
+    return np.sort(np.concatenate([fraud, rng.choice(legit, size=n_legit, replace=False)]))
+
+def feature_contributions(booster: xgb.Booster, row: np.ndarray, feature_names: Sequence[str]) -> np.ndarray:
+    """
+    Computes exact per-feature SHAP contributions for one row with XGBoost's `pred_contribs`.
+
+    Returns:
+        np.ndarray: One contribution per feature followed by the bias term, in log-odds.
+    """
+    dmatrix = xgb.DMatrix(np.asarray(row, dtype=np.float64).reshape(1, -1), feature_names=list(feature_names))
+    return booster.predict(dmatrix, pred_contribs=True)[0]
+
+def top_contributions(contribs: np.ndarray, row: np.ndarray, feature_names: Sequence[str],
+                      top_k: int) -> List[Dict[str, Any]]:
+    """Returns the `top_k` features with the largest absolute contribution, largest first."""
+    order = np.argsort(-np.abs(contribs[:-1]), kind='stable')[:top_k]
+    return [
+        {"feature": feature_names[i], "value": float(row[i]), "contribution": float(contribs[i])}
+        for i in order
+    ]
@@ -0,0 +1,222 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+import numpy as np
+from src.models.bundle import InferenceBundle, list_bundles, load_bundle, load_canary, score_records
+
+class ModelManager:
+    """
+    Owns the active inference bundle and replaces it without downtime.
+
+    Requests read `current` once and use that (model, preprocessor) pair for
+    the whole request, so a swap never mixes two versions. New versions are
+    loaded, warmed and validated on the caller's thread (or the watcher's)
+    before the reference is replaced; serving state such as the FeatureStore
+    lives outside the bundle and is untouched.
+
+    Validation scores the bundle's canary transactions and checks that the
+    loaded copy reproduces the scores recorded at export, and that the
+    compiled trees agree with the XGBoost model. Automatic upgrades
+    are also rejected when more than `max_flip_rate` of canary predictions
+    flip against the active model; explicit pins skip that check.
+    """
+
+    def __init__(self, root: str, poll_interval: float = 30.0, max_flip_rate: Optional[float] = None,
+                 sync: Optional[Callable[[], Optional[str]]] = None,
+                 on_activate: Optional[Callable[[InferenceBundle], None]] = None, compiled: bool = True,
+                 max_history: int = 20):
+        """
+        Initializes the manager.
+
+        Args:
+            root (str): Bundle directory watched for new versions.
+            poll_interval (float): Seconds between watcher polls; 0 disables the watcher.
+            max_flip_rate (Optional[float]): Largest fraction of flipped canary predictions
+                accepted by automatic upgrades. None disables the check.
+            sync (Optional[Callable]): Called before each poll to pull new versions into `root`,
+                e.g. an export of the latest MLflow run.
+            on_activate (Optional[Callable]): Called with every newly activated bundle.
+            compiled (bool): Serve small batches with the bundles' compiled trees.
+            max_history (int): Activated versions remembered for rollback.
+        """
+        self.root = root
+        self.poll_interval = poll_interval
+        self.max_flip_rate = max_flip_rate
+        self.sync = sync
+        self.on_activate = on_activate
+        self.compiled = compiled
+        self.pinned: Optional[str] = None
+        self.history: Deque[str] = deque(maxlen=max_history)
+        self.rejected: Dict[str, str] = {}
+        self.last_error: Optional[str] = None
+        self._current: Optional[InferenceBundle] = None
+        # Serializes activations, pins and rollbacks; reentrant so rollback can pin while holding it
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def current(self) -> Optional[InferenceBundle]:
+        """The active bundle; read it once per request."""
+        return self._current
+
+    def prepare(self, version: str, check_agreement: bool = True) -> InferenceBundle:
+        """
+        Loads, warms and validates a bundle version without activating it.
+
+        Raises:
+            KeyError: If the version does not exist.
+            ValueError: If the bundle fails validation.
+        """
+        path = list_bundles(self.root)[version]
+        bundle = load_bundle(path, compiled=self.compiled)
+
+        start = time.perf_counter()
+        bundle.model.predict_proba(np.zeros((1, bundle.fast_path.n_features)))
+        bundle.predict_proba(np.zeros((1, bundle.fast_path.n_features)))
+        bundle.timings["warmup"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.validate(bundle, check_agreement)
+        bundle.timings["validation"] = time.perf_counter() - start
+        return bundle
+
+    def validate(self, bundle: InferenceBundle, check_agreement: bool = True) -> None:
+        """Scores the canary set with `bundle` and raises ValueError if it looks broken."""
+        current = self._current
+        canary = load_canary(bundle) or (load_canary(current) if current is not None else None)
+        if canary is None:
+            return
+        records = canary["records"]
+        probas = score_records(bundle.model, bundle.fast_path, records)
+        if not np.all(np.isfinite(probas)):
+            raise ValueError(f"Bundle {bundle.version} produced non-finite canary scores")
+        if load_canary(bundle) is not None and not np.allclose(probas, canary["probabilities"], atol=1e-6):
+            raise ValueError(f"Bundle {bundle.version} does not reproduce its recorded canary scores")
+        if bundle.compiled is not None:
+            X = np.vstack([bundle.fast_path.transform_one(record, record['velocity']) for record in records])
+            if not np.allclose(bundle.compiled.predict_proba(X), probas, atol=1e-5):
+                raise ValueError(f"Bundle {bundle.version} compiled trees disagree with the XGBoost model")
+        if check_agreement and self.max_flip_rate is not None and current is not None:
+            flip_rate = float(np.mean(
+                (probas > 0.5) != (score_records(current.model, current.fast_path, records) > 0.5)
+            ))
+            if flip_rate > self.max_flip_rate:
+                raise ValueError(
+                    f"Bundle {bundle.version} flips {flip_rate:.1%} of canary predictions "
+                    f"(limit {self.max_flip_rate:.1%})"
+                )
+
+    def activate(self, version: str, check_agreement: bool = True, automatic: bool = False,
+                 pin: bool = False) -> Optional[InferenceBundle]:
+        """
+        Prepares a version and atomically makes it the active bundle.
+
+        Args:
+            version (str): Bundle version to activate.
+            check_agreement (bool): Apply the canary flip-rate check.
+            automatic (bool): An upgrade by the watcher; skipped if a version is pinned
+                by the time the lock is held.
+            pin (bool): Pin the version in the same critical section that installs it.
+
+        Returns:
+            Optional[InferenceBundle]: The activated bundle, or None for a skipped automatic upgrade.
+        """
+        with self._lock:
+            if automatic and self.pinned is not None:
+                return None
+            bundle = self.prepare(version, check_agreement)
+            self._current = bundle
+            if pin:
+                self.pinned = version
+            self.history.append(version)
+            self.rejected.pop(version, None)
+        if self.on_activate is not None:
+            self.on_activate(bundle)
+        print(f"Activated inference bundle {version}")
+        return bundle
+
+    def pin(self, version: str) -> InferenceBundle:
+        """Activates a version and stops the watcher from moving off it."""
+        return self.activate(version, check_agreement=False, pin=True)
+
+    def unpin(self) -> None:
+        """Lets the watcher resume upgrading to the newest version."""
+        with self._lock:
+            self.pinned = None
+
+    def rollback(self) -> InferenceBundle:
+        """
+        Pins the version that was active before the current one.
+
+        Raises:
+            ValueError: If there is no earlier version to return to.
+        """
+        with self._lock:
+            current = self._current
+            previous = [v for v in self.history if current is None or v != current.version]
+            if not previous:
+                raise ValueError("No previous version to roll back to")
+            return self.pin(previous[-1])
+
+    def check_for_update(self) -> Optional[InferenceBundle]:
+        """
+        Activates the newest bundle if it is new, valid and nothing is pinned.
+
+        Returns:
+            Optional[InferenceBundle]: The newly activated bundle, if any.
+        """
+        if self.sync is not None:
+            self.sync()
+        bundles = list_bundles(self.root)
+        if self.pinned is not None or not bundles:
+            return None
+        latest = max(bundles)
+        current = self._current
+        if (current is not None and latest == current.version) or latest in self.rejected:
+            return None
+        try:
+            return self.activate(latest, automatic=True)
+        except (ValueError, KeyError, OSError) as e:
+            self.rejected[latest] = str(e)
+            print(f"Warning: Rejected inference bundle {latest}: {e}")
+            return None
+
+    def start(self) -> None:
+        """Starts the background watcher thread."""
+        if self.poll_interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the watcher thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        """Polls for new versions until stopped."""
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check_for_update()
+                self.last_error = None
+            except Exception as e:  # Keep watching; the active model is unaffected
+                self.last_error = str(e)
+                print(f"Warning: Model watcher poll failed: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        """Returns the active, pinned, available and rejected versions."""
+        current = self._current
+        return {
+            "active": current.version if current is not None else None,
+            "pinned": self.pinned,
+            "available": list(list_bundles(self.root)),
+            "history": list(self.history),
+            "rejected": dict(self.rejected),
+            "watcher_running": self._thread is not None and self._thread.is_alive(),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,168 @@
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from src.models.bundle import InferenceBundle
+
+Job = Tuple[Tuple[InferenceBundle, ...], List[Dict[str, Any]]]
+
+class ShadowScorer:
+    """
+    Scores served transactions with challenger bundles off the response path.
+
+    Request handlers pass the records they are about to log (raw features,
+    the served `tx_count_last_24h` and the champion's output) to `submit`,
+    which only puts them on a bounded queue. Worker threads encode each
+    record with every challenger's own preprocessor, reusing the velocity the
+    champion was served with, score them, and log the records with
+    `challenger_<i>_version` and `challenger_<i>_probability` columns next to
+    the champion's `fraud_probability`. Every transaction is still logged
+    exactly once, so log consumers such as snapshot replay are unaffected.
+
+    When the queue is full the records are logged at once with NaN challenger
+    scores and counted as shed, so a slow challenger never backs up into
+    request latency or memory. Without challengers, or when stopped, records
+    go straight to the log.
+    """
+
+    def __init__(self, log: Callable[[List[Dict[str, Any]]], Any], max_queue: int = 1000, n_workers: int = 1):
+        """
+        Initializes the scorer; call `start` to launch the workers.
+
+        Args:
+            log (Callable): Writes a list of records to the inference log.
+            max_queue (int): Queued jobs (one per request or batch) beyond which work is shed.
+            n_workers (int): Worker threads.
+        """
+        self.log = log
+        self.n_workers = n_workers
+        self.challengers: Tuple[InferenceBundle, ...] = ()
+        self._queue: "queue.Queue[Job]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.n_scored = 0
+        self.n_shed = 0
+        self.n_errors = 0
+        self.agreement: Dict[str, Dict[str, float]] = {}
+
+    @property
+    def running(self) -> bool:
+        """Whether the worker threads are active."""
+        return any(thread.is_alive() for thread in self._threads)
+
+    def set_challengers(self, bundles: Sequence[InferenceBundle]) -> None:
+        """Replaces the challenger set; queued jobs finish with the set they were submitted with."""
+        self.challengers = tuple(bundles)
+
+    def start(self) -> None:
+        """Starts the worker threads."""
+        if self.running:
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"shadow-scorer-{i}", daemon=True) for i in range(self.n_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """Stops the workers after scoring and logging everything already queued."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, records: List[Dict[str, Any]]) -> bool:
+        """
+        Queues records for shadow scoring and logging.
+
+        Args:
+            records (List[Dict]): Records as logged for the champion, including
+                `tx_count_last_24h` and `fraud_probability`.
+
+        Returns:
+            bool: Whether the records were queued; otherwise they were logged directly.
+        """
+        challengers = self.challengers
+        if not challengers or not self.running:
+            self.log(records)
+            return False
+        try:
+            self._queue.put_nowait((challengers, records))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.n_shed += len(records)
+            self.log(self._annotate(records, challengers, [None] * len(challengers)))
+            return False
+
+    def score(self, bundle: InferenceBundle, records: List[Dict[str, Any]]) -> np.ndarray:
+        """Scores logged records with one challenger, using each record's served velocity."""
+        fast_path = bundle.fast_path
+        X = np.zeros((len(records), fast_path.n_features), dtype=np.float64)
+        for i, record in enumerate(records):
+            # The challenger's IP index may differ from the champion's
+            row = {**record, 'country': fast_path.get_country(record['ip_address'])}
+            fast_path.transform_one(row, int(record['tx_count_last_24h']), out=X[i:i + 1])
+        return bundle.predict_proba(X)
+
+    def _annotate(self, records: List[Dict[str, Any]], challengers: Tuple[InferenceBundle, ...],
+                  probas: List[Optional[np.ndarray]]) -> List[Dict[str, Any]]:
+        """Adds challenger columns to the records, NaN where a challenger was not scored."""
+        for i, (bundle, scores) in enumerate(zip(challengers, probas)):
+            for j, record in enumerate(records):
+                record[f'challenger_{i}_version'] = bundle.version
+                record[f'challenger_{i}_probability'] = float(scores[j]) if scores is not None else float('nan')
+        return records
+
+    def _process(self, challengers: Tuple[InferenceBundle, ...], records: List[Dict[str, Any]]) -> None:
+        """Scores one job with every challenger and logs it; a failing challenger only loses its column."""
+        champion = np.array([record['fraud_probability'] for record in records])
+        probas: List[Optional[np.ndarray]] = []
+        for bundle in challengers:
+            try:
+                scores = self.score(bundle, records)
+            except Exception as e:
+                with self._lock:
+                    self.n_errors += 1
+                print(f"Warning: Shadow scoring with {bundle.version} failed: {e}")
+                scores = None
+            else:
+                with self._lock:
+                    stats = self.agreement.setdefault(bundle.version, {"scored": 0, "disagreements": 0})
+                    stats["scored"] += len(records)
+                    stats["disagreements"] += int(np.sum((scores > 0.5) != (champion > 0.5)))
+            probas.append(scores)
+        self.log(self._annotate(records, challengers, probas))
+        with self._lock:
+            self.n_scored += len(records)
+
+    def _run(self) -> None:
+        """Processes jobs until stopped and the queue is drained."""
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                challengers, records = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                self._process(challengers, records)
+            except Exception as e:  # Never lose the champion's log records
+                with self._lock:
+                    self.n_errors += 1
+                print(f"Warning: Shadow scoring failed, logging without challengers: {e}")
+                self.log(self._annotate(records, challengers, [None] * len(challengers)))
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns challenger versions, queue depth, scored, shed and failed counts and per-challenger agreement."""
+        with self._lock:
+            agreement = {version: dict(stats) for version, stats in self.agreement.items()}
+        return {
+            "challengers": [bundle.version for bundle in self.challengers],
+            "running": self.running,
+            "queue_depth": self._queue.qsize(),
+            "scored": self.n_scored,
+            "shed": self.n_shed,
+            "errors": self.n_errors,
+            "agreement": agreement,
+        }
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+import joblib
+import numpy as np
+
+def fingerprint(*parts: Any) -> str:
+    """Hashes JSON-serializable parts into a short, stable cache key."""
+    payload = json.dumps(parts, sort_keys=True, default=str).encode()
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+def code_fingerprint(*paths: str) -> str:
+    """Hashes the contents of source files so stages are invalidated when their code changes."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+class StageCache:
+    """
+    Disk cache for intermediate pipeline outputs.
+
+    Each stage output lives in `<directory>/<stage>/<key>/`, with one `.npy`
+    file per array (so it can be memory-mapped on load) and a joblib file for
+    any fitted objects. Entries are written to a temporary directory and
+    renamed into place, so an interrupted run never leaves a partial entry.
+    """
+
+    def __init__(self, directory: str, enabled: bool = True):
+        """Initializes the cache rooted at `directory`."""
+        self.directory = directory
+        self.enabled = enabled
+
+    def path(self, stage: str, key: str) -> str:
+        """Returns the directory holding one stage entry."""
+        return os.path.join(self.directory, stage, key)
+
+    def load(self, stage: str, key: str, mmap_mode: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Loads a cached stage output.
+
+        Args:
+            stage (str): Stage name.
+            key (str): Fingerprint of the stage inputs.
+            mmap_mode (Optional[str]): Passed to `np.load`, e.g. 'r' to memory-map arrays.
+
+        Returns:
+            Optional[Dict]: Arrays and objects by name, or None on a cache miss.
+        """
+        entry = self.path(stage, key)
+        if not self.enabled or not os.path.isdir(entry):
+            return None
+        outputs: Dict[str, Any] = {}
+        for name in os.listdir(entry):
+            if name.endswith('.npy'):
+                outputs[name[:-4]] = np.load(os.path.join(entry, name), mmap_mode=mmap_mode, allow_pickle=False)
+        objects_path = os.path.join(entry, 'objects.joblib')
+        if os.path.exists(objects_path):
+            outputs.update(joblib.load(objects_path))
+        return outputs
+
+    def save(self, stage: str, key: str, arrays: Dict[str, np.ndarray],
+             objects: Optional[Dict[str, Any]] = None) -> None:
+        """Writes a stage output atomically; a no-op when the cache is disabled."""
+        if not self.enabled:
+            return
+        entry = self.path(stage, key)
+        tmp_entry = f"{entry}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        os.makedirs(tmp_entry)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_entry, f"{name}.npy"), np.ascontiguousarray(array))
+        if objects:
+            joblib.dump(objects, os.path.join(tmp_entry, 'objects.joblib'))
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp_entry, entry)
+
+@contextmanager
+def track_stage(name: str, metrics: Dict[str, float]) -> Iterator[None]:
+    """
+    Records a stage's wall time and peak traced memory into `metrics`.
+
+    Adds `stage_<name>_seconds` and `stage_<name>_peak_mb`, ready for `mlflow.log_metrics`.
+    """
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics[f"stage_{name}_seconds"] = time.perf_counter() - start
+        metrics[f"stage_{name}_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        if started_tracing:
+            tracemalloc.stop()
@@ -5,98 +5,228 @@ import xgboost as xgb
 import mlflow
 import mlflow.xgboost
 import shap
+import sklearn
+import imblearn
 import matplotlib.pyplot as plt
+from typing import Any, Dict, Optional, Tuple
 from sklearn.model_selection import train_test_split
+from sklearn.neighbors import NearestNeighbors
 from sklearn.metrics import precision_recall_curve, auc, f1_score, precision_score, recall_score, confusion_matrix
 from imblearn.over_sampling import SMOTE
 from src.utils.config import Config
 from src.data.loader import DataLoader
+from src.features import engineering, ip_index, windows
 from src.features.engineering import FeatureEngineer
+from src.features.fast_path import FastFeaturePath
+from src.models.stages import StageCache, code_fingerprint, fingerprint, track_stage
+from src.models.explain import stratified_sample
+from src.models.bundle import export_bundle, new_version
 import joblib
 
-def train_model():
-    config = Config()
-    
-    # 1. Load Data
-    loader = DataLoader(config)
+# XGBoost hyperparameters used when train_model is not given tuned ones
+DEFAULT_XGB_PARAMS = {
+    "n_estimators": 100,
+    "max_depth": 6,
+    "learning_rate": 0.1,
+}
+
+def build_features(config: Config, loader: DataLoader, cache: StageCache) -> Tuple[Dict[str, Any], str]:
+    """
+    Loads the raw data and runs feature engineering, or reuses a cached result.
+
+    The cache key covers both raw files, the feature engineering code and the
+    library versions that affect its output.
+
+    Returns:
+        Tuple[Dict, str]: Feature matrix `X`, labels `y`, `feature_names`, the fitted
+        `fe`, and the stage key.
+    """
+    key = fingerprint(
+        "features",
+        loader.fingerprint(config.FRAUD_DATA_PATH),
+        loader.fingerprint(config.IP_TO_COUNTRY_PATH),
+        code_fingerprint(engineering.__file__, ip_index.__file__, windows.__file__),
+        pd.__version__, sklearn.__version__
+    )
+    cached = cache.load("features", key)
+    if cached is not None:
+        print("Reusing cached features...")
+        return cached, key
+
     df_fraud = loader.load_fraud_data()
     ip_map = loader.load_ip_country_map()
-    
-    # 2. Feature Engineering
+
     fe = FeatureEngineer(config)
     fe.fit_ip_map(ip_map)
-    
+
     print("Engineering features...")
     df_transformed = fe.transform(df_fraud, is_training=True)
-    
+
     # Define features and target
     X = df_transformed.drop('class', axis=1)
-    y = df_transformed['class']
-    
-    # 3. Train-Test Split
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=config.TEST_SIZE, random_state=config.RANDOM_STATE, stratify=y
+    outputs = {
+        "X": X.to_numpy(dtype=np.float64),
+        "y": df_transformed['class'].to_numpy(),
+        "feature_names": list(X.columns),
+        "fe": fe
+    }
+    cache.save("features", key, {"X": outputs["X"], "y": outputs["y"]},
+               {"feature_names": outputs["feature_names"], "fe": fe})
+    return outputs, key
+
+def split_data(config: Config, cache: StageCache, y: np.ndarray, features_key: str) -> Tuple[Dict[str, Any], str]:
+    """Computes (or reuses) stratified train/test row indices."""
+    key = fingerprint("split", features_key, config.TEST_SIZE, config.RANDOM_STATE)
+    cached = cache.load("split", key)
+    if cached is not None:
+        return cached, key
+    train_idx, test_idx = train_test_split(
+        np.arange(len(y)), test_size=config.TEST_SIZE, random_state=config.RANDOM_STATE, stratify=y
     )
-    
-    # 4. Handle Imbalance (SMOTE on training set only)
+    outputs = {"train_idx": train_idx, "test_idx": test_idx}
+    cache.save("split", key, outputs)
+    return outputs, key
+
+def resample_training_set(config: Config, cache: StageCache, X_train: np.ndarray, y_train: np.ndarray,
+                          split_key: str) -> Tuple[Dict[str, Any], str]:
+    """Applies SMOTE to the training split (or reuses a cached result)."""
+    key = fingerprint(
+        "smote", split_key, config.SMOTE_SAMPLING_STRATEGY, config.SMOTE_K_NEIGHBORS,
+        config.RANDOM_STATE, imblearn.__version__, sklearn.__version__
+    )
+    cached = cache.load("smote", key)
+    if cached is not None:
+        print("Reusing cached SMOTE resample...")
+        return cached, key
+
     print("Applying SMOTE...")
-    smote = SMOTE(sampling_strategy=0.5, random_state=config.RANDOM_STATE)
-    X_train_res, y_train_res = smote.fit_resample(X_train, y_train)
-    
+    smote = SMOTE(
+        sampling_strategy=config.SMOTE_SAMPLING_STRATEGY,
+        # SMOTE counts the sample itself among the neighbours
+        k_neighbors=NearestNeighbors(n_neighbors=config.SMOTE_K_NEIGHBORS + 1, n_jobs=config.N_JOBS),
+        random_state=config.RANDOM_STATE
+    )
+    X_res, y_res = smote.fit_resample(X_train, y_train)
+    outputs = {"X": X_res, "y": y_res}
+    cache.save("smote", key, outputs)
+    return outputs, key
+
+def train_model(xgb_params: Optional[Dict[str, Any]] = None):
+    """
+    Runs the full training pipeline and logs the model to MLflow.
+
+    Args:
+        xgb_params (Optional[Dict]): XGBoost hyperparameters overriding DEFAULT_XGB_PARAMS,
+            e.g. the best configuration found by `src.models.tuning`.
+    """
+    config = Config()
+    loader = DataLoader(config)
+    cache = StageCache(config.STAGE_CACHE_DIR, enabled=config.USE_STAGE_CACHE)
+    stage_metrics: Dict[str, float] = {}
+
+    # 1-2. Load Data and Feature Engineering
+    with track_stage("features", stage_metrics):
+        features, features_key = build_features(config, loader, cache)
+    fe = features["fe"]
+    feature_names = features["feature_names"]
+    X, y = features["X"], features["y"]
+
+    # 3. Train-Test Split
+    with track_stage("split", stage_metrics):
+        split, split_key = split_data(config, cache, y, features_key)
+    X_train, y_train = X[split["train_idx"]], y[split["train_idx"]]
+    X_test = pd.DataFrame(X[split["test_idx"]], columns=feature_names)
+    y_test = y[split["test_idx"]]
+
+    # 4. Handle Imbalance (SMOTE on training set only)
+    with track_stage("smote", stage_metrics):
+        resampled, _ = resample_training_set(config, cache, X_train, y_train, split_key)
+    X_train_res = pd.DataFrame(resampled["X"], columns=feature_names)
+    y_train_res = resampled["y"]
+
     # 5. MLflow Tracking
     mlflow.set_tracking_uri(config.MLFLOW_TRACKING_URI)
     mlflow.set_experiment(config.MLFLOW_EXPERIMENT_NAME)
-    
+
     with mlflow.start_run():
         print("Training model...")
         model = xgb.XGBClassifier(
-            n_estimators=100,
-            max_depth=6,
-            learning_rate=0.1,
+            **{**DEFAULT_XGB_PARAMS, **(xgb_params or {})},
             random_state=config.RANDOM_STATE,
+            n_jobs=config.N_JOBS,
             use_label_encoder=False,
             eval_metric='aucpr'
         )
-        
-        model.fit(X_train_res, y_train_res)
-        
+
+        with track_stage("fit", stage_metrics):
+            model.fit(X_train_res, y_train_res)
+
         # 6. Evaluation
         y_pred = model.predict(X_test)
         y_proba = model.predict_proba(X_test)[:, 1]
-        
+
         precision, recall, _ = precision_recall_curve(y_test, y_proba)
         pr_auc = auc(recall, precision)
         f1 = f1_score(y_test, y_pred)
-        
+
         # Log parameters and metrics
         mlflow.log_params(model.get_params())
+        mlflow.log_param("features_key", features_key)
         mlflow.log_metric("pr_auc", pr_auc)
         mlflow.log_metric("f1_score", f1)
         mlflow.log_metric("precision", precision_score(y_test, y_pred))
         mlflow.log_metric("recall", recall_score(y_test, y_pred))
-        
+
         print(f"Model trained. PR-AUC: {pr_auc:.4f}, F1: {f1:.4f}")
-        
-        # 7. SHAP Explainability
+
+        # 7. SHAP Explainability on a stratified sample that keeps every fraud case
         print("Calculating SHAP values...")
-        explainer = shap.TreeExplainer(model)
-        shap_values = explainer.shap_values(X_test)
-        
-        # Global Summary Plot
-        plt.figure(figsize=(10, 6))
-        shap.summary_plot(shap_values, X_test, show=False)
-        plt.tight_layout()
-        plt.savefig("shap_summary.png")
-        mlflow.log_artifact("shap_summary.png")
-        plt.close()
-        
+        with track_stage("shap", stage_metrics):
+            sample_idx = stratified_sample(y_test, config.SHAP_SAMPLE_SIZE, config.RANDOM_STATE)
+            X_shap = X_test.iloc[sample_idx]
+            explainer = shap.TreeExplainer(model)
+            shap_values = explainer.shap_values(X_shap)
+            mlflow.log_metric("shap_sample_size", len(sample_idx))
+
+            # Global Summary Plot
+            plt.figure(figsize=(10, 6))
+            shap.summary_plot(shap_values, X_shap, show=False)
+            plt.tight_layout()
+            plt.savefig("shap_summary.png")
+            mlflow.log_artifact("shap_summary.png")
+            plt.close()
+
+            # Persist the explainer and its background rows for offline analysis
+            os.makedirs("models", exist_ok=True)
+            joblib.dump(explainer, "models/shap_explainer.joblib")
+            X_shap.assign(**{'class': y_test[sample_idx]}).to_parquet("models/shap_background.parquet")
+            mlflow.log_artifact("models/shap_explainer.joblib")
+            mlflow.log_artifact("models/shap_background.parquet")
+
         # 8. Save Model and Preprocessors
-        mlflow.xgboost.log_model(model, "model")
-        
-        # Save preprocessors separately for inference
-        os.makedirs("models", exist_ok=True)
-        joblib.dump(fe, "models/feature_engineer.joblib")
-        mlflow.log_artifact("models/feature_engineer.joblib")
+        with track_stage("save", stage_metrics):
+            mlflow.xgboost.log_model(model, "model")
+
+            # Save preprocessors separately for inference
+            os.makedirs("models", exist_ok=True)
+            joblib.dump(fe, config.FEATURE_ENGINEER_PATH)
+            mlflow.log_artifact(config.FEATURE_ENGINEER_PATH)
+
+            # Self-contained bundle the API loads without MLflow or unpickling
+            # Raw canary transactions let the API validate the bundle before hot-swapping it in
+            raw = loader.load_fraud_data().drop(columns='class')
+            canary = raw.sample(n=min(config.CANARY_SIZE, len(raw)), random_state=config.RANDOM_STATE)
+            run_id = mlflow.active_run().info.run_id
+            bundle_path = export_bundle(
+                model, FastFeaturePath(fe, feature_names=feature_names), config.MODEL_BUNDLE_DIR,
+                version=new_version(run_id), metadata={"source": "train", "run_id": run_id},
+                canary=[{**record, 'velocity': 1} for record in canary.to_dict('records')]
+            )
+            mlflow.log_artifacts(bundle_path, "bundle")
+            mlflow.set_tag("bundle_version", os.path.basename(bundle_path))
+
+        # Per-stage wall time and peak traced memory
+        mlflow.log_metrics(stage_metrics)
 
 if __name__ == "__main__":
     train_model()
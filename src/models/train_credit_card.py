@@ -0,0 +1,332 @@
+import os
+import sys
+import tempfile
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from src.utils.config import Config
+from src.models.stages import track_stage
+
+# creditcard.csv: seconds since the first transaction, 28 PCA components, amount and label
+PCA_COLUMNS = [f"V{i}" for i in range(1, 29)]
+FEATURE_NAMES = PCA_COLUMNS + ['Amount', 'hour_of_day']
+LABEL_COLUMN = 'Class'
+CSV_DTYPES = {**{col: np.float32 for col in PCA_COLUMNS}, 'Time': np.float64, 'Amount': np.float32,
+              LABEL_COLUMN: np.int8}
+# Score bins of the streaming precision-recall curve
+PR_BINS = 10_000
+
+# Defaults for the streamed model; no resampling, imbalance is handled by scale_pos_weight
+DEFAULT_CREDIT_CARD_PARAMS = {
+    "objective": "binary:logistic",
+    "eval_metric": "aucpr",
+    "tree_method": "hist",
+    "max_depth": 6,
+    "eta": 0.1,
+    "max_bin": 256,
+}
+
+def read_chunks(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Streams the credit card CSV in typed chunks of `chunk_rows` rows."""
+    yield from pd.read_csv(path, dtype=CSV_DTYPES, chunksize=chunk_rows)
+
+def chunk_features(chunk: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Builds the model matrix for one chunk.
+
+    `Time` counts seconds from the start of the capture, so only its time of
+    day is kept; the PCA components and amount are used as they are.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: float32 features in `FEATURE_NAMES` order and int labels.
+    """
+    X = np.empty((len(chunk), len(FEATURE_NAMES)), dtype=np.float32)
+    X[:, :len(PCA_COLUMNS) + 1] = chunk[PCA_COLUMNS + ['Amount']].to_numpy(dtype=np.float32)
+    X[:, -1] = (chunk['Time'].to_numpy() % 86400) / 3600
+    return X, chunk[LABEL_COLUMN].to_numpy(dtype=np.int32)
+
+def count_classes(path: str, chunk_rows: int) -> Dict[int, int]:
+    """Counts rows per class in one streaming pass over the label column."""
+    counts: Dict[int, int] = {}
+    for chunk in pd.read_csv(path, usecols=[LABEL_COLUMN], dtype={LABEL_COLUMN: np.int8}, chunksize=chunk_rows):
+        for label, count in zip(*np.unique(chunk[LABEL_COLUMN].to_numpy(), return_counts=True)):
+            counts[int(label)] = counts.get(int(label), 0) + int(count)
+    return counts
+
+class StreamingStratifiedSplit:
+    """
+    Exact stratified train/test assignment over a stream, in constant memory.
+
+    For each class, `round(test_size * n)` of its `n` rows go to the test set,
+    chosen uniformly at random: every chunk draws how many of its rows of that
+    class are test rows from a hypergeometric distribution over the rows still
+    to come, then picks which ones. This gives the same distribution as
+    sampling the test rows from the whole file at once, without holding any
+    row indices. `reset` replays exactly the same assignment, which the data
+    iterators rely on when XGBoost makes several passes.
+    """
+
+    def __init__(self, class_counts: Dict[int, int], test_size: float = 0.2, seed: int = 42):
+        """
+        Initializes the split.
+
+        Args:
+            class_counts (Dict[int, int]): Rows per class, e.g. from `count_classes`.
+            test_size (float): Fraction of each class assigned to the test set.
+            seed (int): Random seed.
+        """
+        self.class_counts = dict(class_counts)
+        self.test_counts = {label: int(round(test_size * n)) for label, n in class_counts.items()}
+        self.seed = seed
+        self.reset()
+
+    def reset(self) -> None:
+        """Restarts the assignment from the first row."""
+        self._rng = np.random.default_rng(self.seed)
+        self._rows_left = dict(self.class_counts)
+        self._test_left = dict(self.test_counts)
+
+    def assign(self, y: np.ndarray) -> np.ndarray:
+        """
+        Assigns the next chunk's rows.
+
+        Args:
+            y (np.ndarray): Labels of the chunk, in file order.
+
+        Returns:
+            np.ndarray: Boolean mask, True for test rows.
+        """
+        is_test = np.zeros(len(y), dtype=bool)
+        for label in self.class_counts:
+            rows = np.flatnonzero(y == label)
+            if not len(rows):
+                continue
+            rows_left, test_left = self._rows_left[label], self._test_left[label]
+            if len(rows) > rows_left:
+                raise ValueError(f"More rows of class {label} than counted; the file changed during training")
+            n_test = int(self._rng.hypergeometric(test_left, rows_left - test_left, len(rows))) if test_left else 0
+            is_test[self._rng.choice(rows, size=n_test, replace=False)] = True
+            self._rows_left[label] = rows_left - len(rows)
+            self._test_left[label] = test_left - n_test
+        return is_test
+
+class CreditCardIter(xgb.DataIter):
+    """
+    Feeds one side of the split to XGBoost chunk by chunk.
+
+    With a `cache_prefix`, XGBoost builds an external-memory DMatrix whose
+    quantized pages are written under that prefix, so only one chunk is ever
+    held in memory as raw floats.
+    """
+
+    def __init__(self, path: str, chunk_rows: int, split: StreamingStratifiedSplit, test: bool = False,
+                 cache_prefix: Optional[str] = None):
+        """
+        Initializes the iterator.
+
+        Args:
+            path (str): creditcard.csv path.
+            chunk_rows (int): Rows read per chunk.
+            split (StreamingStratifiedSplit): Assignment shared by the train and test iterators' seeds.
+            test (bool): Yield the test rows instead of the training rows.
+            cache_prefix (Optional[str]): Page cache location for external memory.
+        """
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.split = split
+        self.test = test
+        self._chunks: Optional[Iterator[pd.DataFrame]] = None
+        super().__init__(cache_prefix=cache_prefix, on_host=False)
+
+    def next(self, input_data: Callable) -> bool:
+        """Passes the next chunk's selected rows to XGBoost; returns False at the end of the file."""
+        if self._chunks is None:
+            self._chunks = read_chunks(self.path, self.chunk_rows)
+        for chunk in self._chunks:
+            X, y = chunk_features(chunk)
+            mask = self.split.assign(y)
+            if not self.test:
+                mask = ~mask
+            if mask.any():
+                input_data(data=X[mask], label=y[mask], feature_names=FEATURE_NAMES)
+                return True
+        return False
+
+    def reset(self) -> None:
+        """Rewinds to the start of the file and of the split."""
+        self._chunks = None
+        self.split.reset()
+
+class StreamingMetrics:
+    """
+    Binary classification metrics accumulated chunk by chunk in constant memory.
+
+    Confusion counts at the threshold are exact; the precision-recall curve
+    uses `PR_BINS` score bins per class, which is accurate to the bin width.
+    """
+
+    def __init__(self, threshold: float = 0.5, bins: int = PR_BINS):
+        self.threshold = threshold
+        self.bins = bins
+        self.hist = np.zeros((2, bins), dtype=np.int64)
+        self.tp = self.fp = self.fn = self.tn = 0
+
+    def update(self, y: np.ndarray, scores: np.ndarray) -> None:
+        """Adds a chunk of labels and predicted probabilities."""
+        idx = np.minimum((scores * self.bins).astype(np.int64), self.bins - 1)
+        for label in (0, 1):
+            self.hist[label] += np.bincount(idx[y == label], minlength=self.bins)
+        predicted = scores > self.threshold
+        positive = y == 1
+        self.tp += int(np.sum(predicted & positive))
+        self.fp += int(np.sum(predicted & ~positive))
+        self.fn += int(np.sum(~predicted & positive))
+        self.tn += int(np.sum(~predicted & ~positive))
+
+    def pr_auc(self) -> float:
+        """Area under the precision-recall curve, sweeping the threshold down through the bins."""
+        tp = np.cumsum(self.hist[1][::-1])
+        fp = np.cumsum(self.hist[0][::-1])
+        if tp[-1] == 0:
+            return 0.0
+        keep = (tp + fp) > 0
+        precision = np.concatenate([[1.0], tp[keep] / (tp[keep] + fp[keep])])
+        recall = np.concatenate([[0.0], tp[keep] / tp[-1]])
+        return float(np.trapezoid(precision, recall))
+
+    def results(self) -> Dict[str, float]:
+        """Returns PR-AUC, precision, recall and F1 at the threshold, and the test set size."""
+        precision = self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+        recall = self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+        return {
+            "pr_auc": self.pr_auc(),
+            "precision": precision,
+            "recall": recall,
+            "f1_score": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+            "test_rows": self.tp + self.fp + self.fn + self.tn,
+        }
+
+def evaluate(booster: xgb.Booster, path: str, chunk_rows: int, split: StreamingStratifiedSplit) -> Dict[str, float]:
+    """Scores the test rows chunk by chunk and returns `StreamingMetrics.results`."""
+    metrics = StreamingMetrics()
+    split.reset()
+    for chunk in read_chunks(path, chunk_rows):
+        X, y = chunk_features(chunk)
+        mask = split.assign(y)
+        if mask.any():
+            metrics.update(y[mask], booster.inplace_predict(X[mask]))
+    return metrics.results()
+
+def _peak_rss_mb() -> Optional[float]:
+    """
+    Returns the process's peak resident memory in MB, including XGBoost's native allocations.
+
+    Returns None where the `resource` module is unavailable, i.e. on Windows.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024  # Bytes on macOS, KiB on Linux
+
+def fit_streaming(path: str, params: Optional[Dict[str, Any]] = None, num_boost_round: int = 200,
+                  chunk_rows: int = 100_000, test_size: float = 0.2, seed: int = 42,
+                  external_memory: bool = True, cache_dir: Optional[str] = None,
+                  stage_metrics: Optional[Dict[str, float]] = None) -> Tuple[xgb.Booster, Dict[str, Any]]:
+    """
+    Trains on creditcard.csv without ever loading it whole.
+
+    Passes over the file: one to count classes, XGBoost's own passes through
+    the training iterator (sketching quantiles, then building pages), and one
+    to evaluate the test rows. The class imbalance is handled with
+    `scale_pos_weight` from the training counts instead of SMOTE, so no
+    synthetic rows are materialized.
+
+    Args:
+        path (str): creditcard.csv path.
+        params (Optional[Dict]): XGBoost parameters overriding DEFAULT_CREDIT_CARD_PARAMS.
+        num_boost_round (int): Boosting rounds.
+        chunk_rows (int): Rows per chunk, which bounds the raw data held in memory.
+        test_size (float): Fraction of each class held out.
+        seed (int): Split and training seed.
+        external_memory (bool): Keep the quantized training matrix on disk instead of in memory.
+        cache_dir (Optional[str]): Directory for external-memory pages; a temporary one by default.
+        stage_metrics (Optional[Dict]): Receives per-stage time and peak memory.
+
+    Returns:
+        Tuple[xgb.Booster, Dict]: The model and a summary with test metrics, class counts and parameters.
+    """
+    stage_metrics = stage_metrics if stage_metrics is not None else {}
+    with track_stage("scan", stage_metrics):
+        class_counts = count_classes(path, chunk_rows)
+    split = StreamingStratifiedSplit(class_counts, test_size, seed)
+    train_neg = class_counts.get(0, 0) - split.test_counts.get(0, 0)
+    train_pos = class_counts.get(1, 0) - split.test_counts.get(1, 0)
+    params = {
+        **DEFAULT_CREDIT_CARD_PARAMS,
+        "scale_pos_weight": train_neg / max(train_pos, 1),
+        "seed": seed,
+        **(params or {}),
+    }
+
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="credit_card_pages_", dir=cache_dir) as tmp:
+        with track_stage("fit", stage_metrics):
+            if external_memory:
+                train_iter = CreditCardIter(path, chunk_rows, split, cache_prefix=os.path.join(tmp, "train"))
+                dtrain = xgb.ExtMemQuantileDMatrix(train_iter, max_bin=params["max_bin"])
+            else:
+                dtrain = xgb.QuantileDMatrix(CreditCardIter(path, chunk_rows, split), max_bin=params["max_bin"])
+            booster = xgb.train(params, dtrain, num_boost_round=num_boost_round)
+            del dtrain
+
+    with track_stage("evaluate", stage_metrics):
+        results = evaluate(booster, path, chunk_rows, split)
+    peak_rss = _peak_rss_mb()
+    if peak_rss is not None:
+        stage_metrics["peak_rss_mb"] = peak_rss
+    summary = {
+        **results,
+        "train_rows": train_neg + train_pos,
+        "train_fraud_rows": train_pos,
+        "params": params,
+        "num_boost_round": num_boost_round,
+    }
+    return booster, summary
+
+def train_credit_card_model(xgb_params: Optional[Dict[str, Any]] = None) -> xgb.Booster:
+    """
+    Runs the streaming credit card pipeline and logs the model to MLflow.
+
+    Args:
+        xgb_params (Optional[Dict]): XGBoost parameters overriding DEFAULT_CREDIT_CARD_PARAMS.
+    """
+    import mlflow
+    import mlflow.xgboost
+
+    config = Config()
+    stage_metrics: Dict[str, float] = {}
+    mlflow.set_tracking_uri(config.MLFLOW_TRACKING_URI)
+    mlflow.set_experiment(config.MLFLOW_EXPERIMENT_NAME)
+    with mlflow.start_run(tags={"dataset": "creditcard"}):
+        print(f"Training on {config.CREDIT_CARD_PATH} in chunks of {config.CREDIT_CARD_CHUNK_ROWS} rows...")
+        booster, summary = fit_streaming(
+            config.CREDIT_CARD_PATH, xgb_params, config.CREDIT_CARD_BOOST_ROUNDS, config.CREDIT_CARD_CHUNK_ROWS,
+            config.TEST_SIZE, config.RANDOM_STATE, config.CREDIT_CARD_EXTERNAL_MEMORY, config.CREDIT_CARD_CACHE_DIR,
+            stage_metrics
+        )
+        mlflow.log_params({**summary["params"], "num_boost_round": summary["num_boost_round"],
+                           "chunk_rows": config.CREDIT_CARD_CHUNK_ROWS,
+                           "external_memory": config.CREDIT_CARD_EXTERNAL_MEMORY})
+        mlflow.log_metrics({key: summary[key] for key in
+                            ("pr_auc", "precision", "recall", "f1_score", "train_rows", "test_rows")})
+        mlflow.log_metrics(stage_metrics)
+        mlflow.xgboost.log_model(booster, "model")
+        print(f"Model trained. PR-AUC: {summary['pr_auc']:.4f}, F1: {summary['f1_score']:.4f}")
+    return booster
+
+if __name__ == "__main__":
+    train_credit_card_model()
@@ -0,0 +1,163 @@
+import math
+import os
+import time
+import numpy as np
+import xgboost as xgb
+import mlflow
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+from src.utils.config import Config
+from src.data.loader import DataLoader
+from src.models.stages import StageCache, fingerprint
+from src.models.train import build_features, split_data, resample_training_set, train_model
+
+def sample_configs(n_configs: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Draws random XGBoost configurations from the search space."""
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "max_depth": int(rng.integers(3, 11)),
+            "learning_rate": float(10 ** rng.uniform(-2, math.log10(0.3))),
+            "subsample": float(rng.uniform(0.6, 1.0)),
+            "colsample_bytree": float(rng.uniform(0.5, 1.0)),
+            "min_child_weight": float(rng.integers(1, 11)),
+            "reg_lambda": float(10 ** rng.uniform(-1, 1)),
+        }
+        for _ in range(n_configs)
+    ]
+
+def run_trial(params: Dict[str, Any], n_estimators: int, data_paths: Dict[str, str],
+              early_stopping_rounds: int, n_threads: int, random_state: int) -> Dict[str, Any]:
+    """
+    Trains one configuration with early stopping on validation `aucpr`.
+
+    Runs inside a worker process. Arrays are memory-mapped from `data_paths`,
+    so every worker shares the same page cache instead of receiving a pickled copy.
+    """
+    start = time.perf_counter()
+    arrays = {name: np.load(path, mmap_mode='r') for name, path in data_paths.items()}
+    model = xgb.XGBClassifier(
+        **params,
+        n_estimators=n_estimators,
+        early_stopping_rounds=early_stopping_rounds,
+        eval_metric='aucpr',
+        n_jobs=n_threads,
+        random_state=random_state
+    )
+    model.fit(arrays["X_fit"], arrays["y_fit"], eval_set=[(arrays["X_valid"], arrays["y_valid"])], verbose=False)
+    return {
+        "params": params,
+        "n_estimators": n_estimators,
+        "aucpr": float(model.best_score),
+        "best_iteration": int(model.best_iteration),
+        "seconds": time.perf_counter() - start,
+    }
+
+def successive_halving(configs: List[Dict[str, Any]], data_paths: Dict[str, str], min_estimators: int = 50,
+                       max_estimators: int = 800, eta: int = 3, early_stopping_rounds: int = 20,
+                       n_workers: Optional[int] = None, random_state: int = 42) -> List[List[Dict[str, Any]]]:
+    """
+    Evaluates configurations with successive halving across a process pool.
+
+    Every rung trains the surviving configurations with `eta` times more trees
+    than the last and keeps the best `1/eta` by validation aucpr, so weak
+    configurations only ever get the smallest budget.
+
+    Args:
+        configs (List[Dict]): Candidate XGBoost hyperparameters.
+        data_paths (Dict[str, str]): `.npy` paths for X_fit, y_fit, X_valid and y_valid.
+        min_estimators (int): Tree budget of the first rung.
+        max_estimators (int): Tree budget cap of the last rung.
+        eta (int): Reduction factor between rungs.
+        early_stopping_rounds (int): Rounds without aucpr improvement before a trial stops.
+        n_workers (Optional[int]): Worker processes, defaults to the CPU count.
+        random_state (int): Seed passed to every trial.
+
+    Returns:
+        List[List[Dict]]: Trial results per rung, best first within each rung.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    n_threads = max(1, (os.cpu_count() or 1) // n_workers)
+    rungs = []
+    survivors = configs
+    n_estimators = min_estimators
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        while survivors:
+            futures = [
+                pool.submit(run_trial, params, n_estimators, data_paths, early_stopping_rounds, n_threads, random_state)
+                for params in survivors
+            ]
+            results = sorted((f.result() for f in futures), key=lambda r: r["aucpr"], reverse=True)
+            rungs.append(results)
+            print(f"Rung {len(rungs)}: {len(results)} configs x {n_estimators} trees, best aucpr {results[0]['aucpr']:.4f}")
+            if len(results) == 1 or n_estimators >= max_estimators:
+                break
+            survivors = [r["params"] for r in results[:max(1, len(results) // eta)]]
+            n_estimators = min(n_estimators * eta, max_estimators)
+    return rungs
+
+def prepare_search_data(config: Config) -> Dict[str, str]:
+    """
+    Builds the search arrays on disk and returns their `.npy` paths.
+
+    The training split is split again into fit and validation rows. Only the fit
+    rows are resampled with SMOTE, and the test split is never touched. All
+    stages reuse the training pipeline's cache.
+    """
+    cache = StageCache(config.STAGE_CACHE_DIR)
+    features, features_key = build_features(config, DataLoader(config), cache)
+    X, y = features["X"], features["y"]
+    split, split_key = split_data(config, cache, y, features_key)
+    train_idx = split["train_idx"]
+
+    inner, inner_key = split_data(config, cache, y[train_idx], split_key)
+    fit_rows, valid_rows = train_idx[inner["train_idx"]], train_idx[inner["test_idx"]]
+    _, smote_key = resample_training_set(config, cache, X[fit_rows], y[fit_rows], inner_key)
+
+    valid_key = fingerprint("search_valid", inner_key)
+    if cache.load("search_valid", valid_key) is None:
+        cache.save("search_valid", valid_key, {"X": X[valid_rows], "y": y[valid_rows]})
+
+    smote_dir, valid_dir = cache.path("smote", smote_key), cache.path("search_valid", valid_key)
+    return {
+        "X_fit": os.path.join(smote_dir, "X.npy"),
+        "y_fit": os.path.join(smote_dir, "y.npy"),
+        "X_valid": os.path.join(valid_dir, "X.npy"),
+        "y_valid": os.path.join(valid_dir, "y.npy"),
+    }
+
+def tune_hyperparameters(n_configs: int = 27, eta: int = 3, n_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Runs the successive-halving search and logs every trial as a nested MLflow run.
+
+    Returns:
+        Dict: Best hyperparameters, including the early-stopped number of trees.
+    """
+    config = Config()
+    data_paths = prepare_search_data(config)
+    configs = sample_configs(n_configs, seed=config.RANDOM_STATE)
+
+    mlflow.set_tracking_uri(config.MLFLOW_TRACKING_URI)
+    mlflow.set_experiment(config.MLFLOW_EXPERIMENT_NAME)
+    with mlflow.start_run(run_name="hyperparameter_search"):
+        rungs = successive_halving(configs, data_paths, eta=eta, n_workers=n_workers,
+                                   random_state=config.RANDOM_STATE)
+        for rung, results in enumerate(rungs, start=1):
+            for trial in results:
+                with mlflow.start_run(run_name=f"rung{rung}", nested=True):
+                    mlflow.log_params({**trial["params"], "n_estimators": trial["n_estimators"], "rung": rung})
+                    mlflow.log_metrics({
+                        "val_aucpr": trial["aucpr"],
+                        "best_iteration": trial["best_iteration"],
+                        "trial_seconds": trial["seconds"],
+                    })
+
+        best = rungs[-1][0]
+        best_params = {**best["params"], "n_estimators": best["best_iteration"] + 1}
+        mlflow.log_params({f"best_{name}": value for name, value in best_params.items()})
+        mlflow.log_metric("best_val_aucpr", best["aucpr"])
+    print(f"Best validation aucpr {best['aucpr']:.4f} with {best_params}")
+    return best_params
+
+if __name__ == "__main__":
+    train_model(tune_hyperparameters())
@@ -1,5 +1,7 @@
 from dataclasses import dataclass
+from typing import Optional
 import os
+import tempfile
 
 @dataclass
 class Config:
@@ -11,15 +13,90 @@ class Config:
     # Data paths
     RAW_DATA_PATH: str = "data-set/raw"
     PROCESSED_DATA_PATH: str = "data-set/processed"
+    USE_DATA_CACHE: bool = True
     
     # Model parameters
     RANDOM_STATE: int = 42
     TEST_SIZE: float = 0.2
+    SMOTE_SAMPLING_STRATEGY: float = 0.5
+    SMOTE_K_NEIGHBORS: int = 5
+    N_JOBS: int = -1  # -1 uses all cores for XGBoost and SMOTE's neighbour search
+    SHAP_SAMPLE_SIZE: int = 2000  # All fraud cases are always included
+
+    # Training stage cache
+    STAGE_CACHE_DIR: str = "data-set/processed/stages"
+    USE_STAGE_CACHE: bool = True
     
     # Feature paths
     IP_TO_COUNTRY_PATH: str = "data-set/raw/IpAddress_to_Country.csv"
     FRAUD_DATA_PATH: str = "data-set/raw/Fraud_Data.csv"
     CREDIT_CARD_PATH: str = "data-set/raw/creditcard.csv"
+    # Streaming credit card training: rows held in memory at once and on-disk quantized pages
+    CREDIT_CARD_CHUNK_ROWS: int = int(os.getenv("CREDIT_CARD_CHUNK_ROWS", "100000"))
+    CREDIT_CARD_BOOST_ROUNDS: int = 200
+    CREDIT_CARD_EXTERNAL_MEMORY: bool = os.getenv("CREDIT_CARD_EXTERNAL_MEMORY", "true").lower() in ("1", "true")
+    CREDIT_CARD_CACHE_DIR: str = "data-set/processed"
+    INFERENCE_LOG_DIR: str = "data-set/inference_logs"
+    INFERENCE_LOG_FORMAT: str = os.getenv("INFERENCE_LOG_FORMAT", "parquet")
+    # Seconds before an open log segment is published, bounding how far drift checks and replay lag behind
+    INFERENCE_LOG_SEGMENT_MAX_AGE: float = float(os.getenv("INFERENCE_LOG_SEGMENT_MAX_AGE", "60"))
+    DRIFT_REFERENCE_PATH: str = "models/drift_reference.json"
+    DRIFT_STATE_PATH: str = "models/drift_state.json"
+    DRIFT_WINDOW_SEGMENTS: int = 20
+
+    # Inference bundles
+    MODEL_BUNDLE_DIR: str = "models/bundles"
+    FEATURE_ENGINEER_PATH: str = "models/feature_engineer.joblib"
+    # Query MLflow (and cache the result as a bundle) when no local bundle exists
+    MLFLOW_FALLBACK: bool = os.getenv("MLFLOW_FALLBACK", "false").lower() in ("1", "true")
+    MODEL_RELOAD_INTERVAL: float = float(os.getenv("MODEL_RELOAD_INTERVAL", "30"))  # Seconds; 0 disables hot reload
+    CANARY_SIZE: int = 200  # Raw transactions stored with each bundle for validation
+    CANARY_MAX_FLIP_RATE: float = 0.2  # Automatic upgrades may flip at most this share of canary predictions
+    # Score small batches with the bundle's trees flattened into NumPy arrays instead of XGBoost
+    COMPILED_SCORER: bool = os.getenv("COMPILED_SCORER", "true").lower() in ("1", "true")
+    ADMIN_TOKEN: Optional[str] = os.getenv("ADMIN_TOKEN")  # Required in X-Admin-Token
+    # Admin endpoints are refused without ADMIN_TOKEN unless this is set, for local development only
+    ADMIN_INSECURE: bool = os.getenv("ADMIN_INSECURE", "false").lower() in ("1", "true")
+
+    # API settings
+    MAX_BATCH_SIZE: int = 1000
+    EXPLAIN_CACHE_SIZE: int = 4096
+
+    # Replay results of retried /predict and /predict/batch requests, keyed by Idempotency-Key or payload
+    RESULT_CACHE_ENABLED: bool = os.getenv("RESULT_CACHE_ENABLED", "true").lower() in ("1", "true")
+    RESULT_CACHE_TTL: float = float(os.getenv("RESULT_CACHE_TTL", "600"))  # Seconds
+    RESULT_CACHE_MAX_ENTRIES: int = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "100000"))
+    MAX_IDEMPOTENCY_KEY_LENGTH: int = 255
+
+    # Shadow scoring: comma-separated bundle versions scored off the response path and logged
+    SHADOW_CHALLENGERS: str = os.getenv("SHADOW_CHALLENGERS", "")
+    SHADOW_WORKERS: int = int(os.getenv("SHADOW_WORKERS", "1"))
+    SHADOW_MAX_QUEUE: int = int(os.getenv("SHADOW_MAX_QUEUE", "1000"))  # Queued requests before shadow work is shed
+
+    # Server-side micro-batching of /predict: requests wait up to MICRO_BATCH_MAX_WAIT_MS for others
+    MICRO_BATCH_ENABLED: bool = os.getenv("MICRO_BATCH_ENABLED", "false").lower() in ("1", "true")
+    MICRO_BATCH_MAX_WAIT_MS: float = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "2"))
+    MICRO_BATCH_MAX_SIZE: int = int(os.getenv("MICRO_BATCH_MAX_SIZE", "64"))
+    MICRO_BATCH_MAX_QUEUE: int = 10_000
+
+    # Feature store limits
+    FEATURE_STORE_MAX_USERS: int = 1_000_000
+    FEATURE_STORE_MAX_EVENTS_PER_USER: int = 1_000
+    # Purchase times further ahead of the server clock are rejected; also bounds the store's eviction watermark
+    MAX_FUTURE_SKEW_SECONDS: float = float(os.getenv("MAX_FUTURE_SKEW_SECONDS", "300"))
+
+    # Feature store backend: memory (one worker), shm (workers on one host) or redis
+    FEATURE_STORE_BACKEND: str = os.getenv("FEATURE_STORE_BACKEND", "memory")
+    FEATURE_STORE_SHM_PATH: str = os.getenv(
+        "FEATURE_STORE_SHM_PATH",
+        os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "fraud_feature_store.bin")
+    )
+    FEATURE_STORE_SHM_MAX_USERS: int = 262_144
+    FEATURE_STORE_SHM_MAX_EVENTS: int = 64  # Fixed slot size, so kept smaller than the in-process cap
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    # In-process store snapshots, restored (plus the inference log tail) on startup
+    FEATURE_STORE_SNAPSHOT_PATH: str = "data-set/feature_store/snapshot.npz"
+    FEATURE_STORE_SNAPSHOT_INTERVAL: float = float(os.getenv("FEATURE_STORE_SNAPSHOT_INTERVAL", "60"))  # 0 disables
 
 # Predefined constants
 FRAUD_COLORS = ["#1a73e8", "#d93025"]  # Blue for legit, Red for fraud
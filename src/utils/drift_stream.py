@@ -0,0 +1,196 @@
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from src.utils.inference_log import list_segments, read_segment
+
+DRIFT_FEATURES = ['purchase_value', 'source', 'browser', 'sex', 'age', 'ip_address']
+NUMERIC_FEATURES = ['purchase_value', 'age', 'ip_address']
+OTHER_CATEGORY = "__other__"
+PSI_THRESHOLD = 0.2
+_EPS = 1e-4
+
+class DriftReference:
+    """Binned reference distribution of each drift feature, computed once from training data."""
+
+    def __init__(self, edges: Dict[str, List[float]], categories: Dict[str, List[str]],
+                 counts: Dict[str, List[int]]):
+        """
+        Initializes the reference from precomputed bins.
+
+        Args:
+            edges (Dict[str, List[float]]): Inner quantile bin edges per numeric feature.
+            categories (Dict[str, List[str]]): Known categories per categorical feature.
+            counts (Dict[str, List[int]]): Reference count per bin or category.
+        """
+        self.edges = {feature: np.asarray(e, dtype=np.float64) for feature, e in edges.items()}
+        self.categories = categories
+        self.category_index = {
+            feature: {category: i for i, category in enumerate(cats)} for feature, cats in categories.items()
+        }
+        self.counts = {feature: np.asarray(c, dtype=np.int64) for feature, c in counts.items()}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, n_bins: int = 10) -> "DriftReference":
+        """Builds quantile bins for numeric features and category bins for the rest."""
+        edges, categories = {}, {}
+        for feature in DRIFT_FEATURES:
+            values = df[feature].dropna()
+            if feature in NUMERIC_FEATURES:
+                quantiles = np.quantile(values.to_numpy(dtype=np.float64), np.linspace(0, 1, n_bins + 1)[1:-1])
+                edges[feature] = np.unique(quantiles).tolist()
+            else:
+                categories[feature] = sorted(values.astype(str).unique().tolist()) + [OTHER_CATEGORY]
+        reference = cls(edges, categories, {})
+        reference.counts = reference.bin_counts(df)
+        return reference
+
+    def bin_counts(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """Counts the rows of `df` falling into each reference bin, per feature."""
+        counts = {}
+        for feature, edges in self.edges.items():
+            values = df[feature].dropna().to_numpy(dtype=np.float64)
+            counts[feature] = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+        for feature, index in self.category_index.items():
+            other = index[OTHER_CATEGORY]
+            codes = df[feature].dropna().astype(str).map(index).fillna(other).to_numpy(dtype=np.int64)
+            counts[feature] = np.bincount(codes, minlength=len(index))
+        return counts
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializes the reference to JSON-compatible types."""
+        return {
+            "edges": {feature: e.tolist() for feature, e in self.edges.items()},
+            "categories": self.categories,
+            "counts": {feature: c.tolist() for feature, c in self.counts.items()},
+        }
+
+    def save(self, path: str) -> None:
+        """Writes the reference to a JSON file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str) -> "DriftReference":
+        """Reads a reference previously written by `save`."""
+        with open(path) as f:
+            return cls(**json.load(f))
+
+def psi(expected: np.ndarray, actual: np.ndarray) -> float:
+    """Population Stability Index between two binned distributions."""
+    p = np.maximum(expected / max(expected.sum(), 1), _EPS)
+    q = np.maximum(actual / max(actual.sum(), 1), _EPS)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+def binned_ks(expected: np.ndarray, actual: np.ndarray) -> float:
+    """Kolmogorov-Smirnov statistic evaluated on shared bin edges."""
+    p = np.cumsum(expected) / max(expected.sum(), 1)
+    q = np.cumsum(actual) / max(actual.sum(), 1)
+    return float(np.max(np.abs(p - q)))
+
+class StreamingDriftMonitor:
+    """
+    Incremental drift monitor over inference log segments.
+
+    Each call to `update` reads only segments it has not seen before and keeps
+    their binned counts, so scoring never touches raw rows again. The current
+    window is the last `window_segments` segments, or all of them if None.
+
+    Seen names are pruned to the segments still on disk, so the set (and the
+    saved state) stays bounded by log retention. Names alone cannot serve as
+    a high-water mark: several workers write segments concurrently, and
+    orphaned segments are published on restart, so an older name can appear
+    after a newer one.
+    """
+
+    def __init__(self, reference: DriftReference, log_dir: str, window_segments: Optional[int] = None):
+        """
+        Initializes the monitor.
+
+        Args:
+            reference (DriftReference): Binned training distribution.
+            log_dir (str): Directory of inference log segments.
+            window_segments (Optional[int]): Number of most recent segments in the current window.
+        """
+        self.reference = reference
+        self.log_dir = log_dir
+        self.window_segments = window_segments
+        # Segment name -> binned counts per feature, oldest first
+        self.segment_counts: "OrderedDict[str, Dict[str, np.ndarray]]" = OrderedDict()
+        self.seen_segments: set = set()
+
+    def update(self) -> int:
+        """
+        Bins any new log segments into the current window.
+
+        Returns:
+            int: Number of new rows read.
+        """
+        n_rows = 0
+        paths = list_segments(self.log_dir)
+        # Forget segments deleted by retention; they cannot come back under the same name
+        self.seen_segments.intersection_update(os.path.basename(path) for path in paths)
+        for path in paths:
+            name = os.path.basename(path)
+            if name in self.seen_segments:
+                continue
+            df = read_segment(path, columns=DRIFT_FEATURES)
+            self.segment_counts[name] = self.reference.bin_counts(df)
+            self.seen_segments.add(name)
+            n_rows += len(df)
+        while self.window_segments is not None and len(self.segment_counts) > self.window_segments:
+            self.segment_counts.popitem(last=False)
+        return n_rows
+
+    def current_counts(self) -> Dict[str, np.ndarray]:
+        """Sums binned counts over the segments in the current window."""
+        totals = {feature: np.zeros_like(counts) for feature, counts in self.reference.counts.items()}
+        for counts in self.segment_counts.values():
+            for feature, c in counts.items():
+                totals[feature] += c
+        return totals
+
+    def scores(self) -> Dict[str, Dict[str, Any]]:
+        """Returns PSI, binned KS (numeric features only) and a drift flag per feature."""
+        current = self.current_counts()
+        results = {}
+        for feature, expected in self.reference.counts.items():
+            actual = current[feature]
+            value = psi(expected, actual)
+            results[feature] = {
+                "psi": value,
+                "ks": binned_ks(expected, actual) if feature in self.reference.edges else None,
+                "n_current": int(actual.sum()),
+                "drifted": bool(actual.sum() > 0 and value > PSI_THRESHOLD),
+            }
+        return results
+
+    def save_state(self, path: str) -> None:
+        """Persists seen segments and windowed counts so restarts skip processed logs."""
+        state = {
+            "seen_segments": sorted(self.seen_segments),
+            "segment_counts": {
+                name: {feature: c.tolist() for feature, c in counts.items()}
+                for name, counts in self.segment_counts.items()
+            },
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def load_state(self, path: str) -> None:
+        """Restores state written by `save_state`, if the file exists."""
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            state = json.load(f)
+        self.seen_segments = set(state["seen_segments"])
+        self.segment_counts = OrderedDict(
+            (name, {feature: np.asarray(c, dtype=np.int64) for feature, c in counts.items()})
+            for name, counts in state["segment_counts"].items()
+        )
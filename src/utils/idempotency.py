@@ -0,0 +1,291 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+from src.utils.config import Config
+
+class IdempotencyConflict(ValueError):
+    """Raised when an idempotency key is reused with a different payload."""
+
+def payload_fingerprint(payload: Any) -> str:
+    """Returns a SHA-256 digest of a JSON-serializable payload, independent of key order."""
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+class ResultCache:
+    """
+    Bounded, TTL-evicting cache of request results for idempotent retries.
+
+    The first request for a key reserves it and computes the result; retries
+    arriving while it is still running wait on the same future instead of
+    computing again, and retries arriving later get the stored result until
+    it is `ttl` seconds old. Failed computations are not cached, so a retry
+    after an error runs normally, and neither are entries whose future was
+    cancelled; completing a cancelled future is a no-op.
+
+    Entries are kept in insertion order, which is also expiry order, so
+    expired entries are dropped from the front as new ones arrive and the
+    oldest entry is dropped when `max_entries` is reached.
+    """
+
+    def __init__(self, max_entries: int = 100_000, ttl: float = 600.0, clock: Callable[[], float] = time.monotonic):
+        """
+        Initializes the cache.
+
+        Args:
+            max_entries (int): Entries kept, including those still being computed.
+            ttl (float): Seconds a result is replayed after its request arrived.
+            clock (Callable): Monotonic time source, replaceable in tests.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        # key -> (payload fingerprint, future, expiry time)
+        self._entries: "OrderedDict[str, Tuple[str, Future, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def reserve(self, key: str, fingerprint: str) -> Tuple[Future, bool]:
+        """
+        Looks up a key, reserving it if it has no live entry.
+
+        Args:
+            key (str): Idempotency key, or the payload fingerprint when the client sent none.
+            fingerprint (str): `payload_fingerprint` of the request.
+
+        Returns:
+            Tuple[Future, bool]: The entry's future and whether the caller owns it. The owner
+            must call `complete` or `fail`; everyone else waits on the future.
+
+        Raises:
+            IdempotencyConflict: If the key is live with a different payload.
+        """
+        with self._lock:
+            now = self.clock()
+            self._drop_expired(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1].cancelled():
+                del self._entries[key]  # Holds no result; recompute
+                entry = None
+            elif entry is not None and entry[2] <= now and entry[1].done():
+                # Expired behind a slower entry still in flight at the front
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is not None:
+                if entry[0] != fingerprint:
+                    raise IdempotencyConflict(f"Idempotency key {key!r} was already used with a different payload")
+                if entry[1].done():
+                    self.hits += 1
+                else:
+                    self.waits += 1
+                return entry[1], False
+            self.misses += 1
+            while len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+            future: Future = Future()
+            self._entries[key] = (fingerprint, future, now + self.ttl)
+            return future, True
+
+    def complete(self, key: str, future: Future, result: Any) -> None:
+        """Stores the owner's result and wakes up waiting duplicates."""
+        if not future.done():
+            future.set_result(result)
+
+    def fail(self, key: str, future: Future, error: BaseException) -> None:
+        """Forgets the key so the next retry recomputes, and passes `error` to waiting duplicates."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is future:
+                del self._entries[key]
+        if not future.done():
+            future.set_exception(error)
+
+    def _drop_expired(self, now: float) -> None:
+        """Removes expired entries from the front; called with the lock held."""
+        while self._entries:
+            _, (_, future, expires_at) = next(iter(self._entries.items()))
+            if expires_at > now or not future.done():
+                break
+            self._entries.popitem(last=False)
+            self.expired += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit, miss, in-flight wait and eviction counts and the current size."""
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "waits": self.waits,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+class RedisResultCache:
+    """
+    Idempotency cache in Redis, shared by every API worker and host.
+
+    Unlike `ResultCache`, a retry is recognized whichever worker it reaches.
+    The first request claims the key with `SET NX PX`, storing its payload
+    fingerprint and a pending marker that expires after `pending_ttl`, so a
+    worker dying mid-request does not block the key for the full TTL. The
+    owner then replaces the marker with the JSON-encoded result for `ttl`
+    seconds, or deletes it on failure. Both only happen while the key still
+    holds the owner's marker, checked under WATCH.
+
+    A duplicate arriving while the key is pending polls until the result is
+    stored, for at most `wait_timeout` seconds, so `reserve` blocks and must
+    not be called on the event loop.
+    """
+
+    def __init__(self, client: Any, ttl: float = 600.0, pending_ttl: float = 30.0, wait_timeout: float = 10.0,
+                 poll_interval: float = 0.005, key_prefix: str = "fraud:idempotency:"):
+        """
+        Initializes the cache around a redis-py compatible client.
+
+        Args:
+            client: A `redis.Redis` (or compatible, e.g. fakeredis) client.
+            ttl (float): Seconds a result is replayed after it was stored.
+            pending_ttl (float): Seconds a claimed key stays reserved without a result.
+            wait_timeout (float): Seconds a duplicate waits for the original's result.
+            poll_interval (float): Seconds between checks while waiting.
+            key_prefix (str): Prefix of every key written by the cache.
+        """
+        self.client = client
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.key_prefix = key_prefix
+        # key -> (marker, fingerprint) of the requests this process owns
+        self._owned: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "RedisResultCache":
+        """Connects to a Redis URL such as redis://localhost:6379/0."""
+        import redis
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def reserve(self, key: str, fingerprint: str) -> Tuple[Future, bool]:
+        """
+        Claims a key, or waits for and returns the result stored under it.
+
+        Returns:
+            Tuple[Future, bool]: Whether the caller owns the key, with a future that is
+            pending for the owner and holds the stored result otherwise.
+
+        Raises:
+            IdempotencyConflict: If the key is live with a different payload, or its
+                original request is still running after `wait_timeout`.
+        """
+        marker = os.urandom(8).hex()
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            pending = json.dumps({"fingerprint": fingerprint, "marker": marker})
+            if self.client.set(self.key_prefix + key, pending, nx=True, px=int(self.pending_ttl * 1000)):
+                with self._lock:
+                    self._owned[key] = (marker, fingerprint)
+                    self.misses += 1
+                return Future(), True
+            entry = self._get(key)
+            if entry is None:
+                continue  # Expired or failed between SET and GET; try to claim it again
+            if entry["fingerprint"] != fingerprint:
+                raise IdempotencyConflict(f"Idempotency key {key!r} was already used with a different payload")
+            if "result" in entry:
+                with self._lock:
+                    if waited:
+                        self.waits += 1
+                    else:
+                        self.hits += 1
+                future: Future = Future()
+                future.set_result(entry["result"])
+                return future, False
+            if time.monotonic() >= deadline:
+                raise IdempotencyConflict(f"A request with idempotency key {key!r} is still in progress")
+            waited = True
+            time.sleep(self.poll_interval)
+
+    def complete(self, key: str, future: Future, result: Any) -> None:
+        """Stores the owner's result for `ttl` seconds and resolves its future."""
+        try:
+            self._release(key, result)
+        finally:
+            if not future.done():
+                future.set_result(result)
+
+    def fail(self, key: str, future: Future, error: BaseException) -> None:
+        """Deletes the owner's claim so the next retry recomputes."""
+        try:
+            self._release(key, None, delete=True)
+        finally:
+            if not future.done():
+                future.set_exception(error)
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Reads and decodes the entry stored under a key."""
+        raw = self.client.get(self.key_prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def _release(self, key: str, result: Any, delete: bool = False) -> None:
+        """Stores the result under the key, or deletes it, if it still holds this process's marker."""
+        with self._lock:
+            owned = self._owned.pop(key, None)
+        if owned is None:
+            return
+        marker, fingerprint = owned
+        name = self.key_prefix + key
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(name)
+                raw = pipe.get(name)
+                if raw is None or json.loads(raw).get("marker") != marker:
+                    return  # The claim expired and someone else may own the key now
+                pipe.multi()
+                if delete:
+                    pipe.delete(name)
+                else:
+                    pipe.set(name, json.dumps({"fingerprint": fingerprint, "result": result}),
+                             px=int(self.ttl * 1000))
+                pipe.execute()
+            except Exception as e:  # Including WatchError when the key changed under us
+                print(f"Warning: Could not release idempotency key {key!r}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns this process's hit, miss and in-flight wait counts."""
+        return {"hits": self.hits, "misses": self.misses, "waits": self.waits}
+
+def create_result_cache(config: Config) -> Any:
+    """
+    Builds the idempotency cache matching `config.FEATURE_STORE_BACKEND`, or None if disabled.
+
+    A retry has to be recognized by whichever worker it reaches, so workers sharing
+    velocity state through Redis also share results there. The `shm` backend runs
+    several workers without a shared result store, so the cache is turned off
+    rather than letting retries that reach another worker be counted again.
+    """
+    if not config.RESULT_CACHE_ENABLED:
+        return None
+    if config.FEATURE_STORE_BACKEND == "redis":
+        return RedisResultCache.from_url(config.REDIS_URL, ttl=config.RESULT_CACHE_TTL)
+    if config.FEATURE_STORE_BACKEND == "shm":
+        print("Warning: The result cache cannot be shared between shm workers; idempotent retries are disabled")
+        return None
+    return ResultCache(config.RESULT_CACHE_MAX_ENTRIES, config.RESULT_CACHE_TTL)
@@ -0,0 +1,337 @@
+import csv
+import glob
+import os
+import queue
+import threading
+import time
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Optional
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # CSV segments still work without pyarrow
+    pa = None
+    pq = None
+
+IN_PROGRESS_SUFFIX = ".inprogress"
+QUARANTINE_SUFFIX = ".corrupt"
+
+class InferenceLogWriter:
+    """
+    Buffered, non-blocking writer for inference logs.
+
+    Request handlers call `log`, which only puts the record on a bounded
+    in-process queue. A daemon thread drains the queue and flushes batches
+    when `batch_size` records are waiting or `flush_interval` seconds have
+    passed, appending them to append-only segment files that are rotated
+    after `segment_max_rows` rows or `segment_max_age` seconds, whichever
+    comes first. Segments being written carry an `.inprogress` suffix and
+    are renamed atomically once closed, so readers only ever see complete
+    files, at most `segment_max_age` seconds behind. When the queue is full,
+    records are dropped and counted instead of slowing the request down.
+
+    On start, `.inprogress` segments left behind by a crashed process are
+    published if they can still be read, or renamed with a `.corrupt`
+    suffix otherwise.
+    """
+
+    def __init__(self, directory: str, fmt: str = "parquet", max_queue: int = 10_000,
+                 batch_size: int = 512, flush_interval: float = 1.0, segment_max_rows: int = 100_000,
+                 segment_max_age: float = 60.0):
+        """
+        Initializes the writer; call `start` to launch the background thread.
+
+        Args:
+            directory (str): Directory where log segments are written.
+            fmt (str): 'parquet' or 'csv'. Falls back to CSV if pyarrow is missing.
+            max_queue (int): Maximum number of records buffered in memory.
+            batch_size (int): Number of records that triggers a flush.
+            flush_interval (float): Maximum seconds a record waits before being flushed.
+            segment_max_rows (int): Rows written to a segment before it is rotated.
+            segment_max_age (float): Seconds a segment stays open before it is rotated.
+        """
+        if fmt not in ("parquet", "csv"):
+            raise ValueError(f"Unsupported log format: {fmt}")
+        if fmt == "parquet" and pq is None:
+            print("Warning: pyarrow is not installed, writing inference logs as CSV")
+            fmt = "csv"
+        self.directory = directory
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_max_rows = segment_max_rows
+        self.segment_max_age = segment_max_age
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._segment_path: Optional[str] = None
+        self._segment_rows = 0
+        self._segment_opened_at = 0.0
+        self._segment_seq = 0
+        self._parquet_writer = None
+        self._csv_file = None
+        self._csv_writer = None
+        self.n_enqueued = 0
+        self.n_dropped = 0
+        self.n_written = 0
+        self.n_flushes = 0
+        self.n_errors = 0
+        self.n_recovered = 0
+        self.n_quarantined = 0
+        self.max_queue_depth = 0
+
+    def start(self) -> None:
+        """Starts the background flush thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.recover_orphans()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="inference-log-writer", daemon=True)
+        self._thread.start()
+
+    def recover_orphans(self) -> None:
+        """
+        Publishes or quarantines `.inprogress` segments of processes that are no longer running.
+
+        Segments of live processes, e.g. other API workers sharing the directory,
+        are left alone. CSV segments are cut back to their last complete line;
+        Parquet segments without a footer cannot be read and are quarantined.
+        """
+        for path in glob.glob(os.path.join(self.directory, f"inference-*{IN_PROGRESS_SUFFIX}")):
+            final_path = path[:-len(IN_PROGRESS_SUFFIX)]
+            if final_path == self._segment_path or _writer_alive(final_path):
+                continue
+            try:
+                if final_path.endswith(".csv"):
+                    _truncate_partial_line(path)
+                    pd.read_csv(path, nrows=1)
+                else:
+                    pq.read_metadata(path)
+                os.replace(path, final_path)
+                self.n_recovered += 1
+            except Exception as e:
+                print(f"Warning: Quarantining unreadable inference log segment {path}: {e}")
+                os.replace(path, final_path + QUARANTINE_SUFFIX)
+                self.n_quarantined += 1
+
+    def log(self, record: Dict[str, Any]) -> bool:
+        """
+        Queues one record without blocking.
+
+        Returns:
+            bool: False if the queue was full and the record was dropped.
+        """
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.n_dropped += 1
+            return False
+        self.n_enqueued += 1
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        return True
+
+    def log_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Queues several records, returning how many were accepted."""
+        return sum(self.log(record) for record in records)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Flushes every queued record, closes the open segment and stops the thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # Write anything that was queued after the thread exited
+        self._flush_all(self._drain())
+        self._close_segment()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns queue and throughput counters, including records dropped under backpressure."""
+        return {
+            "enqueued": self.n_enqueued,
+            "written": self.n_written,
+            "dropped": self.n_dropped,
+            "errors": self.n_errors,
+            "flushes": self.n_flushes,
+            "recovered_segments": self.n_recovered,
+            "quarantined_segments": self.n_quarantined,
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+        }
+
+    def _drain(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Pops up to `limit` queued records without waiting."""
+        batch = []
+        while limit is None or len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        """Collects records into batches and flushes them on size or time thresholds."""
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while not self._stop.is_set():
+            timeout = max(deadline - time.monotonic(), 0.0)
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+                batch.extend(self._drain(self.batch_size - len(batch)))
+            except queue.Empty:
+                pass
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+            if self._segment_expired():
+                self._rotate()
+        self._flush_all(batch + self._drain())
+
+    def _flush_all(self, records: List[Dict[str, Any]]) -> None:
+        """Flushes records in `batch_size` chunks so segment rotation still applies."""
+        for i in range(0, len(records), self.batch_size):
+            self._flush(records[i:i + self.batch_size])
+
+    def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        """Appends a batch to the current segment, rotating it when full."""
+        if not batch:
+            return
+        try:
+            if self.fmt == "parquet":
+                self._write_parquet(batch)
+            else:
+                self._write_csv(batch)
+            self.n_written += len(batch)
+            self.n_flushes += 1
+            self._segment_rows += len(batch)
+            if self._segment_rows >= self.segment_max_rows or self._segment_expired():
+                self._close_segment()
+        except Exception as e:
+            self.n_errors += 1
+            print(f"Warning: Failed to write {len(batch)} inference log records: {e}")
+
+    def _segment_expired(self) -> bool:
+        """Whether the open segment has reached `segment_max_age`."""
+        return (self._segment_path is not None
+                and time.monotonic() - self._segment_opened_at >= self.segment_max_age)
+
+    def _rotate(self) -> None:
+        """Publishes the open segment between batches, so an idle writer does not hold rows back."""
+        try:
+            self._close_segment()
+        except OSError as e:
+            self.n_errors += 1
+            print(f"Warning: Failed to rotate inference log segment: {e}")
+
+    def _open_segment(self) -> str:
+        """Creates a new in-progress segment path unique to this process."""
+        self._segment_seq += 1
+        name = f"inference-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self._segment_seq:05d}.{self.fmt}"
+        self._segment_path = os.path.join(self.directory, name)
+        self._segment_rows = 0
+        self._segment_opened_at = time.monotonic()
+        return self._segment_path + IN_PROGRESS_SUFFIX
+
+    def _write_parquet(self, batch: List[Dict[str, Any]]) -> None:
+        """
+        Writes the batch as one Parquet row group.
+
+        Columns are the union of every record's keys, with the open segment's
+        columns first, so records with extra fields (e.g. challenger scores) are
+        never cut down to the first record's keys. Missing values are null.
+        """
+        columns = _union_keys(batch, self._parquet_writer.schema.names if self._parquet_writer is not None else ())
+        table = pa.Table.from_pydict({column: [record.get(column) for record in batch] for column in columns})
+        if self._parquet_writer is not None and not table.schema.equals(self._parquet_writer.schema):
+            try:
+                table = table.cast(self._parquet_writer.schema)
+            except (pa.ArrowInvalid, ValueError):
+                # A new column set starts a new segment instead of failing the batch
+                self._close_segment()
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self._open_segment(), table.schema)
+        self._parquet_writer.write_table(table)
+
+    def _write_csv(self, batch: List[Dict[str, Any]]) -> None:
+        """Appends the batch to the CSV segment, starting a new one when the batch brings new columns."""
+        fieldnames = _union_keys(batch, self._csv_writer.fieldnames if self._csv_writer is not None else ())
+        if self._csv_writer is not None and fieldnames != self._csv_writer.fieldnames:
+            self._close_segment()
+        if self._csv_writer is None:
+            self._csv_file = open(self._open_segment(), "w", newline="")
+            self._csv_writer = csv.DictWriter(self._csv_file, fieldnames=fieldnames)
+            self._csv_writer.writeheader()
+        self._csv_writer.writerows(batch)
+        self._csv_file.flush()
+
+    def _close_segment(self) -> None:
+        """Closes the current segment and publishes it under its final name."""
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = None
+            self._csv_writer = None
+        if self._segment_path is not None:
+            os.replace(self._segment_path + IN_PROGRESS_SUFFIX, self._segment_path)
+            self._segment_path = None
+
+def _union_keys(batch: List[Dict[str, Any]], first: Iterable[str] = ()) -> List[str]:
+    """Returns `first` followed by every other key of the records, in first-seen order."""
+    return list(dict.fromkeys(chain(first, chain.from_iterable(batch))))
+
+def _writer_alive(segment_path: str) -> bool:
+    """Whether the process that named the segment (`inference-<time>-<pid>-<seq>`) is still running."""
+    try:
+        pid = int(os.path.basename(segment_path).split("-")[2])
+    except (IndexError, ValueError):
+        return False
+    if pid == os.getpid():
+        return False  # A previous process with our pid, e.g. in a restarted container
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _truncate_partial_line(path: str) -> None:
+    """Cuts a CSV file back to its last newline, dropping a row cut short by a crash."""
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+def list_segments(directory: str) -> List[str]:
+    """Lists completed inference log segments in write order."""
+    paths = glob.glob(os.path.join(directory, "inference-*.parquet")) + glob.glob(os.path.join(directory, "inference-*.csv"))
+    return sorted(paths, key=os.path.basename)
+
+def read_segment(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Reads one Parquet or CSV log segment."""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+def read_inference_logs(directory: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Reads every completed inference log segment into one dataframe.
+
+    Args:
+        directory (str): Directory written by InferenceLogWriter.
+        columns (Optional[List[str]]): Columns to load; defaults to all.
+
+    Returns:
+        pd.DataFrame: Concatenated logs, empty if no segment exists yet.
+    """
+    frames = [read_segment(path, columns) for path in list_segments(directory)]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,269 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Request and stage latencies in seconds, from 50us up to 10s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SCORE_BUCKETS = tuple(round(0.05 * i, 2) for i in range(1, 21))
+INF_LABEL = 'le="+Inf"'
+
+Labels = Tuple[str, ...]
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    """Renders a Prometheus label set, e.g. `{endpoint="/predict",le="0.1"}`."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    """Escapes a label value for the text exposition format."""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    """Formats a sample value, with integers kept free of a trailing `.0`."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Metric:
+    """Base class for a named metric with a fixed set of label names."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """
+        Initializes the metric.
+
+        Args:
+            name (str): Metric name, e.g. `fraud_api_requests_total`.
+            documentation (str): Help text shown on `/metrics`.
+            labelnames (Sequence[str]): Label names; values are passed positionally when recording.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterable[str]:
+        """Yields the metric's sample lines."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """Renders HELP, TYPE and sample lines."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(Metric):
+    """Monotonically increasing count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        """Adds `amount` to the series with the given label values."""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        """Returns the current count of a series."""
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+class Gauge(Metric):
+    """
+    Point-in-time value per label set.
+
+    Values are either set directly or read at scrape time from a callback
+    returning `{label values: value}`, which keeps bookkeeping off the hot path.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[Labels, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, *labels: str) -> None:
+        """Sets the series with the given label values."""
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = dict(self._values)
+        if self.callback is not None:
+            try:
+                values.update(self.callback())
+            except Exception as e:  # A failing source must not break the whole scrape
+                print(f"Warning: Could not collect {self.name}: {e}")
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+class Histogram(Metric):
+    """
+    Distribution of observations over fixed buckets, per label set.
+
+    Each observation increments one bucket found by binary search; cumulative
+    counts are only computed when rendering.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Records one observation in the series with the given label values."""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Bucket counts, then +Inf count, then sum
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def observe_many(self, values: np.ndarray, *labels: str) -> None:
+        """Records a batch of observations with one vectorized bucket search."""
+        counts = np.bincount(np.searchsorted(self.buckets, values, side='left'), minlength=len(self.buckets) + 1)
+        total = float(np.sum(values))
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            for index, count in enumerate(counts.tolist()):
+                series[index] += count
+            series[-1] += total
+
+    def count(self, *labels: str) -> int:
+        """Returns the number of observations in a series."""
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {_format_value(cumulative)}"
+            total = cumulative + series[-2]
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, INF_LABEL)} {_format_value(total)}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+
+class MetricsRegistry:
+    """Holds the process's metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        """Initializes an empty registry."""
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Any:
+        """Adds a metric, returning it; names must be unique."""
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Creates and registers a Counter."""
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              callback: Optional[Callable[[], Dict[Labels, float]]] = None) -> Gauge:
+        """Creates and registers a Gauge."""
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        """Creates and registers a Histogram."""
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Renders every metric, ending with a newline as the format requires."""
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+class StageTimer:
+    """
+    Records consecutive stage durations of one request into a histogram.
+
+    Usage: create it at the start of the handler, then call `mark(stage)` at
+    the end of each stage; each mark costs one clock read and one observation.
+    """
+
+    __slots__ = ("histogram", "endpoint", "last")
+
+    def __init__(self, histogram: Histogram, endpoint: str):
+        self.histogram = histogram
+        self.endpoint = endpoint
+        self.last = time.perf_counter()
+
+    def mark(self, stage: str) -> None:
+        """Records the time since the previous mark as `stage`."""
+        now = time.perf_counter()
+        self.histogram.observe(now - self.last, self.endpoint, stage)
+        self.last = now
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware counting requests and timing them per route.
+
+    Paths outside `paths` are reported as `other` so that scanners cannot
+    create unbounded label values.
+    """
+
+    def __init__(self, app: Any, requests: Counter, latency: Histogram, paths: Callable[[], Iterable[str]]):
+        """
+        Initializes the middleware.
+
+        Args:
+            app: Wrapped ASGI application.
+            requests (Counter): Labelled by endpoint and status code.
+            latency (Histogram): Labelled by endpoint.
+            paths (Callable): Returns the known route paths, read on first use.
+        """
+        self.app = app
+        self.requests = requests
+        self.latency = latency
+        self._paths_source = paths
+        self._paths: Optional[frozenset] = None
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self._paths is None:
+            self._paths = frozenset(self._paths_source())
+        endpoint = scope["path"] if scope["path"] in self._paths else "other"
+        status = ["500"]
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.latency.observe(time.perf_counter() - start, endpoint)
+            self.requests.inc(endpoint, status[0])
@@ -1,97 +1,355 @@
-import requests
+import argparse
+import asyncio
 import json
 import time
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional
+import httpx
+import numpy as np
 import pandas as pd
+import requests
 from datetime import datetime, timedelta
-import random
 from src.utils.config import Config
 from src.data.loader import DataLoader
 
+PAYLOAD_COLUMNS = ['user_id', 'signup_time', 'purchase_value', 'device_id', 'source', 'browser', 'sex', 'age',
+                   'ip_address']
+# Smallest gap between purchase times; keeps every payload distinct, so the API's
+# payload-keyed idempotency cache scores them instead of replaying repeats
+MIN_SPACING_S = 0.001
+# Upper bucket edges (ms) of the printed latency histogram
+HISTOGRAM_EDGES_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+def sample_payloads(df: pd.DataFrame, n: int, start: Optional[datetime] = None, spacing: float = MIN_SPACING_S,
+                    seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Samples `n` transactions from the dataset as API payloads, in one vectorized pass.
+
+    Purchase times are `start` plus `spacing` seconds per transaction, so they
+    follow the order in which the load generator sends them. Spacing is at
+    least `MIN_SPACING_S`: rows are sampled with replacement, and identical
+    purchase times would make repeated rows byte-identical requests.
+
+    Args:
+        df (pd.DataFrame): Raw fraud data.
+        n (int): Number of payloads.
+        start (Optional[datetime]): Purchase time of the first payload; defaults to now.
+        spacing (float): Seconds between consecutive purchase times, at least `MIN_SPACING_S`.
+        seed (Optional[int]): Sampling seed.
+
+    Returns:
+        List[Dict]: JSON-ready transaction payloads.
+    """
+    sample = df[PAYLOAD_COLUMNS].sample(n=n, replace=True, random_state=seed).reset_index(drop=True)
+    start = start or datetime.now()
+    spacing = max(spacing, MIN_SPACING_S)
+    purchase_times = pd.Timestamp(start) + pd.to_timedelta(np.arange(n) * spacing, unit='s')
+    columns = {
+        "user_id": sample['user_id'].astype(int).tolist(),
+        "signup_time": sample['signup_time'].astype(str).tolist(),
+        "purchase_time": purchase_times.astype(str).tolist(),
+        "purchase_value": sample['purchase_value'].astype(float).tolist(),
+        "device_id": sample['device_id'].astype(str).tolist(),
+        "source": sample['source'].astype(str).tolist(),
+        "browser": sample['browser'].astype(str).tolist(),
+        "sex": sample['sex'].astype(str).tolist(),
+        "age": sample['age'].astype(int).tolist(),
+        "ip_address": sample['ip_address'].astype(np.int64).tolist(),
+    }
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+class LatencyRecorder:
+    """
+    Collects request latencies and outcomes and summarizes them as percentiles and a histogram.
+
+    Responses replayed from the API's idempotency cache are counted separately
+    and left out of latencies and throughput, which should reflect real scoring.
+    """
+
+    def __init__(self):
+        """Initializes empty counters."""
+        self.latencies = array('d')
+        self.errors: Counter = Counter()
+        self.n_requests = 0
+        self.n_transactions = 0
+        self.n_replayed = 0
+
+    def record(self, latency: float, n_transactions: int, error: Optional[str] = None,
+               replayed: bool = False) -> None:
+        """Records one request's latency in seconds and its error, if it failed, or that it was replayed."""
+        self.n_requests += 1
+        if error is not None:
+            self.errors[error] += 1
+            return
+        if replayed:
+            self.n_replayed += 1
+            return
+        self.latencies.append(latency)
+        self.n_transactions += n_transactions
+
+    def report(self, duration: float) -> Dict[str, Any]:
+        """
+        Summarizes the run.
+
+        Args:
+            duration (float): Wall-clock seconds the run took.
+
+        Returns:
+            Dict: Request, transaction, replay and error counts, achieved rates and
+            latency percentiles (ms) of successfully scored requests.
+        """
+        latencies_ms = np.frombuffer(self.latencies, dtype=np.float64) * 1000
+        n_errors = sum(self.errors.values())
+        report: Dict[str, Any] = {
+            "requests": self.n_requests,
+            "transactions": self.n_transactions,
+            "errors": n_errors,
+            "error_rate": n_errors / self.n_requests if self.n_requests else 0.0,
+            "errors_by_type": dict(self.errors),
+            "replayed": self.n_replayed,
+            "duration_s": duration,
+            "rps": self.n_requests / duration if duration > 0 else 0.0,
+            "tps": self.n_transactions / duration if duration > 0 else 0.0,
+        }
+        if len(latencies_ms):
+            p50, p95, p99, p999 = np.percentile(latencies_ms, [50, 95, 99, 99.9])
+            report["latency_ms"] = {
+                "mean": float(latencies_ms.mean()), "p50": float(p50), "p95": float(p95),
+                "p99": float(p99), "p999": float(p999), "max": float(latencies_ms.max()),
+            }
+            counts = np.bincount(np.searchsorted(HISTOGRAM_EDGES_MS, latencies_ms),
+                                 minlength=len(HISTOGRAM_EDGES_MS) + 1)
+            labels = [f"<={edge}ms" for edge in HISTOGRAM_EDGES_MS] + [f">{HISTOGRAM_EDGES_MS[-1]}ms"]
+            report["histogram"] = dict(zip(labels, counts.tolist()))
+        return report
+
+def print_report(report: Dict[str, Any]) -> None:
+    """Prints a load test report as a short table."""
+    print(f"Requests: {report['requests']:,} ({report['transactions']:,} transactions) in {report['duration_s']:.1f}s")
+    print(f"Achieved: {report['rps']:,.1f} req/s, {report['tps']:,.1f} tx/s")
+    print(f"Errors:   {report['errors']:,} ({report['error_rate']:.2%}) {report['errors_by_type'] or ''}")
+    if report["replayed"]:
+        print(f"Replayed: {report['replayed']:,} idempotent replays, excluded from latency and throughput")
+    if "latency_ms" in report:
+        lat = report["latency_ms"]
+        print(f"Latency:  p50 {lat['p50']:.2f}ms | p95 {lat['p95']:.2f}ms | p99 {lat['p99']:.2f}ms | "
+              f"p99.9 {lat['p999']:.2f}ms | max {lat['max']:.2f}ms")
+        peak = max(report["histogram"].values())
+        for label, count in report["histogram"].items():
+            if count:
+                print(f"  {label:>9} {count:>9,} {'#' * max(1, round(40 * count / peak))}")
+
+class LoadGenerator:
+    """
+    Sends pre-built transaction payloads to the API concurrently over a pooled HTTP client.
+
+    Modes:
+        - `closed`: `concurrency` workers send back to back, measuring peak throughput.
+        - `constant`: open loop at `rate` requests per second.
+        - `burst`: open loop, `burst_size` requests at once every `burst_interval` seconds.
+
+    In the open-loop modes requests are scheduled independently of responses,
+    and latency is measured from the scheduled send time, so time spent
+    waiting for a free connection when the API falls behind counts against it
+    instead of silently lowering the offered load.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:8000", concurrency: int = 32, mode: str = "closed",
+                 rate: float = 100.0, burst_size: int = 100, burst_interval: float = 1.0, batch_size: int = 1,
+                 timeout: float = 10.0, transport: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        Initializes the generator.
+
+        Args:
+            base_url (str): API root URL.
+            concurrency (int): Maximum requests in flight (and pooled connections).
+            mode (str): 'closed', 'constant' or 'burst'.
+            rate (float): Requests per second in constant mode.
+            burst_size (int): Requests per burst in burst mode.
+            burst_interval (float): Seconds between bursts in burst mode.
+            batch_size (int): Transactions per request; above 1 uses `/predict/batch`.
+            timeout (float): Per-request timeout in seconds.
+            transport (Optional[httpx.AsyncBaseTransport]): Custom transport, e.g. to call an ASGI app in process.
+        """
+        if mode not in ("closed", "constant", "burst"):
+            raise ValueError(f"Unknown load mode: {mode}")
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.mode = mode
+        self.rate = rate
+        self.burst_size = burst_size
+        self.burst_interval = burst_interval
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.transport = transport
+
+    def encode(self, payloads: List[Dict[str, Any]]) -> List[bytes]:
+        """Serializes payloads into request bodies up front, grouping them into batches if configured."""
+        if self.batch_size <= 1:
+            return [json.dumps(payload).encode() for payload in payloads]
+        return [json.dumps(payloads[i:i + self.batch_size]).encode()
+                for i in range(0, len(payloads), self.batch_size)]
+
+    def schedule(self, n_requests: int) -> np.ndarray:
+        """Returns the send offset in seconds of each request (all zeros in closed mode)."""
+        if self.mode == "constant":
+            return np.arange(n_requests) / self.rate
+        if self.mode == "burst":
+            return (np.arange(n_requests) // self.burst_size) * self.burst_interval
+        return np.zeros(n_requests)
+
+    async def _send(self, client: httpx.AsyncClient, path: str, body: bytes, n_transactions: int,
+                    scheduled_at: float, recorder: LatencyRecorder) -> None:
+        """Sends one request and records its latency from `scheduled_at`."""
+        error, replayed = None, False
+        try:
+            response = await client.post(path, content=body, headers={"Content-Type": "application/json"})
+            if response.status_code >= 400:
+                error = f"HTTP {response.status_code}"
+            replayed = response.headers.get("Idempotent-Replayed") == "true"
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        recorder.record(time.perf_counter() - scheduled_at, n_transactions, error, replayed)
+
+    async def run(self, payloads: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Sends all payloads and returns the report from `LatencyRecorder.report`.
+
+        Args:
+            payloads (List[Dict]): Transactions to send, e.g. from `sample_payloads`.
+        """
+        bodies = self.encode(payloads)
+        sizes = [min(self.batch_size, len(payloads) - i) for i in range(0, len(payloads), max(self.batch_size, 1))]
+        path = "/predict/batch" if self.batch_size > 1 else "/predict"
+        offsets = self.schedule(len(bodies))
+        recorder = LatencyRecorder()
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=self.timeout,
+                                     transport=self.transport) as client:
+            start = time.perf_counter()
+            if self.mode == "closed":
+                queue = iter(zip(bodies, sizes))
+
+                async def worker() -> None:
+                    for body, size in queue:  # Shared iterator, so each body is sent once
+                        await self._send(client, path, body, size, time.perf_counter(), recorder)
+                await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+            else:
+                slots = asyncio.Semaphore(self.concurrency)
+
+                async def send_when_free(body: bytes, size: int, scheduled_at: float) -> None:
+                    async with slots:
+                        await self._send(client, path, body, size, scheduled_at, recorder)
+                tasks = []
+                for body, size, offset in zip(bodies, sizes, offsets):
+                    delay = start + offset - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    tasks.append(asyncio.create_task(send_when_free(body, size, start + offset)))
+                await asyncio.gather(*tasks)
+            duration = time.perf_counter() - start
+        return recorder.report(duration)
+
 class TransactionSimulator:
     """Simulates real-time transaction traffic by sampling from the historical dataset."""
-    
+
     def __init__(self, api_url: str = "http://localhost:8000/predict"):
         """Initializes the simulator with the target API URL and loads reference data."""
         self.api_url = api_url
         self.config = Config()
         self.loader = DataLoader(self.config)
         self.df_raw = self.loader.load_fraud_data()
-        
+
         # In-memory state for windowed features (transaction velocity)
         self.user_state = {}
 
     def get_velocity(self, user_id: int, window_minutes: int = 1440) -> int:
         """
         Calculates transaction velocity in the last X minutes.
-        
+
         Args:
             user_id (int): The ID of the user to check.
             window_minutes (int): The lookback window in minutes.
-            
+
         Returns:
             int: The count of transactions in the window.
         """
         now = datetime.now()
         if user_id not in self.user_state:
             return 0
-        
+
         # Filter timestamps within window
         cutoff = now - timedelta(minutes=window_minutes)
         self.user_state[user_id] = [ts for ts in self.user_state[user_id] if ts > cutoff]
-        
+
         return len(self.user_state[user_id])
 
     def send_transaction(self) -> Optional[Dict[str, Any]]:
         """
         Samples a random transaction from the dataset and sends it to the API.
-        
+
         Returns:
             Optional[Dict]: The API response if successful, else None.
         """
-        row = self.df_raw.sample(n=1).iloc[0]
-        
+        payload = sample_payloads(self.df_raw, 1)[0]
+
         # Update state (simulated 'now')
-        user_id = int(row['user_id'])
-        now = datetime.now()
-        if user_id not in self.user_state:
-            self.user_state[user_id] = []
-        self.user_state[user_id].append(now)
-        
-        # Prepare payload
-        payload = {
-            "user_id": int(row['user_id']),
-            "signup_time": str(row['signup_time']),
-            "purchase_time": str(now), # Use current time for simulation
-            "purchase_value": float(row['purchase_value']),
-            "device_id": str(row['device_id']),
-            "source": str(row['source']),
-            "browser": str(row['browser']),
-            "sex": str(row['sex']),
-            "age": int(row['age']),
-            "ip_address": int(row['ip_address'])
-        }
-        
+        user_id = payload['user_id']
+        self.user_state.setdefault(user_id, []).append(datetime.now())
+
         try:
-            response = requests.post(self.api_url, json=payload)
-            print(f"User {user_id} | Prob: {response.json().get('fraud_probability'):.3f} | Prediction: {response.json().get('prediction')}")
-            return response.json()
+            result = requests.post(self.api_url, json=payload).json()
+            print(f"User {user_id} | Prob: {result.get('fraud_probability'):.3f} | Prediction: {result.get('prediction')}")
+            return result
         except Exception as e:
             print(f"Failed to send transaction: {e}")
             return None
 
-    def run(self, num_tx: int = 10, delay: float = 1.0) -> None:
+    def run(self, num_tx: int = 10, delay: float = 1.0, concurrency: int = 1) -> Dict[str, Any]:
         """
-        Starts the simulation loop.
-        
+        Sends `num_tx` transactions, one every `delay` seconds, with the async load generator.
+
         Args:
             num_tx (int): Number of transactions to simulate.
-            delay (float): Delay in seconds between transactions.
+            delay (float): Delay in seconds between transactions; 0 sends as fast as possible.
+            concurrency (int): Maximum requests in flight.
+
+        Returns:
+            Dict: Load test report.
         """
         print(f"Starting simulation. Sending {num_tx} transactions to {self.api_url}...")
-        for i in range(num_tx):
-            self.send_transaction()
-            time.sleep(delay)
+        generator = LoadGenerator(
+            self.api_url.rsplit("/predict", 1)[0], concurrency=concurrency,
+            mode="constant" if delay > 0 else "closed", rate=1 / delay if delay > 0 else 0.0
+        )
+        report = asyncio.run(generator.run(sample_payloads(self.df_raw, num_tx, spacing=delay)))
+        print_report(report)
+        return report
 
 if __name__ == "__main__":
-    simulator = TransactionSimulator()
-    simulator.run(num_tx=20, delay=0.5)
+    parser = argparse.ArgumentParser(description="Load test the fraud detection API")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=10_000, help="Number of requests to send")
+    parser.add_argument("--mode", choices=["closed", "constant", "burst"], default="closed")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rate", type=float, default=100.0, help="Requests per second in constant mode")
+    parser.add_argument("--burst-size", type=int, default=100)
+    parser.add_argument("--burst-interval", type=float, default=1.0)
+    parser.add_argument("--batch-size", type=int, default=1, help="Transactions per request; >1 uses /predict/batch")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=None, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    df_raw = DataLoader(Config()).load_fraud_data()
+    spacing = 1 / args.rate / args.batch_size if args.mode == "constant" else MIN_SPACING_S
+    payloads = sample_payloads(df_raw, args.requests * args.batch_size, spacing=spacing, seed=args.seed)
+    generator = LoadGenerator(args.url, concurrency=args.concurrency, mode=args.mode, rate=args.rate,
+                              burst_size=args.burst_size, burst_interval=args.burst_interval,
+                              batch_size=args.batch_size)
+    report = asyncio.run(generator.run(payloads))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
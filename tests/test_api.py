@@ -0,0 +1,331 @@
+import json
+import pytest
+import joblib
+import numpy as np
+import xgboost as xgb
+from fastapi.testclient import TestClient
+import api.main as main
+from datetime import datetime
+from src.features.feature_store import FeatureStore, to_epoch_us
+from src.features.fast_path import FastFeaturePath
+from src.models.bundle import export_bundle
+from src.models.serving import ModelManager
+from src.features.snapshots import SnapshotScheduler
+from src.utils.inference_log import InferenceLogWriter, read_inference_logs
+from src.utils.idempotency import ResultCache
+from src.models.shadow import ShadowScorer
+
+MODEL_PATH = "mlruns/1/models/m-3566bd0f2e994ddaae9c1d9bf7f73c26/artifacts/model.ubj"
+FE_PATH = "models/feature_engineer.joblib"
+
+def make_tx(user_id: int, purchase_time: str, purchase_value: float = 40.0, ip_address: int = 732758368) -> dict:
+    return {
+        "user_id": user_id,
+        "signup_time": "2015-02-24 22:55:49",
+        "purchase_time": purchase_time,
+        "purchase_value": purchase_value,
+        "device_id": "QVPSPJUOCKZAR",
+        "source": "SEO",
+        "browser": "Chrome",
+        "sex": "M",
+        "age": 39,
+        "ip_address": ip_address
+    }
+
+@pytest.fixture(scope="module")
+def artifacts():
+    model = xgb.XGBClassifier()
+    model.load_model(MODEL_PATH)
+    return model, joblib.load(FE_PATH)
+
+@pytest.fixture
+def client(artifacts, monkeypatch, tmp_path):
+    model, fe = artifacts
+    export_bundle(model, FastFeaturePath(fe, model.get_booster().feature_names), str(tmp_path / "bundles"),
+                  version="v1", canary=[{**make_tx(1, "2015-04-18 02:47:11"), "velocity": 1}])
+    models = ModelManager(str(tmp_path / "bundles"), poll_interval=0)
+    models.activate("v1")
+    monkeypatch.setattr(main, "models", models)
+    monkeypatch.setattr(main, "fs", FeatureStore(window_hours=24))
+    monkeypatch.setattr(main, "results", ResultCache())
+    monkeypatch.setattr(main.config, "ADMIN_INSECURE", True)
+    writer = InferenceLogWriter(str(tmp_path / "logs"), flush_interval=0.05)
+    writer.start()
+    monkeypatch.setattr(main, "log_writer", writer)
+    yield TestClient(main.app)
+    writer.close()
+
+def test_predict_batch_matches_single(client):
+    txs = [
+        make_tx(1, "2015-04-18 02:47:11", 34.0),
+        make_tx(2, "2015-04-18 01:00:00", 120.0, ip_address=3503883392),
+        make_tx(1, "2015-04-18 01:30:00", 15.0),
+    ]
+    batch = client.post("/predict/batch", json=txs)
+    assert batch.status_code == 200
+    batch = batch.json()
+
+    main.fs.reset()
+    # Replay one by one in purchase-time order and compare per item
+    singles = {}
+    for i in [1, 2, 0]:
+        singles[i] = client.post("/predict", json=txs[i]).json()
+
+    assert len(batch) == len(txs)
+    for i, result in enumerate(batch):
+        assert result["prediction"] == singles[i]["prediction"]
+        assert result["risk_level"] == singles[i]["risk_level"]
+        assert np.isclose(result["fraud_probability"], singles[i]["fraud_probability"], atol=1e-6)
+
+def test_predict_batch_velocity_order(client):
+    txs = [make_tx(7, "2015-04-20 03:00:00"), make_tx(7, "2015-04-18 01:00:00")]
+    client.post("/predict/batch", json=txs)
+    # Replayed in time order, the older purchase has expired from the window
+    assert list(main.fs.user_tx_history[7]) == [to_epoch_us(datetime(2015, 4, 20, 3))]
+
+def test_predict_batch_limits(client, monkeypatch):
+    assert client.post("/predict/batch", json=[]).json() == []
+    monkeypatch.setattr(main.config, "MAX_BATCH_SIZE", 1)
+    response = client.post("/predict/batch", json=[make_tx(1, "2015-04-18 01:00:00")] * 2)
+    assert response.status_code == 413
+
+def test_predictions_are_logged(client):
+    client.post("/predict", json=make_tx(1, "2015-04-18 01:00:00"))
+    client.post("/predict/batch", json=[make_tx(2, "2015-04-18 02:00:00"), make_tx(3, "2015-04-18 03:00:00")])
+    main.log_writer.close()
+    logs = read_inference_logs(main.log_writer.directory)
+    assert list(logs['user_id']) == [1, 2, 3]
+    assert {'country', 'fraud_probability', 'prediction'} <= set(logs.columns)
+
+def test_explain_top_contributions(client):
+    tx = make_tx(5, "2015-04-18 02:47:11")
+    proba = client.post("/predict", json=tx).json()["fraud_probability"]
+    main.explain_row.cache_clear()
+
+    response = client.post("/explain", params={"top_k": 3}, json=tx).json()
+    assert response["tx_count_last_24h"] == 1
+    assert np.isclose(response["fraud_probability"], proba, atol=1e-5)
+    contributions = [c["contribution"] for c in response["contributions"]]
+    assert len(contributions) == 3
+    assert abs(contributions[0]) >= abs(contributions[1]) >= abs(contributions[2])
+
+    client.post("/explain", params={"top_k": 5}, json=tx)
+    assert main.explain_row.cache_info().hits == 1
+
+def test_startup_loads_local_bundle(artifacts, monkeypatch, tmp_path):
+    model, fe = artifacts
+    export_bundle(model, FastFeaturePath(fe, model.get_booster().feature_names), str(tmp_path / "bundles"), version="v1")
+    monkeypatch.setattr(main.config, "MODEL_BUNDLE_DIR", str(tmp_path / "bundles"))
+    monkeypatch.setattr(main.config, "MLFLOW_FALLBACK", False)
+    monkeypatch.setattr(main, "models", ModelManager(str(tmp_path / "bundles"), poll_interval=0))
+    writer = InferenceLogWriter(str(tmp_path / "logs"))
+    monkeypatch.setattr(main, "log_writer", writer)
+    monkeypatch.setattr(main, "snapshots", SnapshotScheduler(FeatureStore(), str(tmp_path / "fs.npz"), interval=0))
+
+    main.load_artifacts()
+    writer.close()
+    health = TestClient(main.app).get("/health").json()
+    assert health["model_loaded"] and health["preprocessor_loaded"]
+    assert health["model_version"] == "v1"
+    assert {"model", "preprocessor", "warmup", "total"} <= set(health["startup_ms"])
+    assert health["startup_ms"]["total"] < 1000
+
+def test_admin_pin_and_rollback(client, artifacts, monkeypatch):
+    model, fe = artifacts
+    fast_path = main.models.current.fast_path
+    export_bundle(model, fast_path, main.models.root, version="v2")
+    tx = make_tx(1, "2015-04-18 02:47:11")
+    client.post("/predict", json=tx)
+
+    status = client.post("/admin/models/reload").json()
+    assert status["active"] == "v2" and status["history"] == ["v1", "v2"]
+    # Velocities survive the swap
+    client.post("/predict", json=make_tx(1, "2015-04-18 02:48:11"))
+    assert len(main.fs.user_tx_history[1]) == 2
+
+    status = client.post("/admin/models/rollback").json()
+    assert status["active"] == "v1" and status["pinned"] == "v1"
+    export_bundle(model, fast_path, main.models.root, version="v3")
+    assert client.post("/admin/models/reload").json()["active"] == "v1"  # Pinned
+    assert client.post("/admin/models/pin", json={"version": "v9"}).status_code == 404
+
+    monkeypatch.setattr(main.config, "ADMIN_INSECURE", False)
+    assert client.get("/admin/models").status_code == 403  # No token configured: closed by default
+    assert client.post("/admin/profiler/start").status_code == 403
+    monkeypatch.setattr(main.config, "ADMIN_TOKEN", "secret")
+    assert client.get("/admin/models").status_code == 401
+    assert client.get("/admin/models", headers={"X-Admin-Token": "wrong"}).status_code == 401
+    assert client.get("/admin/models", headers={"X-Admin-Token": "secret"}).json()["available"] == ["v1", "v2", "v3"]
+
+@pytest.mark.parametrize("mode, batch_size", [("closed", 1), ("constant", 1), ("burst", 4)])
+def test_load_generator_against_app(client, mode, batch_size):
+    import asyncio
+    import httpx
+    import pandas as pd
+    from src.utils.simulator import LoadGenerator, sample_payloads
+
+    raw = pd.DataFrame([make_tx(i, "2015-04-18 02:47:11") for i in range(5)]).drop(columns='purchase_time')
+    payloads = sample_payloads(raw, 24, start=datetime(2015, 4, 18), spacing=1.0, seed=0)
+    assert [p['purchase_time'] for p in payloads[:2]] == ["2015-04-18 00:00:00", "2015-04-18 00:00:01"]
+
+    generator = LoadGenerator("http://test", concurrency=4, mode=mode, rate=500.0, burst_size=2,
+                              burst_interval=0.01, batch_size=batch_size,
+                              transport=httpx.ASGITransport(app=main.app))
+    report = asyncio.run(generator.run(payloads))
+    assert report["errors"] == 0
+    assert report["requests"] == 24 // batch_size
+    assert report["transactions"] == 24
+    assert sum(report["histogram"].values()) == report["requests"]
+    assert report["latency_ms"]["p50"] <= report["latency_ms"]["p999"] <= report["latency_ms"]["max"]
+    assert report["replayed"] == 0
+
+    # Resending the same payloads hits the idempotency cache, reported apart from scored requests
+    replay = asyncio.run(generator.run(payloads))
+    assert replay["replayed"] == replay["requests"] and replay["transactions"] == 0
+    # Without explicit spacing, sampled rows still become distinct payloads
+    defaults = sample_payloads(raw, 24, start=datetime(2015, 4, 18), seed=0)
+    assert len({json.dumps(p, sort_keys=True) for p in defaults}) == 24
+
+def scrape(client) -> dict:
+    lines = client.get("/metrics").text.splitlines()
+    return dict(line.rsplit(" ", 1) for line in lines if not line.startswith("#"))
+
+def test_metrics_and_profiler(client):
+    before = scrape(client)  # Metrics are process-wide, so compare against a first scrape
+    assert client.post("/predict", json=make_tx(1, "2015-04-18 02:47:11")).status_code == 200
+    assert client.post("/predict/batch", json=[make_tx(2, "2015-04-18 03:00:00")] * 3).status_code == 200
+    client.get("/does-not-exist")
+    after = scrape(client)
+
+    def delta(sample: str) -> float:
+        return float(after[sample]) - float(before.get(sample, 0))
+
+    assert delta('fraud_api_requests_total{endpoint="/predict",status="200"}') == 1
+    assert delta('fraud_api_requests_total{endpoint="other",status="404"}') == 1
+    for stage in ("parse", "feature_store", "transform", "predict", "log"):
+        assert delta(f'fraud_api_stage_duration_seconds_count{{endpoint="/predict",stage="{stage}"}}') == 1
+    assert delta('fraud_api_fraud_probability_count{model_version="v1"}') == 4
+    assert after['fraud_model_info{version="v1"}'] == "1"
+    assert after['fraud_feature_store_size{kind="users"}'] == "2"
+
+    assert client.post("/admin/profiler/start", params={"interval_ms": 1}).json()["running"]
+    client.post("/predict", json=make_tx(3, "2015-04-18 04:00:00"))
+    report = client.post("/admin/profiler/stop").json()
+    assert not report["running"] and report["samples"] > 0
+
+def test_micro_batched_predict_matches_unbatched(client, monkeypatch):
+    import asyncio
+    import httpx
+    from src.models.batching import MicroBatcher
+
+    txs = [make_tx(i % 4, f"2015-04-18 0{i % 10}:00:00", 10.0 + i) for i in range(24)]
+    expected = [client.post("/predict", json=tx).json() for tx in txs]
+
+    monkeypatch.setattr(main, "fs", FeatureStore(window_hours=24))
+    monkeypatch.setattr(main, "results", ResultCache())  # Score the same payloads again
+    batcher = MicroBatcher(main.score_coalesced, max_batch_size=16, max_wait=0.05)
+    batcher.start()
+    monkeypatch.setattr(main, "batcher", batcher)
+
+    async def send_all():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            results = []
+            for tx in txs:  # Sequential arrival keeps velocities comparable, but requests overlap
+                results.append(asyncio.create_task(http.post("/predict", json=tx)))
+                await asyncio.sleep(0)
+            return [(await result).json() for result in results]
+
+    batched = asyncio.run(send_all())
+    batcher.stop()
+    assert batcher.stats()["max_batch_size"] > 1
+    for got, want in zip(batched, expected):
+        assert got["prediction"] == want["prediction"]
+        assert got["fraud_probability"] == pytest.approx(want["fraud_probability"], abs=1e-6)
+
+def test_micro_batch_failure_only_fails_its_own_request(client, monkeypatch):
+    import asyncio
+    import httpx
+    from src.models.batching import MicroBatcher
+
+    batcher = MicroBatcher(main.score_coalesced, max_batch_size=16, max_wait=0.05)
+    batcher.start()
+    monkeypatch.setattr(main, "batcher", batcher)
+    txs = [make_tx(i, "2015-04-18 02:00:00") for i in range(6)]
+    txs[2]["signup_time"] = "2015-02-24T22:55:49+00:00"  # Cannot be subtracted from a naive purchase time
+
+    async def send_all():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await asyncio.gather(*(http.post("/predict", json=tx) for tx in txs))
+
+    responses = asyncio.run(send_all())
+    batcher.stop()
+    assert [response.status_code for response in responses] == [200, 200, 500, 200, 200, 200]
+    assert batcher.stats()["failed_batches"] == 0 and batcher.stats()["max_batch_size"] > 1
+    main.log_writer.close()
+    assert sorted(read_inference_logs(main.log_writer.directory)['user_id']) == [0, 1, 3, 4, 5]
+
+def test_retries_are_replayed_without_counting_velocity_again(client):
+    tx = make_tx(7, "2015-04-18 02:47:11")
+    first = client.post("/predict", json=tx)
+    retry = client.post("/predict", json=tx)
+    assert retry.json() == first.json() and retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert len(main.fs.user_tx_history[7]) == 1
+
+    # An explicit key replays even if the client re-serialized the payload, and must not be reused
+    later = make_tx(7, "2015-04-18 03:47:11")
+    keyed = client.post("/predict", json=later, headers={"Idempotency-Key": "gw-123"})
+    assert client.post("/predict", json=dict(reversed(list(later.items()))),
+                       headers={"Idempotency-Key": "gw-123"}).json() == keyed.json()
+    conflict = client.post("/predict", json={**later, "purchase_value": 99.0}, headers={"Idempotency-Key": "gw-123"})
+    assert conflict.status_code == 409
+    assert len(main.fs.user_tx_history[7]) == 2
+
+    batch = [make_tx(8, "2015-04-18 02:00:00"), make_tx(8, "2015-04-18 02:30:00")]
+    assert client.post("/predict/batch", json=batch).json() == client.post("/predict/batch", json=batch).json()
+    assert len(main.fs.user_tx_history[8]) == 2
+    assert main.results.stats() == {"size": 3, "hits": 3, "misses": 3, "waits": 0, "expired": 0, "evicted": 0}
+
+def test_retries_reaching_another_worker_are_replayed(client, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    from src.utils.idempotency import RedisResultCache
+
+    server = fakeredis.FakeServer()
+    tx = make_tx(9, "2015-04-18 02:47:11")
+    monkeypatch.setattr(main, "results", RedisResultCache(fakeredis.FakeRedis(server=server)))
+    first = client.post("/predict", json=tx)
+    monkeypatch.setattr(main, "results", RedisResultCache(fakeredis.FakeRedis(server=server)))  # Another worker
+    retry = client.post("/predict", json=tx)
+    assert retry.json() == first.json() and retry.headers["Idempotent-Replayed"] == "true"
+    assert len(main.fs.user_tx_history[9]) == 1
+
+def test_far_future_purchase_times_are_rejected(client):
+    assert client.post("/predict", json=make_tx(1, "2015-04-18 02:47:11")).status_code == 200
+    assert client.post("/predict", json=make_tx(2, "2099-01-01 00:00:00")).status_code == 422
+    batch = [make_tx(3, "2015-04-18 02:00:00"), make_tx(4, "2099-01-01 00:00:00")]
+    assert client.post("/predict/batch", json=batch).status_code == 422
+    assert list(main.fs.user_tx_history) == [1]
+
+def test_shadow_challenger_scores_are_logged_next_to_champion(client, artifacts, monkeypatch):
+    model, fe = artifacts
+    export_bundle(model, main.models.current.fast_path, main.models.root, version="v2")
+    shadow = ShadowScorer(lambda records: main.log_writer.log_many(records))
+    shadow.start()
+    monkeypatch.setattr(main, "shadow", shadow)
+    assert client.put("/admin/shadow", json={"versions": ["missing"]}).status_code == 404
+    assert client.put("/admin/shadow", json={"versions": ["v2"]}).json()["challengers"] == ["v2"]
+
+    client.post("/predict", json=make_tx(1, "2015-04-18 02:47:11"))
+    client.post("/predict/batch", json=[make_tx(1, "2015-04-18 03:00:00"), make_tx(2, "2015-04-18 03:00:00")])
+    shadow.stop()
+    main.log_writer.close()
+    logs = read_inference_logs(main.log_writer.directory)
+    assert len(logs) == 3  # One row per transaction, champion and challenger together
+    assert (logs["challenger_0_version"] == "v2").all()
+    # Same model and the velocity the champion was served with: identical scores
+    np.testing.assert_allclose(logs["challenger_0_probability"], logs["fraud_probability"], atol=1e-6)
+    assert len(main.fs.user_tx_history[1]) == 2  # The shadow path never touches the feature store
+    assert client.get("/admin/shadow").json()["agreement"] == {"v2": {"scored": 3, "disagreements": 0}}
+
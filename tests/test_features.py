@@ -1,11 +1,14 @@
+import os
 import pytest
 import pandas as pd
 import numpy as np
 from src.features.engineering import FeatureEngineer
-from src.features.feature_store import FeatureStore
+from src.features.feature_store import FeatureStore, MultiWindowFeatureStore
+from src.features.fast_path import FastFeaturePath
 from src.data.loader import DataLoader
 from src.utils.config import Config
-from datetime import datetime
+from datetime import datetime, timedelta
+import joblib
 
 @pytest.fixture
 def config():
@@ -59,3 +62,323 @@ def test_feature_store_reset(fs):
 def test_data_loader_init(config):
     loader = DataLoader(config)
     assert loader.config == config
+
+@pytest.fixture
+def ip_map():
+    return pd.DataFrame({
+        'lower_bound_ip_address': [300, 100, 200],
+        'upper_bound_ip_address': [399, 149, 249],
+        'country': ['Chile', 'Japan', 'Kenya']
+    })
+
+def test_get_country_interval_index(fe, ip_map):
+    fe.fit_ip_map(ip_map)
+    assert fe.get_country(100) == "Japan"
+    assert fe.get_country(149) == "Japan"
+    assert fe.get_country(150) == "Unknown"  # Gap between ranges
+    assert fe.get_country(250.5) == "Unknown"
+    assert fe.get_country(399) == "Chile"
+    assert fe.get_country(50) == "Unknown"
+
+def test_ip_index_batch_matches_scalar(fe, ip_map):
+    fe.fit_ip_map(ip_map)
+    ips = np.array([0, 100, 120.7, 149, 150, 220, 300, 399, 400, np.nan])
+    batch = fe.ip_index.lookup_many(ips)
+    assert list(batch) == [fe.get_country(ip) for ip in ips]
+
+def test_fast_path_matches_transform():
+    fe = joblib.load("models/feature_engineer.joblib")
+    rng = np.random.default_rng(0)
+    n = 200
+    signup = pd.Timestamp("2015-01-01") + pd.to_timedelta(rng.integers(0, 200 * 86400, n), unit="s")
+    purchase = signup + pd.to_timedelta(rng.integers(1, 120 * 86400, n), unit="s")
+    df = pd.DataFrame({
+        'user_id': rng.integers(0, 50, n),
+        'signup_time': signup.astype(str),
+        'purchase_time': purchase.astype(str),
+        'purchase_value': rng.integers(9, 150, n).astype(float),
+        'device_id': 'QVPSPJUOCKZAR',
+        'source': rng.choice(['SEO', 'Ads', 'Direct', 'Unseen'], n),
+        'browser': rng.choice(['Chrome', 'IE', 'Safari', 'Opera', 'FireFox', 'Edge'], n),
+        'sex': rng.choice(['M', 'F'], n),
+        'age': rng.integers(18, 76, n),
+        'ip_address': rng.uniform(0, 4.3e9, n)
+    })
+    velocity = rng.integers(1, 6, n)
+
+    fast_path = FastFeaturePath(fe)
+    rows = np.vstack([
+        fast_path.transform_one(tx, v) for tx, v in zip(df.to_dict('records'), velocity)
+    ])
+
+    df['signup_time'] = pd.to_datetime(df['signup_time'])
+    df['purchase_time'] = pd.to_datetime(df['purchase_time'])
+    batch = fast_path.transform_batch(df.copy(), velocity)
+    expected = fe.transform(df, velocity_override=velocity)
+    assert list(expected.columns) == fast_path.feature_names
+    assert np.array_equal(expected.to_numpy(), rows)
+    assert np.array_equal(expected.to_numpy(), batch)
+
+def test_feature_store_out_of_order_events(fs):
+    t = datetime(2023, 1, 2, 12, 0)
+    assert fs.update_and_get_velocity(1, t) == 1
+    assert fs.update_and_get_velocity(1, t - timedelta(hours=30)) == 2  # Late arrival, counted from its own time
+    assert fs.update_and_get_velocity(1, t - timedelta(hours=2)) == 2
+    assert fs.update_and_get_velocity(1, t + timedelta(hours=1)) == 3
+
+def test_feature_store_evicts_idle_and_capped_users():
+    store = FeatureStore(window_hours=24, max_users=2, max_events_per_user=3)
+    t = datetime(2023, 1, 1, 0, 0)
+    for i in range(5):
+        store.update_and_get_velocity(1, t + timedelta(minutes=i))
+    assert store.update_and_get_velocity(1, t + timedelta(minutes=5)) == 3
+    store.update_and_get_velocity(2, t)
+    store.update_and_get_velocity(3, t)
+    assert list(store.user_tx_history) == [2, 3]  # User 1 was least recently active
+
+    store.update_and_get_velocity(4, t + timedelta(days=2))
+    assert list(store.user_tx_history) == [4]  # Idle users expired entirely
+    stats = store.stats()
+    assert stats["users"] == 1 and stats["events"] == 1
+    assert stats["capacity_evictions"] == 1 and stats["idle_evictions"] == 2
+    assert stats["dropped_events"] == 3
+
+def test_future_dated_event_does_not_evict_other_users():
+    t = datetime(2015, 4, 18)
+    store = FeatureStore(window_hours=24, max_future_skew=300, clock=lambda: (t - datetime(1970, 1, 1)).total_seconds())
+    for user_id in range(100):
+        for i in range(5):
+            store.update_and_get_velocity(user_id, t - timedelta(minutes=i))
+    store.update_and_get_velocity(1000, datetime(2099, 1, 1))
+    assert len(store.user_tx_history) == 101
+    assert store.update_and_get_velocity(1, t + timedelta(minutes=1)) == 6
+
+def _shared_store_worker(path, user_ids, times):
+    from src.features.store_backends import SharedMemoryFeatureStore
+    store = SharedMemoryFeatureStore(path, max_users=64, max_events_per_user=32)
+    store.update_many(user_ids, times)
+    store.close()
+
+@pytest.mark.parametrize("backend", ["shm", "redis"])
+def test_feature_store_backends_match_in_process(backend, tmp_path):
+    from src.features import store_backends
+    if backend == "shm":
+        if not store_backends.HAS_FCNTL:
+            pytest.skip("fcntl not available")
+        store = store_backends.SharedMemoryFeatureStore(str(tmp_path / "fs.bin"), max_users=64, max_events_per_user=32)
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        store = store_backends.RedisFeatureStore(fakeredis.FakeRedis(), max_events_per_user=32)
+
+    rng = np.random.default_rng(0)
+    start = datetime(2015, 4, 1)
+    # Mostly increasing times with some late arrivals
+    times = [start + timedelta(minutes=int(m)) for m in np.cumsum(rng.integers(-30, 120, 400))]
+    user_ids = [int(u) for u in rng.integers(0, 10, 400)]
+    reference = FeatureStore(window_hours=24, max_events_per_user=32)
+
+    expected = [reference.update_and_get_velocity(u, t) for u, t in zip(user_ids[:300], times[:300])]
+    assert [store.update_and_get_velocity(u, t) for u, t in zip(user_ids[:300], times[:300])] == expected
+    assert store.update_many(user_ids[300:], times[300:]) == reference.update_many(user_ids[300:], times[300:])
+    assert store.get_velocity(user_ids[-1], times[-1]) == reference.get_velocity(user_ids[-1], times[-1])
+    store.reset()
+    assert store.get_velocity(user_ids[-1], times[-1]) == 0
+
+def test_shared_memory_store_across_processes(tmp_path):
+    import multiprocessing
+    from src.features import store_backends
+    if not store_backends.HAS_FCNTL:
+        pytest.skip("fcntl not available")
+    path = str(tmp_path / "fs.bin")
+    store = store_backends.SharedMemoryFeatureStore(path, max_users=64, max_events_per_user=32)
+    t = datetime(2015, 4, 1)
+    ctx = multiprocessing.get_context("fork")
+    workers = [
+        ctx.Process(target=_shared_store_worker, args=(path, [7] * 10, [t + timedelta(minutes=i) for i in range(w, 20, 2)]))
+        for w in range(2)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    # Both workers' events are visible, in order, to a third process
+    assert store.get_velocity(7, t + timedelta(minutes=19)) == 20
+    assert store.update_and_get_velocity(7, t + timedelta(hours=24, minutes=10)) == 10
+    with pytest.raises(ValueError, match="layout"):
+        store_backends.SharedMemoryFeatureStore(path, max_users=64, max_events_per_user=16)
+    store.close()
+
+def test_multi_window_online_matches_offline(fe):
+    rng = np.random.default_rng(7)
+    n = 400
+    df = pd.DataFrame({
+        'user_id': rng.integers(0, 20, n),
+        'device_id': rng.choice(['A', 'B', 'C'], n),
+        'ip_address': rng.integers(0, 5, n).astype(float),
+        'purchase_value': rng.integers(9, 150, n).astype(float),
+        # Many exact ties and gaps spanning every window
+        'purchase_time': pd.Timestamp('2015-01-01') + pd.to_timedelta(
+            np.sort(rng.integers(0, 14 * 86400, n)) // 30 * 30, unit='s'
+        )
+    }).sample(frac=1, random_state=0)  # Offline input order must not matter
+
+    offline = fe.calculate_window_features(df)
+    assert offline.index.equals(df.index)
+
+    store = MultiWindowFeatureStore()
+    replay = df.sort_values('purchase_time', kind='stable')
+    for idx, row in replay.iterrows():
+        online = store.update_and_get_features(row, row['purchase_time'])
+        for name in store.feature_names:
+            assert np.isclose(online[name], offline.at[idx, name]), name
+
+def test_multi_window_late_event():
+    store = MultiWindowFeatureStore(entities=('user_id',), windows={'1h': timedelta(hours=1)})
+    t = datetime(2023, 1, 1, 12, 0)
+    store.update_and_get_features({'user_id': 1, 'purchase_value': 10.0}, t)
+    store.update_and_get_features({'user_id': 1, 'purchase_value': 20.0}, t + timedelta(minutes=50))
+    late = store.update_and_get_features({'user_id': 1, 'purchase_value': 5.0}, t - timedelta(minutes=30))
+    assert late == {'user_id_count_1h': 1, 'user_id_sum_1h': 5.0}
+    nxt = store.update_and_get_features({'user_id': 1, 'purchase_value': 1.0}, t + timedelta(minutes=55))
+    assert nxt == {'user_id_count_1h': 3, 'user_id_sum_1h': 31.0}
+
+def test_calculate_velocity_matches_rolling(fe):
+    rng = np.random.default_rng(3)
+    n = 300
+    df = pd.DataFrame({
+        'user_id': rng.integers(0, 15, n),
+        'purchase_time': pd.Timestamp('2015-01-01') + pd.to_timedelta(
+            rng.integers(0, 5 * 24, n) * 3600, unit='s'  # Hourly grid hits the 24h boundary exactly
+        )
+    }, index=rng.permutation(np.arange(1000, 1000 + n)))
+
+    result = fe.calculate_velocity(df)
+    assert result.index.equals(df.index)
+
+    # Reference: the per-user rolling count this replaced
+    expected = pd.Series(0.0, index=df.index)
+    for _, group in df.sort_values('purchase_time', kind='stable').groupby('user_id'):
+        rolled = group.set_index('purchase_time')['user_id'].rolling('24h', min_periods=1, closed='both').count()
+        expected[group.index] = rolled.to_numpy()
+    assert np.array_equal(result['tx_count_last_24h'].to_numpy(), expected.to_numpy())
+
+def test_data_loader_parquet_cache(tmp_path):
+    csv_path = tmp_path / "Fraud_Data.csv"
+    pd.DataFrame({
+        'user_id': [1, 2],
+        'signup_time': ['2015-02-24 22:55:49', '2015-06-07 20:39:50'],
+        'purchase_time': ['2015-04-18 02:47:11', '2015-06-08 01:38:54'],
+        'purchase_value': [34, 16],
+        'device_id': ['QVPSPJUOCKZAR', 'EOGFQPIZPYXFZ'],
+        'source': ['SEO', 'Ads'],
+        'browser': ['Chrome', 'Chrome'],
+        'sex': ['M', 'F'],
+        'age': [39, 53],
+        'ip_address': [732758368.8, 350311387.9],
+        'class': [0, 0]
+    }).to_csv(csv_path, index=False)
+    config = Config(FRAUD_DATA_PATH=str(csv_path), PROCESSED_DATA_PATH=str(tmp_path / "processed"))
+    loader = DataLoader(config)
+
+    first = loader.load_fraud_data()
+    cache_path, _ = loader.cache_paths(config.FRAUD_DATA_PATH)
+    assert os.path.exists(cache_path)
+    cached = loader.load_fraud_data(columns=['source', 'age', 'purchase_time'])
+    assert list(cached.columns) == ['source', 'age', 'purchase_time']
+    assert isinstance(cached['source'].dtype, pd.CategoricalDtype)
+    assert cached['age'].dtype == 'int32'
+    assert pd.api.types.is_datetime64_any_dtype(cached['purchase_time'])
+    pd.testing.assert_frame_equal(first[cached.columns], cached)
+
+    # Changing the source invalidates the cache
+    edited = pd.read_csv(csv_path)
+    edited.loc[0, 'age'] = 40
+    edited.to_csv(csv_path, index=False)
+    assert loader.load_fraud_data(columns=['age'])['age'].tolist() == [40, 53]
+
+def test_snapshot_trim_ignores_future_dated_events(tmp_path):
+    from src.features.snapshots import read_snapshot, write_snapshot
+
+    t = datetime(2015, 4, 18)
+    store = FeatureStore(window_hours=24, max_future_skew=300, clock=lambda: (t - datetime(1970, 1, 1)).total_seconds())
+    for user_id in range(10):
+        store.update_and_get_velocity(user_id, t - timedelta(minutes=user_id))
+    store.update_and_get_velocity(1000, datetime(2099, 1, 1))
+
+    assert write_snapshot(store, str(tmp_path / "snapshot.npz"))["events"] == 11
+    user_ids, _, _, _ = read_snapshot(str(tmp_path / "snapshot.npz"))
+    assert sorted(user_ids.tolist()) == list(range(10)) + [1000]
+
+def test_feature_store_snapshot_roundtrip_and_replay(tmp_path):
+    import time
+    from src.features.snapshots import restore_store, write_snapshot
+    from src.utils.inference_log import InferenceLogWriter
+
+    store = FeatureStore(window_hours=24, max_events_per_user=50)
+    t = datetime(2015, 4, 1)
+    rng = np.random.default_rng(1)
+    for minutes, user_id in zip(np.sort(rng.integers(0, 600, 300)), rng.integers(0, 40, 300)):
+        store.update_and_get_velocity(int(user_id), t + timedelta(minutes=int(minutes)))
+    store.update_and_get_velocity(99, t - timedelta(days=3))  # Late arrival outside the newest event's window
+
+    meta = write_snapshot(store, str(tmp_path / "snapshot.npz"))
+    assert meta["events"] == store.n_events - 1 and meta["bytes"] < 300 * 8 + 2048
+
+    # Transactions scored after the snapshot, one of them already captured by it
+    tail = [(5, t + timedelta(hours=11)), (6, t + timedelta(hours=12)), (5, t + timedelta(hours=12, minutes=30))]
+    writer = InferenceLogWriter(str(tmp_path / "logs"), fmt="csv", flush_interval=0.01)
+    writer.start()
+    last_user = list(store.user_tx_history)[-2]
+    last_time = datetime(1970, 1, 1) + timedelta(microseconds=store.user_tx_history[last_user][-1])
+    writer.log({"user_id": last_user, "purchase_time": last_time, "logged_at": time.time()})
+    for user_id, ts in tail:
+        store.update_and_get_velocity(user_id, ts)
+        writer.log({"user_id": user_id, "purchase_time": ts, "logged_at": time.time()})
+    writer.close()
+
+    restored = FeatureStore(window_hours=24, max_events_per_user=50)
+    result = restore_store(restored, str(tmp_path / "snapshot.npz"), str(tmp_path / "logs"))
+    assert result["snapshot_loaded"] and result["replayed"] == len(tail)
+    assert 99 not in restored.user_tx_history
+    del store.user_tx_history[99]
+    assert {u: list(h) for u, h in restored.user_tx_history.items()} == {u: list(h) for u, h in store.user_tx_history.items()}
+
+def test_consistency_replay_matches_offline_and_builds_training_set():
+    from src.features.consistency import check_consistency, replay_online_velocity, training_set_from_logs
+    fe = joblib.load("models/feature_engineer.joblib")
+    rng = np.random.default_rng(7)
+    n = 400
+    purchase = pd.Timestamp("2015-03-01") + pd.to_timedelta(rng.integers(0, 6 * 86400, n), unit="s")
+    df = pd.DataFrame({
+        'user_id': rng.integers(0, 40, n),
+        'signup_time': purchase - pd.to_timedelta(rng.integers(1, 30 * 86400, n), unit="s"),
+        'purchase_time': purchase,
+        'purchase_value': rng.integers(9, 150, n).astype(float),
+        'device_id': 'QVPSPJUOCKZAR',
+        'source': rng.choice(['SEO', 'Ads', 'Direct'], n),
+        'browser': rng.choice(['Chrome', 'IE', 'Safari'], n),
+        'sex': rng.choice(['M', 'F'], n),
+        'age': rng.integers(18, 76, n),
+        'ip_address': rng.uniform(0, 4.3e9, n)
+    })
+    fast_path = FastFeaturePath(fe)
+
+    # Sharded replay is independent of the number of workers
+    single = replay_online_velocity(df, n_workers=1)
+    assert np.array_equal(single, replay_online_velocity(df, n_workers=3))
+
+    report = check_consistency(df, fe, fast_path, chunk_size=150, n_workers=2)
+    assert len(report) == fast_path.n_features + 1
+    assert report['mismatches'].sum() == 0
+
+    # Logs record what was served; a stale velocity shows up in the report
+    arrival = np.argsort(np.argsort(df['purchase_time'].to_numpy(), kind='stable'))
+    logs = df.assign(tx_count_last_24h=single, logged_at=arrival.astype(float))
+    logs.loc[0, 'tx_count_last_24h'] += 1
+    report = check_consistency(logs, fe, fast_path, order_by='logged_at', n_workers=1).set_index('feature')
+    assert report.loc['served_velocity', 'mismatches'] == 1
+
+    labels = df[['user_id', 'purchase_time']].assign(**{'class': rng.integers(0, 2, n)})
+    training = training_set_from_logs(logs, labels.iloc[:100], fast_path)
+    assert list(training.columns) == fast_path.feature_names + ['class']
+    assert len(training) == len(logs.iloc[:100].drop_duplicates(['user_id', 'purchase_time']))
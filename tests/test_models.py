@@ -0,0 +1,317 @@
+import pytest
+import numpy as np
+from src.utils.config import Config
+from src.models.stages import StageCache, fingerprint, track_stage
+from src.models.explain import stratified_sample
+
+def test_stage_cache_roundtrip(tmp_path):
+    cache = StageCache(str(tmp_path))
+    key = fingerprint("features", "abc", 0.2)
+    assert key == fingerprint("features", "abc", 0.2) != fingerprint("features", "abc", 0.3)
+    assert cache.load("features", key) is None
+
+    X = np.arange(12, dtype=np.float64).reshape(4, 3)
+    cache.save("features", key, {"X": X}, {"feature_names": ["a", "b", "c"]})
+    loaded = cache.load("features", key, mmap_mode="r")
+    assert isinstance(loaded["X"], np.memmap)
+    assert np.array_equal(loaded["X"], X)
+    assert loaded["feature_names"] == ["a", "b", "c"]
+
+    assert StageCache(str(tmp_path), enabled=False).load("features", key) is None
+
+def test_smote_stage_is_reused(tmp_path, monkeypatch):
+    train = pytest.importorskip("src.models.train")
+    config = Config(SMOTE_K_NEIGHBORS=3, N_JOBS=1)
+    cache = StageCache(str(tmp_path))
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 4))
+    y = (np.arange(200) < 20).astype(int)
+
+    split, split_key = train.split_data(config, cache, y, "features-key")
+    X_train, y_train = X[split["train_idx"]], y[split["train_idx"]]
+    first, smote_key = train.resample_training_set(config, cache, X_train, y_train, split_key)
+    assert (first["y"] == 1).sum() == (first["y"] == 0).sum() // 2
+
+    # A second run must not call SMOTE again
+    monkeypatch.setattr(train, "SMOTE", None)
+    again, again_key = train.resample_training_set(config, cache, X_train, y_train, split_key)
+    assert again_key == smote_key
+    assert np.array_equal(again["X"], first["X"])
+
+def test_track_stage_records_time_and_memory():
+    metrics = {}
+    with track_stage("demo", metrics):
+        np.ones(1_000_000)
+    assert metrics["stage_demo_seconds"] > 0
+    assert metrics["stage_demo_peak_mb"] >= 7
+
+def test_successive_halving_keeps_best_configs(tmp_path):
+    tuning = pytest.importorskip("src.models.tuning")
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(600, 5))
+    y = (X[:, 0] + 0.5 * rng.normal(size=600) > 1).astype(int)
+    paths = {}
+    for name, array in {"X_fit": X[:400], "y_fit": y[:400], "X_valid": X[400:], "y_valid": y[400:]}.items():
+        paths[name] = str(tmp_path / f"{name}.npy")
+        np.save(paths[name], array)
+
+    configs = tuning.sample_configs(9, seed=0)
+    assert configs == tuning.sample_configs(9, seed=0)
+    rungs = tuning.successive_halving(configs, paths, min_estimators=5, max_estimators=45, eta=3, n_workers=2)
+
+    assert [len(r) for r in rungs] == [9, 3, 1]
+    assert [r[0]["n_estimators"] for r in rungs] == [5, 15, 45]
+    assert rungs[1][0]["params"] in [r["params"] for r in rungs[0][:3]]
+    assert all(r["aucpr"] >= s["aucpr"] for r, s in zip(rungs[0], rungs[0][1:]))
+
+def test_stratified_sample_keeps_all_fraud():
+    y = np.zeros(1000, dtype=int)
+    y[::50] = 1
+    idx = stratified_sample(y, 100, random_state=0)
+    assert len(idx) == 100 and len(np.unique(idx)) == 100
+    assert set(np.flatnonzero(y)) <= set(idx)
+    assert len(stratified_sample(y, 5)) == 20  # Fraud cases are kept beyond the target size
+
+def test_bundle_roundtrip(tmp_path):
+    joblib = pytest.importorskip("joblib")
+    xgb = pytest.importorskip("xgboost")
+    from src.features.fast_path import FastFeaturePath
+    from src.models.bundle import export_bundle, latest_bundle, load_bundle
+
+    model = xgb.XGBClassifier()
+    model.load_model("mlruns/1/models/m-3566bd0f2e994ddaae9c1d9bf7f73c26/artifacts/model.ubj")
+    fast_path = FastFeaturePath(joblib.load("models/feature_engineer.joblib"), model.get_booster().feature_names)
+    export_bundle(model, fast_path, str(tmp_path), version="v1")
+    export_bundle(model, fast_path, str(tmp_path), version="v2", metadata={"run_id": "abc"})
+    assert latest_bundle(str(tmp_path)).endswith("v2")
+
+    bundle = load_bundle(latest_bundle(str(tmp_path)))
+    assert bundle.version == "v2" and bundle.manifest["metadata"] == {"run_id": "abc"}
+    assert set(bundle.timings) == {"manifest", "model", "compiled", "preprocessor"}
+    assert bundle.fast_path.to_params() == fast_path.to_params()
+    assert bundle.fast_path.get_country(732758368) == fast_path.get_country(732758368)
+
+    tx = {
+        "signup_time": "2015-02-24 22:55:49", "purchase_time": "2015-04-18 02:47:11",
+        "purchase_value": 34.0, "source": "SEO", "browser": "Chrome", "sex": "M", "age": 39,
+        "ip_address": 732758368
+    }
+    expected = model.predict_proba(fast_path.transform_one(tx, 2))
+    assert np.array_equal(bundle.model.predict_proba(bundle.fast_path.transform_one(tx, 2)), expected)
+
+    with open(tmp_path / "v2" / "preprocessor.json", "a") as f:
+        f.write(" ")
+    with pytest.raises(ValueError, match="Checksum"):
+        load_bundle(str(tmp_path / "v2"))
+
+def test_model_manager_rejects_disagreeing_bundle(tmp_path):
+    joblib = pytest.importorskip("joblib")
+    xgb = pytest.importorskip("xgboost")
+    pd = pytest.importorskip("pandas")
+    from src.features.fast_path import FastFeaturePath
+    from src.models.bundle import export_bundle
+    from src.models.serving import ModelManager
+
+    model = xgb.XGBClassifier()
+    model.load_model("mlruns/1/models/m-3566bd0f2e994ddaae9c1d9bf7f73c26/artifacts/model.ubj")
+    fast_path = FastFeaturePath(joblib.load("models/feature_engineer.joblib"), model.get_booster().feature_names)
+    canary = [{
+        "signup_time": "2015-02-24 22:55:49", "purchase_time": f"2015-04-18 0{h}:47:11",
+        "purchase_value": 34.0, "source": "SEO", "browser": "Chrome", "sex": "M", "age": 39,
+        "ip_address": 732758368, "velocity": 1
+    } for h in range(5)]
+    export_bundle(model, fast_path, str(tmp_path), version="v1", canary=canary)
+
+    # A model that scores everything as fraud
+    always_fraud = xgb.XGBClassifier(n_estimators=2)
+    always_fraud.fit(pd.DataFrame(np.zeros((20, fast_path.n_features)), columns=fast_path.feature_names),
+                     np.r_[np.ones(19), 0])
+    export_bundle(always_fraud, fast_path, str(tmp_path), version="v2", canary=canary)
+
+    models = ModelManager(str(tmp_path), poll_interval=0, max_flip_rate=0.2)
+    assert models.check_for_update().version == "v2"  # Nothing to compare against yet
+    models.pin("v1")
+    models.unpin()
+    assert models.check_for_update() is None
+    assert "flips" in models.rejected["v2"] and models.current.version == "v1"
+    assert models.pin("v2").version == "v2"  # Explicit pins skip the agreement check
+    assert models.rollback().version == "v1"
+    # A watcher upgrade that passed the pin check before an admin pinned must not replace the pin
+    assert models.activate("v2", automatic=True) is None and models.current.version == "v1"
+
+    bounded = ModelManager(str(tmp_path), poll_interval=0, max_history=2)
+    for version in ["v1", "v2", "v1"]:
+        bounded.pin(version)
+    assert list(bounded.history) == ["v2", "v1"]
+
+def test_compiled_ensemble_matches_xgboost(tmp_path):
+    joblib = pytest.importorskip("joblib")
+    xgb = pytest.importorskip("xgboost")
+    pd = pytest.importorskip("pandas")
+    from benchmarks.datasets import make_transactions
+    from src.features.fast_path import FastFeaturePath
+    from src.models.compiled import CompiledEnsemble
+
+    model = xgb.XGBClassifier()
+    model.load_model("mlruns/1/models/m-3566bd0f2e994ddaae9c1d9bf7f73c26/artifacts/model.ubj")
+    fe = joblib.load("models/feature_engineer.joblib")
+    fast_path = FastFeaturePath(fe, model.get_booster().feature_names)
+    df = make_transactions(2000, fe.ip_index, seed=3)
+    X = fast_path.transform_batch(df, np.random.default_rng(3).integers(1, 6, len(df)))
+    compiled = CompiledEnsemble.from_booster(model.get_booster())
+    np.testing.assert_allclose(compiled.predict_proba(X), model.predict_proba(X)[:, 1], atol=1e-6)
+    assert np.isclose(compiled.predict_proba(X[0]), model.predict_proba(X[:1])[0, 1], atol=1e-6)
+
+    # Missing values, unequal tree depths and early stopping
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(3000, 8))
+    labels = (data[:, 0] + data[:, 1] ** 2 + rng.normal(size=3000) > 1.5).astype(int)
+    data[rng.random(data.shape) < 0.2] = np.nan
+    early = xgb.XGBClassifier(n_estimators=300, max_depth=5, early_stopping_rounds=5, learning_rate=0.3)
+    early.fit(data[:2000], labels[:2000], eval_set=[(data[2000:], labels[2000:])], verbose=False)
+    compiled = CompiledEnsemble.from_booster(early.get_booster())
+    assert compiled.n_trees == early.best_iteration + 1
+    compiled.save(str(tmp_path / "trees.npz"))
+    loaded = CompiledEnsemble.load(str(tmp_path / "trees.npz"))
+    np.testing.assert_allclose(loaded.predict_proba(data[2000:]), early.predict_proba(data[2000:])[:, 1], atol=1e-6)
+
+def test_micro_batcher_coalesces_and_propagates_errors():
+    import threading
+    from src.models.batching import MicroBatcher, QueueFullError
+
+    sizes = []
+    def process(items):
+        sizes.append(len(items))
+        if "boom" in items:
+            raise ValueError("bad batch")
+        return [KeyError(item) if item == "bad" else item * 2 for item in items]
+
+    batcher = MicroBatcher(process, max_batch_size=8, max_wait=0.05)
+    with pytest.raises(QueueFullError):
+        batcher.submit(1)  # Not started
+    batcher.start()
+    release = threading.Event()
+    futures = []
+    def submit(i):
+        release.wait()
+        futures.append((i, batcher.submit(i)))
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert all(future.result(timeout=5) == i * 2 for i, future in futures)
+    assert max(sizes) <= 8 and len(sizes) < 20  # Coalesced, within the size limit
+
+    with pytest.raises(ValueError, match="bad batch"):
+        batcher.submit("boom").result(timeout=5)
+    bad, good = batcher.submit("bad"), batcher.submit(3)  # A per-item exception fails only that item
+    with pytest.raises(KeyError):
+        bad.result(timeout=5)
+    assert good.result(timeout=5) == 6
+    batcher.stop()
+    assert batcher.stats()["items"] == 23 and batcher.stats()["failed_items"] == 1
+
+def test_micro_batcher_survives_cancelled_waiters():
+    from src.models.batching import MicroBatcher
+
+    batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_batch_size=8, max_wait=0.05)
+    batcher.start()
+    assert batcher.submit(1).cancel()  # Client disconnected while queued
+    assert batcher.submit(2).result(timeout=5) == 4
+    assert batcher.running and batcher.submit(3).result(timeout=5) == 6
+    batcher.stop()
+    assert batcher.stats()["cancelled"] == 1
+
+def test_streaming_credit_card_training(tmp_path):
+    import pandas as pd
+    from src.models.train_credit_card import (
+        PCA_COLUMNS, StreamingStratifiedSplit, chunk_features, count_classes, fit_streaming, read_chunks
+    )
+
+    rng = np.random.default_rng(0)
+    n = 5000
+    y = (rng.random(n) < 0.02).astype(int)
+    df = pd.DataFrame(rng.normal(size=(n, 28)), columns=PCA_COLUMNS)
+    df["V14"] -= 5 * y  # Separable signal, as in the real data
+    df.insert(0, "Time", np.sort(rng.uniform(0, 172800, n)))
+    df["Amount"] = rng.exponential(80, n)
+    df["Class"] = y
+    path = tmp_path / "creditcard.csv"
+    df.to_csv(path, index=False)
+
+    counts = count_classes(str(path), chunk_rows=700)
+    assert counts == {0: int(n - y.sum()), 1: int(y.sum())}
+    split = StreamingStratifiedSplit(counts, test_size=0.2, seed=1)
+    def assignment():
+        split.reset()
+        return np.concatenate([split.assign(chunk_features(c)[1]) for c in read_chunks(str(path), 700)])
+    first = assignment()
+    assert np.array_equal(first, assignment())  # Re-iteration replays the split
+    for label in (0, 1):
+        assert first[y == label].sum() == split.test_counts[label]  # Exact per class
+
+    booster, summary = fit_streaming(str(path), num_boost_round=20, chunk_rows=700, seed=1,
+                                     cache_dir=str(tmp_path / "cache"))
+    assert summary["train_rows"] + summary["test_rows"] == n
+    assert summary["params"]["scale_pos_weight"] > 10  # Imbalance weighting instead of SMOTE
+    assert summary["pr_auc"] > 0.8
+    assert booster.feature_names[-1] == "hour_of_day"
+
+def test_shadow_scorer_sheds_load_instead_of_blocking(tmp_path):
+    import threading
+    joblib = pytest.importorskip("joblib")
+    xgb = pytest.importorskip("xgboost")
+    from src.features.fast_path import FastFeaturePath
+    from src.models.bundle import export_bundle, load_bundle
+    from src.models.shadow import ShadowScorer
+
+    model = xgb.XGBClassifier()
+    model.load_model("mlruns/1/models/m-3566bd0f2e994ddaae9c1d9bf7f73c26/artifacts/model.ubj")
+    fast_path = FastFeaturePath(joblib.load("models/feature_engineer.joblib"), model.get_booster().feature_names)
+    challenger = load_bundle(export_bundle(model, fast_path, str(tmp_path), version="c1"))
+
+    logged, busy, release = [], threading.Event(), threading.Event()
+    shadow = ShadowScorer(logged.extend, max_queue=1)
+    score = shadow.score
+    def stalled(bundle, records):
+        busy.set()
+        release.wait(5)
+        return score(bundle, records)
+    shadow.score = stalled
+    shadow.set_challengers([challenger])
+    shadow.start()
+    records = [[{
+        "signup_time": "2015-02-24 22:55:49", "purchase_time": "2015-04-18 02:47:11", "purchase_value": 34.0 + i,
+        "source": "SEO", "browser": "Chrome", "sex": "M", "age": 39, "ip_address": 732758368,
+        "tx_count_last_24h": 1, "fraud_probability": 0.9,
+    }] for i in range(5)]
+    queued = [shadow.submit(records[0])]
+    busy.wait(5)
+    queued += [shadow.submit(batch) for batch in records[1:]]
+    release.set()
+    shadow.stop()
+
+    assert queued[:2] == [True, True] and not any(queued[2:])  # One in flight, one queued, the rest shed
+    assert len(logged) == 5 and shadow.stats()["shed"] == 3
+    shed = [record for record in logged if np.isnan(record["challenger_0_probability"])]
+    assert len(shed) == 3 and all(record["challenger_0_version"] == "c1" for record in logged)
+    assert shadow.stats()["agreement"]["c1"]["scored"] == 2
+
+
+def test_shadow_scorer_failure_still_logs_challenger_columns():
+    from types import SimpleNamespace
+    from src.models.shadow import ShadowScorer
+
+    logged = []
+    shadow = ShadowScorer(logged.extend)
+    def broken(challengers, records):
+        raise RuntimeError("boom")
+    shadow._process = broken
+    shadow.set_challengers([SimpleNamespace(version="c1")])
+    shadow.start()
+    shadow.submit([{"user_id": 1, "fraud_probability": 0.9}])
+    shadow.stop()
+    assert logged[0]["challenger_0_version"] == "c1" and np.isnan(logged[0]["challenger_0_probability"])
+    assert shadow.stats()["errors"] == 1
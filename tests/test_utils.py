@@ -0,0 +1,212 @@
+import os
+import time
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from src.utils.inference_log import InferenceLogWriter, list_segments, read_inference_logs
+from src.utils.drift_stream import DriftReference, StreamingDriftMonitor
+
+def make_record(i: int) -> dict:
+    return {"user_id": i, "purchase_time": datetime(2015, 4, 18, 1, 0, i % 60), "fraud_probability": 0.1}
+
+@pytest.mark.parametrize("fmt", ["parquet", "csv"])
+def test_log_writer_rotates_and_flushes_on_close(tmp_path, fmt):
+    writer = InferenceLogWriter(str(tmp_path), fmt=fmt, batch_size=10, flush_interval=60, segment_max_rows=20)
+    writer.start()
+    assert writer.log_many(make_record(i) for i in range(60)) == 60
+    writer.close()
+
+    segments = list_segments(str(tmp_path))
+    assert len(segments) == 3
+    assert not [p for p in os.listdir(tmp_path) if p.endswith(".inprogress")]
+    logs = read_inference_logs(str(tmp_path))
+    assert list(logs['user_id']) == list(range(60))
+    assert writer.stats()["written"] == 60
+
+@pytest.mark.parametrize("fmt", ["parquet", "csv"])
+def test_log_writer_keeps_columns_missing_from_the_first_record(tmp_path, fmt):
+    writer = InferenceLogWriter(str(tmp_path), fmt=fmt, flush_interval=60)
+    writer.log_many([{"a": 1}, {"a": 2, "b": 3.0}])  # Not started: flushed as one batch on close
+    writer.close()
+    logs = read_inference_logs(str(tmp_path))
+    assert list(logs.columns) == ["a", "b"] and logs["b"].tolist()[1] == 3.0 and pd.isna(logs["b"].tolist()[0])
+
+def test_log_writer_publishes_old_segments_while_running(tmp_path):
+    writer = InferenceLogWriter(str(tmp_path), batch_size=100, flush_interval=0.02, segment_max_age=0.1)
+    writer.start()
+    writer.log_many(make_record(i) for i in range(5))
+    for _ in range(100):
+        if list_segments(str(tmp_path)):
+            break
+        time.sleep(0.02)
+    assert len(read_inference_logs(str(tmp_path))) == 5  # Published without reaching segment_max_rows
+    writer.close()
+
+def test_log_writer_recovers_orphaned_segments(tmp_path):
+    pid = os.getpid()  # Stands in for a crashed process; the writer never leaves its own pid's segments open
+    csv_orphan = tmp_path / f"inference-20260101T000000-{pid}-00001.csv.inprogress"
+    csv_orphan.write_text("user_id,fraud_probability\n1,0.1\n2,0.2\n3,0.")
+    parquet_orphan = tmp_path / f"inference-20260101T000000-{pid}-00002.parquet.inprogress"
+    parquet_orphan.write_bytes(b"PAR1 no footer")
+
+    writer = InferenceLogWriter(str(tmp_path))
+    writer.start()
+    writer.close()
+    assert list(read_inference_logs(str(tmp_path))['user_id']) == [1, 2]
+    assert os.path.exists(str(parquet_orphan).replace(".inprogress", ".corrupt"))
+    assert not [p for p in os.listdir(tmp_path) if p.endswith(".inprogress")]
+    assert writer.stats()["recovered_segments"] == 1 and writer.stats()["quarantined_segments"] == 1
+
+def test_log_writer_drops_when_full(tmp_path):
+    writer = InferenceLogWriter(str(tmp_path), max_queue=5)  # Not started, so nothing drains
+    assert sum(writer.log(make_record(i)) for i in range(8)) == 5
+    assert writer.stats()["dropped"] == 3
+    writer.close()
+    assert len(read_inference_logs(str(tmp_path))) == 5
+
+def make_drift_frame(rng, n: int, shift: float = 0.0):
+    return pd.DataFrame({
+        'purchase_value': rng.normal(40 + shift, 10, n),
+        'source': rng.choice(['SEO', 'Ads', 'Direct'], n),
+        'browser': rng.choice(['Chrome', 'IE'], n),
+        'sex': rng.choice(['M', 'F'], n),
+        'age': rng.integers(18, 70, n),
+        'ip_address': rng.uniform(0, 4e9, n),
+    })
+
+def test_streaming_drift_reads_only_new_segments(tmp_path):
+    rng = np.random.default_rng(0)
+    reference = DriftReference.from_frame(make_drift_frame(rng, 5000))
+
+    def write_segment(name, df):
+        df.to_parquet(tmp_path / f"inference-{name}.parquet")
+
+    write_segment("0001", make_drift_frame(rng, 1000))
+    monitor = StreamingDriftMonitor(reference, str(tmp_path), window_segments=1)
+    assert monitor.update() == 1000
+    assert monitor.update() == 0
+    assert not monitor.scores()['purchase_value']['drifted']
+
+    shifted = make_drift_frame(rng, 1000, shift=30)
+    shifted['source'] = 'Unseen'
+    write_segment("0002", shifted)
+    state_path = str(tmp_path / "state.json")
+    monitor.update()
+    monitor.save_state(state_path)
+
+    restored = StreamingDriftMonitor(reference, str(tmp_path), window_segments=1)
+    restored.load_state(state_path)
+    assert restored.update() == 0
+    scores = restored.scores()
+    assert scores['purchase_value']['drifted'] and scores['source']['drifted']
+    assert scores['purchase_value']['ks'] > 0.5 and scores['source']['ks'] is None
+    assert not scores['sex']['drifted']
+    assert scores['age']['n_current'] == 1000  # Window holds only the newest segment
+
+    os.remove(tmp_path / "inference-0001.parquet")  # Retention deletes old segments
+    assert restored.update() == 0 and restored.seen_segments == {"inference-0002.parquet"}
+
+def test_benchmark_data_is_reproducible_and_baseline_flags_regressions():
+    from benchmarks.datasets import make_transactions
+    from benchmarks.suite import compare, result
+
+    df = make_transactions(2_000, seed=1)
+    assert df.equals(make_transactions(2_000, seed=1))
+    assert (df['signup_time'] < df['purchase_time']).all()
+    assert df['user_id'].nunique() < len(df)  # Repeat users give non-trivial velocities
+
+    baseline = {"results": [result("transform", "1k", "rows_per_s", 1000, True),
+                            result("predict", "1k", "p50_us", 100, False),
+                            result("store", "1k", "total_bytes", 0, False)]}
+    current = {"results": [result("transform", "1k", "rows_per_s", 950, True),
+                           result("predict", "1k", "p50_us", 150, False),
+                           result("store", "1k", "total_bytes", 10, False)]}
+    comparison = compare(current, baseline, threshold=0.1).set_index("name")
+    assert list(comparison.index) == ["transform", "predict"]
+    assert not comparison.loc["transform", "regressed"]
+    assert comparison.loc["predict", "regressed"]
+
+def test_metrics_histogram_renders_cumulative_buckets():
+    from src.utils.metrics import MetricsRegistry
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency.", ["stage"], buckets=[0.1, 1.0])
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, "a")
+    latency.observe_many(np.array([0.05, 2.0]), "a")
+    registry.counter("requests_total", "Requests.", ["status"]).inc("200", amount=2)
+
+    text = registry.render()
+    assert 'latency_seconds_bucket{stage="a",le="0.1"} 3' in text
+    assert 'latency_seconds_bucket{stage="a",le="1"} 4' in text
+    assert 'latency_seconds_bucket{stage="a",le="+Inf"} 6' in text
+    assert 'latency_seconds_count{stage="a"} 6' in text
+    assert 'requests_total{status="200"} 2' in text
+    assert text.endswith("\n")
+
+def test_result_cache_ttl_capacity_and_in_flight_retries():
+    from src.utils.idempotency import IdempotencyConflict, ResultCache, payload_fingerprint
+
+    now = [0.0]
+    cache = ResultCache(max_entries=2, ttl=10, clock=lambda: now[0])
+    fp = payload_fingerprint({"b": 1, "a": [1, 2]})
+    assert fp == payload_fingerprint({"a": [1, 2], "b": 1})
+
+    future, owner = cache.reserve("k1", fp)
+    waiting, waiter_owns = cache.reserve("k1", fp)  # Retry while the original is in flight
+    assert owner and not waiter_owns and waiting is future
+    cache.complete("k1", future, {"score": 0.1})
+    assert waiting.result() == {"score": 0.1}
+    assert cache.reserve("k1", fp) == (future, False)  # Later retry: replayed
+    with pytest.raises(IdempotencyConflict):
+        cache.reserve("k1", payload_fingerprint({"other": 1}))
+
+    # Failures are forgotten, so the next retry computes again
+    failed, _ = cache.reserve("k2", fp)
+    cache.fail("k2", failed, RuntimeError("model down"))
+    assert cache.reserve("k2", fp)[1]
+
+    cache.reserve("k3", fp)  # Over capacity: the oldest entry goes
+    assert "k1" not in cache._entries and cache.stats()["evicted"] == 1
+    now[0] = 11.0
+    cache.complete("k2", cache._entries["k2"][1], 1)
+    assert cache.reserve("k2", fp)[1]  # Expired, computed again
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 5, "waits": 1, "expired": 1, "evicted": 1}
+
+def test_result_cache_recovers_from_cancelled_futures():
+    from src.utils.idempotency import ResultCache
+
+    cache = ResultCache()
+    future, _ = cache.reserve("k", "fp")
+    waiting, _ = cache.reserve("k", "fp")
+    assert waiting.cancel()  # A waiting retry cancelled the shared future
+    cache.complete("k", future, {"score": 0.1})  # The original still finishes
+    future, owner = cache.reserve("k", "fp")
+    assert owner and not future.done()
+    cache.fail("k", future, RuntimeError("down"))
+    cache.fail("k", future, RuntimeError("down"))  # Already resolved: ignored
+
+def test_redis_result_cache_is_shared_between_workers():
+    fakeredis = pytest.importorskip("fakeredis")
+    from src.utils.idempotency import IdempotencyConflict, RedisResultCache, payload_fingerprint
+
+    server = fakeredis.FakeServer()
+    worker_a, worker_b = (RedisResultCache(fakeredis.FakeRedis(server=server), wait_timeout=0.05) for _ in range(2))
+    fp = payload_fingerprint({"user_id": 1})
+
+    future, owner = worker_a.reserve("k1", fp)
+    assert owner
+    with pytest.raises(IdempotencyConflict, match="still in progress"):
+        worker_b.reserve("k1", fp)  # Original still being scored on the other worker
+    worker_a.complete("k1", future, {"score": 0.1})
+    replayed, owner = worker_b.reserve("k1", fp)
+    assert not owner and replayed.result() == {"score": 0.1}
+    with pytest.raises(IdempotencyConflict, match="different payload"):
+        worker_b.reserve("k1", payload_fingerprint({"user_id": 2}))
+
+    # Failures release the key for whichever worker gets the retry
+    failed, _ = worker_a.reserve("k2", fp)
+    worker_a.fail("k2", failed, RuntimeError("model down"))
+    assert worker_b.reserve("k2", fp)[1]
+    assert worker_b.stats() == {"hits": 1, "misses": 1, "waits": 0}
+